@@ -0,0 +1,196 @@
+"""
+ベンチマーク用の合成コーパスの生成
+
+同じ設定 (spec) とシードからは常に同じ内容のファイルができるので、別の環境・別の日の
+計測結果を比べられる。生成済みのフォルダに同じ spec の corpus.json があれば作り直さない。
+
+spec の例は SCALES を参照。
+    pdfs    ページ数・用紙サイズ・1ページあたりの画像数を指定したPDF
+    csv     行数・列数を指定したCSV
+    logs    行数・1行の長さを指定したテキストログ
+    images  枚数・大きさ・形式を指定した画像
+"""
+import os
+import io
+import csv
+import json
+import random
+import hashlib
+
+import fitz  # PyMuPDF
+from PIL import Image
+
+CORPUS_VERSION = 1
+
+PAGE_SIZES = {
+    'A4': (595, 842),
+    'A3': (842, 1191),
+    'Letter': (612, 792),
+    'A4-landscape': (842, 595),
+}
+
+SCALES = {
+    'small': {
+        'seed': 1,
+        'pdfs': [
+            {'name': 'text', 'count': 5, 'pages': 20, 'page_size': 'A4'},
+            {'name': 'scan', 'count': 2, 'pages': 5, 'page_size': 'A4', 'images_per_page': 1, 'image_px': 400},
+            {'name': 'mixed', 'count': 1, 'pages': 200, 'page_size': 'A4-landscape'},
+        ],
+        'csv': [{'name': 'table', 'rows': 2000, 'cols': 8}],
+        'logs': [{'name': 'app', 'lines': 5000, 'line_chars': 120}],
+        'images': {'count': 5, 'px': 800, 'format': 'jpg'},
+    },
+    'medium': {
+        'seed': 1,
+        'pdfs': [
+            {'name': 'text', 'count': 20, 'pages': 50, 'page_size': 'A4'},
+            {'name': 'scan', 'count': 5, 'pages': 20, 'page_size': 'A4', 'images_per_page': 1, 'image_px': 800},
+            {'name': 'mixed', 'count': 1, 'pages': 2000, 'page_size': 'A4-landscape'},
+        ],
+        'csv': [{'name': 'table', 'rows': 20000, 'cols': 10}],
+        'logs': [{'name': 'app', 'lines': 100000, 'line_chars': 140}],
+        'images': {'count': 20, 'px': 1600, 'format': 'jpg'},
+    },
+    'large': {
+        'seed': 1,
+        'pdfs': [
+            {'name': 'text', 'count': 50, 'pages': 500, 'page_size': 'A4'},
+            {'name': 'scan', 'count': 10, 'pages': 50, 'page_size': 'A3', 'images_per_page': 2, 'image_px': 1200},
+            {'name': 'mixed', 'count': 2, 'pages': 5000, 'page_size': 'Letter'},
+        ],
+        'csv': [{'name': 'table', 'rows': 200000, 'cols': 12}],
+        'logs': [{'name': 'app', 'lines': 1000000, 'line_chars': 160}],
+        'images': {'count': 50, 'px': 3000, 'format': 'jpg'},
+    },
+}
+
+WORDS = ("lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor "
+         "incididunt ut labore et dolore magna aliqua").split()
+# CSV / ログには日本語も混ぜる (日本語フォントでの描画を計測に含める)
+MIXED_WORDS = WORDS + "請求書 見積書 会議 議事録 報告 資料".split()
+
+
+def spec_hash(spec):
+    data = json.dumps({'version': CORPUS_VERSION, 'spec': spec}, sort_keys=True).encode('utf-8')
+    return hashlib.blake2b(data, digest_size=8).hexdigest()
+
+
+def _sentence(rng, count, words=WORDS):
+    return " ".join(rng.choice(words) for _ in range(count))
+
+
+def _noise_image(rng, px, mode="RGB"):
+    # 乱数の画素は圧縮が効かないので、写真やスキャン画像に近いサイズになる
+    channels = 3 if mode == "RGB" else 1
+    return Image.frombytes(mode, (px, px), rng.randbytes(px * px * channels))
+
+
+def _png_bytes(image):
+    buf = io.BytesIO()
+    image.save(buf, "PNG", compress_level=1)
+    return buf.getvalue()
+
+
+def make_pdf(path, rng, pages, page_size='A4', images_per_page=0, image_px=400):
+    width, height = PAGE_SIZES[page_size]
+    doc = fitz.open()
+    try:
+        for i in range(pages):
+            page = doc.new_page(width=width, height=height)
+            page.insert_text((40, 50), f"{os.path.basename(path)} - page {i + 1}", fontsize=14)
+            box = fitz.Rect(40, 70, width - 40, height - 40)
+            page.insert_textbox(box, _sentence(rng, 300), fontsize=9)
+            for n in range(images_per_page):
+                size = min(width, height) / 3
+                x = 40 + n * (size + 10)
+                page.insert_image(fitz.Rect(x, height - size - 40, x + size, height - 40),
+                                  stream=_png_bytes(_noise_image(rng, image_px)))
+        doc.save(path, garbage=1, deflate=True)
+    finally:
+        doc.close()
+
+
+def make_csv(path, rng, rows, cols):
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow([f"列{c + 1}" for c in range(cols)])
+        for r in range(rows):
+            row = [r]
+            for c in range(1, cols):
+                row.append(round(rng.random() * 10000, 2) if c % 3 == 1 else _sentence(rng, 1 + c % 4, MIXED_WORDS))
+            writer.writerow(row)
+
+
+def make_log(path, rng, lines, line_chars):
+    levels = ['INFO', 'INFO', 'INFO', 'DEBUG', 'WARN', 'ERROR']
+    with open(path, 'w', encoding='utf-8', newline='\n') as f:
+        for i in range(lines):
+            head = f"2026-01-01 {i // 3600 % 24:02d}:{i // 60 % 60:02d}:{i % 60:02d}.{i % 1000:03d} {rng.choice(levels):5} "
+            body = _sentence(rng, 8, MIXED_WORDS)
+            # たまに用紙幅を超える長い行を混ぜる (折り返しの計測用)
+            length = line_chars * 4 if i % 50 == 0 else line_chars
+            f.write((head + body * (length // max(1, len(body)) + 1))[:length] + "\n")
+
+
+def make_image(path, rng, px, fmt):
+    image = _noise_image(rng, px)
+    if fmt in ('jpg', 'jpeg'): image.save(path, "JPEG", quality=85)
+    else: image.save(path, fmt.upper())
+
+
+def generate_corpus(spec, out_dir):
+    """
+    spec に従ってコーパスを out_dir に作り、種類ごとのファイル一覧 (dict) を返す。
+    同じ spec で生成済みならそのまま使う。
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    index_path = os.path.join(out_dir, "corpus.json")
+    digest = spec_hash(spec)
+    if os.path.exists(index_path):
+        with open(index_path, 'r', encoding='utf-8') as f:
+            index = json.load(f)
+        files = [p for group in index['files'].values() for p in group]
+        if index.get('hash') == digest and all(os.path.exists(os.path.join(out_dir, p)) for p in files):
+            return _absolute(index['files'], out_dir)
+
+    # 種類ごとに乱数列を分けておくと、一部の設定を変えても他のファイルの内容は変わらない
+    seed = spec.get('seed', 0)
+    files = {'pdfs': [], 'csv': [], 'logs': [], 'images': []}
+
+    for group in spec.get('pdfs', []):
+        rng = random.Random(f"{seed}:pdf:{group['name']}")
+        for n in range(group.get('count', 1)):
+            name = f"{group['name']}_{n:03d}.pdf"
+            make_pdf(os.path.join(out_dir, name), rng, group['pages'], group.get('page_size', 'A4'),
+                     group.get('images_per_page', 0), group.get('image_px', 400))
+            files['pdfs'].append(name)
+
+    for table in spec.get('csv', []):
+        rng = random.Random(f"{seed}:csv:{table['name']}")
+        name = f"{table['name']}.csv"
+        make_csv(os.path.join(out_dir, name), rng, table['rows'], table['cols'])
+        files['csv'].append(name)
+
+    for log in spec.get('logs', []):
+        rng = random.Random(f"{seed}:log:{log['name']}")
+        name = f"{log['name']}.log"
+        make_log(os.path.join(out_dir, name), rng, log['lines'], log.get('line_chars', 120))
+        files['logs'].append(name)
+
+    images = spec.get('images')
+    if images:
+        rng = random.Random(f"{seed}:images")
+        fmt = images.get('format', 'jpg')
+        for n in range(images['count']):
+            name = f"image_{n:03d}.{fmt}"
+            make_image(os.path.join(out_dir, name), rng, images.get('px', 800), fmt)
+            files['images'].append(name)
+
+    with open(index_path, 'w', encoding='utf-8') as f:
+        json.dump({'hash': digest, 'spec': spec, 'files': files}, f, ensure_ascii=False, indent=2)
+    return _absolute(files, out_dir)
+
+
+def _absolute(files, out_dir):
+    return {kind: [os.path.join(out_dir, p) for p in paths] for kind, paths in files.items()}
@@ -0,0 +1,286 @@
+"""
+ベンチマークの実行
+
+合成コーパス (bench/corpus.py) に対して pdf_ops の主な処理を計測し、結果をJSONで書き出す。
+基準の結果 (baseline) を渡すと、しきい値を超えて遅くなったシナリオを回帰として報告し、
+終了コード 1 を返す。
+
+使い方:
+    python -m bench.run --scale small --out results.json
+    python -m bench.run --scale small --baseline baseline.json --threshold 0.25
+    python -m bench.run --only merge_fitz,pdf_info --repeat 5
+
+startup_imports は main.py を別プロセスで読み込む時間 (変換器のライブラリは使うまで読み込まない)。
+各シナリオは毎回キャッシュを空にした状態 (変換キャッシュは空の作業フォルダ、
+get_pdf_info のメモ・ドキュメントプールもクリア) で計測する。
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import statistics
+import tempfile
+import subprocess
+
+if __package__ in (None, ""):
+    # python bench/run.py でも実行できるようにする
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench.corpus import SCALES, generate_corpus, spec_hash
+from utils import pdf_ops
+from utils.conversion_cache import ConversionCache
+from utils.doc_pool import shared_pool
+from utils.preview_engine import PreviewEngine
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# シナリオの計り方を変えたら上げる (違う版の基準の結果とは比較しない)
+# 2: thumbnails / preview を枠に合わせて直接描画する経路で計る
+RESULTS_VERSION = 2
+THUMBNAIL_PAGES = 20   # 1ファイルあたりに描画するサムネイル数
+THUMBNAIL_BOX = (140, 180)
+PREVIEW_PAGES = 20
+
+
+class Scenario:
+    """setup (計測外) → body (計測) → teardown (計測外)。body は結果の補足情報を dict で返す"""
+
+    def __init__(self, name, body, setup=None, teardown=None):
+        self.name = name
+        self.body = body
+        self.setup = setup
+        self.teardown = teardown
+
+
+def _reset_caches(workdir):
+    conversion_dir = os.path.join(workdir, "converted")
+    shutil.rmtree(conversion_dir, ignore_errors=True)
+    os.makedirs(conversion_dir)
+    pdf_ops.set_conversion_cache(ConversionCache(workspace_dir=conversion_dir))
+    pdf_ops.clear_info_cache()
+    shared_pool.close_all()
+
+
+def _all_pages(pdfs):
+    pages = []
+    for path in pdfs:
+        info = pdf_ops.get_pdf_info(path)
+        pages.extend({'path': path, 'page_index': i, 'rotation': 0} for i in range(info['pages']))
+    return pages
+
+
+def build_scenarios(corpus, workdir):
+    state = {}
+    merged_path = os.path.join(workdir, "merged.pdf")
+
+    def convert_all(kind):
+        def body():
+            for path in corpus[kind]:
+                if not pdf_ops.convert_to_pdf(path):
+                    raise RuntimeError(f"変換に失敗しました: {path}")
+            return {'files': len(corpus[kind]), 'bytes': sum(os.path.getsize(p) for p in corpus[kind])}
+        return body
+
+    def pdf_info():
+        pages = 0
+        for path in corpus['pdfs']:
+            pages += pdf_ops.get_pdf_info(path)['pages']
+        return {'files': len(corpus['pdfs']), 'pages': pages}
+
+    def prepare_pages():
+        state['pages'] = _all_pages(corpus['pdfs'])
+        pdf_ops.clear_info_cache()
+        shared_pool.close_all()
+
+    def merge(**kwargs):
+        def body():
+            report = {}
+            if not pdf_ops.merge_pdfs_securely(state['pages'], merged_path, report=report, **kwargs):
+                raise RuntimeError("結合に失敗しました")
+            return {'pages': len(state['pages']), 'output_bytes': os.path.getsize(merged_path),
+                    'mode': report.get('mode'), 'peak_rss': report.get('peak_rss')}
+        return body
+
+    def remove_merged():
+        if os.path.exists(merged_path): os.remove(merged_path)
+
+    def thumbnails():
+        count = 0
+        for path in corpus['pdfs']:
+            pages = pdf_ops.get_pdf_info(path)['pages']
+            for i in range(min(pages, THUMBNAIL_PAGES)):
+                if pdf_ops.get_page_thumbnail(path, i, 0, THUMBNAIL_BOX[0], THUMBNAIL_BOX[1]) is None:
+                    raise RuntimeError(f"サムネイルを描画できません: {path} p{i + 1}")
+                count += 1
+        return {'thumbnails': count}
+
+    def prepare_preview():
+        prepare_pages()
+        state['preview'] = PreviewEngine()
+        state['preview'].set_pages(state['pages'][:PREVIEW_PAGES])
+
+    def preview():
+        # GUI のプレビューと同じく、結合せずに元ファイルのページを表示枠の大きさで直接描画する
+        engine = state['preview']
+        count = 0
+        for i in range(engine.total_pages):
+            if engine.render(i) is None: break
+            count += 1
+        return {'previews': count}
+
+    def close_preview():
+        state.pop('preview').close()
+
+    def startup_imports():
+        # GUI を表示せずに計れる起動の部分 (main.py の読み込み) を別プロセスで計る。
+        # 最初のウィンドウまでの時間は python main.py --startup-profile で計る (utils/startup_profile.py)
+        code = ("import json, sys, main\n"
+                "from utils.startup_profile import HEAVY_MODULES\n"
+                "print(json.dumps([m for m in HEAVY_MODULES if m in sys.modules]))")
+        out = subprocess.run([sys.executable, '-c', code], cwd=REPO_DIR, check=True, capture_output=True, text=True)
+        return {'heavy_modules': ",".join(json.loads(out.stdout.strip().splitlines()[-1])) or None}
+
+    return [
+        Scenario('startup_imports', startup_imports),
+        Scenario('convert_csv', convert_all('csv')),
+        Scenario('convert_log', convert_all('logs')),
+        Scenario('convert_images', convert_all('images')),
+        Scenario('pdf_info', pdf_info),
+        Scenario('merge_fitz', merge(), setup=prepare_pages, teardown=remove_merged),
+        Scenario('merge_pypdf', merge(backend='pypdf'), setup=prepare_pages, teardown=remove_merged),
+        Scenario('merge_low_memory', merge(memory_budget_mb=128), setup=prepare_pages, teardown=remove_merged),
+        Scenario('thumbnails', thumbnails),
+        Scenario('preview', preview, setup=prepare_preview, teardown=close_preview),
+    ]
+
+
+def run_scenario(scenario, workdir, repeat):
+    runs = []
+    meta = {}
+    for _ in range(repeat):
+        _reset_caches(workdir)
+        if scenario.setup: scenario.setup()
+        t0 = time.perf_counter()
+        meta = scenario.body() or {}
+        runs.append(time.perf_counter() - t0)
+        if scenario.teardown: scenario.teardown()
+    return {
+        'runs': runs,
+        'median': statistics.median(runs),
+        'min': min(runs),
+        'mean': statistics.mean(runs),
+        'meta': meta,
+    }
+
+
+def run_benchmarks(spec, corpus_dir, repeat=3, only=None, on_result=None):
+    t0 = time.perf_counter()
+    corpus = generate_corpus(spec, corpus_dir)
+    corpus_seconds = time.perf_counter() - t0
+
+    results = {
+        'version': RESULTS_VERSION,
+        'created': time.strftime("%Y-%m-%dT%H:%M:%S"),
+        'platform': platform.platform(),
+        'python': platform.python_version(),
+        'corpus': {'hash': spec_hash(spec), 'spec': spec, 'generate_seconds': corpus_seconds},
+        'repeat': repeat,
+        'scenarios': {},
+    }
+    workdir = tempfile.mkdtemp(prefix="secure_pdf_bench_")
+    try:
+        for scenario in build_scenarios(corpus, workdir):
+            if only and scenario.name not in only: continue
+            try:
+                result = run_scenario(scenario, workdir, repeat)
+            except Exception as e:
+                result = {'error': str(e) or e.__class__.__name__}
+            results['scenarios'][scenario.name] = result
+            if on_result: on_result(scenario.name, result)
+    finally:
+        shared_pool.close_all()
+        pdf_ops.set_conversion_cache(None)
+        shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+def compare(results, baseline, threshold=0.25, min_delta=0.05):
+    """
+    baseline より median が (1 + threshold) 倍を超えて遅く、かつ min_delta 秒以上遅いシナリオを
+    回帰として返す。コーパスや結果の版 (RESULTS_VERSION) が違う場合は比較しない (ValueError)。
+    """
+    if results.get('version') != baseline.get('version'):
+        raise ValueError(f"基準の結果の版 ({baseline.get('version')}) が現在の版 ({results.get('version')}) と"
+                         "異なるため比較できません。基準の結果を取り直してください")
+    if results['corpus']['hash'] != baseline['corpus']['hash']:
+        raise ValueError("基準の結果とコーパスの設定が異なるため比較できません")
+    rows = []
+    for name, current in results['scenarios'].items():
+        base = baseline['scenarios'].get(name)
+        if not base or 'median' not in base or 'median' not in current: continue
+        ratio = current['median'] / base['median'] if base['median'] > 0 else float('inf')
+        delta = current['median'] - base['median']
+        regressed = ratio > 1 + threshold and delta > min_delta
+        rows.append({'name': name, 'baseline': base['median'], 'current': current['median'],
+                     'ratio': ratio, 'regressed': regressed})
+    return rows
+
+
+def format_result(name, result):
+    if 'error' in result:
+        return f"{name:18} ERROR {result['error']}"
+    meta = " ".join(f"{k}={v}" for k, v in result['meta'].items() if v is not None)
+    return f"{name:18} median={result['median']:.3f}s min={result['min']:.3f}s  {meta}"
+
+
+def main(argv=None):
+    bench_dir = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description="Secure PDF Merger benchmarks")
+    parser.add_argument('--scale', choices=sorted(SCALES), default='small', help="コーパスの規模")
+    parser.add_argument('--spec', help="コーパスの設定 (JSON)。指定すると --scale より優先")
+    parser.add_argument('--corpus-dir', help="コーパスの生成先 (既定: bench/.corpus/<規模>)")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--only', help="実行するシナリオ (カンマ区切り)")
+    parser.add_argument('--out', help="結果をJSONで書き出す")
+    parser.add_argument('--baseline', help="比較する基準の結果 (JSON)")
+    parser.add_argument('--threshold', type=float, default=0.25, help="回帰とみなす遅くなり方の割合 (既定 0.25 = 25%%)")
+    parser.add_argument('--min-delta', type=float, default=0.05, help="回帰とみなす最小の差 (秒)")
+    args = parser.parse_args(argv)
+
+    if args.spec:
+        with open(args.spec, 'r', encoding='utf-8') as f: spec = json.load(f)
+        corpus_name = "custom-" + spec_hash(spec)
+    else:
+        spec = SCALES[args.scale]
+        corpus_name = args.scale
+    corpus_dir = args.corpus_dir or os.path.join(bench_dir, ".corpus", corpus_name)
+    only = set(args.only.split(',')) if args.only else None
+
+    results = run_benchmarks(spec, corpus_dir, args.repeat, only,
+                             on_result=lambda name, result: print(format_result(name, result)))
+
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+    failed = any('error' in r for r in results['scenarios'].values())
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f: baseline = json.load(f)
+        try:
+            rows = compare(results, baseline, args.threshold, args.min_delta)
+        except ValueError as e:
+            print(e)
+            return 2
+        print()
+        for row in rows:
+            mark = "REGRESSION" if row['regressed'] else "ok"
+            print(f"{row['name']:18} {row['baseline']:.3f}s -> {row['current']:.3f}s (x{row['ratio']:.2f}) {mark}")
+        if any(row['regressed'] for row in rows):
+            failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,320 @@
+"""
+ヘッドレス一括結合CLI
+
+GUI (customtkinter / Tk) を読み込まずに pdf_ops を直接呼び出し、
+JSON / YAML のジョブマニフェストに従って変換・結合を行う。
+複数のマニフェストを1回の起動でまとめて処理できる。
+
+使い方:
+    python cli.py job1.json job2.yaml [--report timings.json] [--trace trace.json]
+    python cli.py --converters
+
+マニフェスト例:
+    {
+        "output": "merged.pdf",
+        "optimize": {"dedupe": true, "compress": true, "object_streams": true},
+        "sources": [
+            {"path": "a.pdf", "pages": "1-3,5", "rotation": 90},
+            {"path": "b.docx", "landscape": true},
+            {"path": "c.pdf", "rotations": {"2": 180}},
+            {"path": "server.log", "text_window": "tail:2000"}
+        ]
+    }
+
+相対パスはマニフェストファイルのあるフォルダを基準に解決する。
+text_window はテキスト / ログの一部だけを変換する ("head:N" / "tail:N" / "bytes:START-END")。
+optimize は出力の最適化 (省略時は dedupe / compress が有効、false ですべて無効)。
+memory_budget_mb を指定すると、その予算に収まるよう区切りながら結合する (省メモリ結合)。
+--trace を指定すると、変換・解析・結合の各段階のスパンを書き出す
+(.jsonl なら JSON Lines、それ以外は Chrome のトレース形式。utils/tracing.py を参照)。
+--converters は変換器ごとの対応状況と、ライブラリの読み込み時間を表示する (utils/converters.py)。
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+from utils import pdf_ops
+from utils import tracing
+from utils import converters
+from utils.pdf_optimize import normalize_output_options
+
+try:
+    import yaml
+    HAS_YAML = True
+    _PARSE_ERRORS = (ValueError, yaml.YAMLError)  # ValueError は json.JSONDecodeError
+except ImportError:
+    HAS_YAML = False
+    _PARSE_ERRORS = (ValueError,)
+
+
+class ManifestError(Exception):
+    pass
+
+
+def load_manifest(manifest_path):
+    ext = os.path.splitext(manifest_path)[1].lower()
+    if ext in ['.yaml', '.yml'] and not HAS_YAML:
+        raise ManifestError("YAMLマニフェストには PyYAML が必要です")
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        try:
+            data = yaml.safe_load(f) if ext in ['.yaml', '.yml'] else json.load(f)
+        except UnicodeDecodeError as e:
+            raise ManifestError(f"マニフェストが UTF-8 ではありません: {e}")
+        except _PARSE_ERRORS as e:
+            raise ManifestError(f"マニフェストを解析できません: {e}")
+
+    if not isinstance(data, dict):
+        raise ManifestError("マニフェストの形式が不正です")
+    if not data.get('output'):
+        raise ManifestError("'output' が指定されていません")
+    if not isinstance(data['output'], str):
+        raise ManifestError("'output' は文字列で指定してください")
+    if not isinstance(data.get('sources'), list) or not data['sources']:
+        raise ManifestError("'sources' が空です")
+    try:
+        data['optimize'] = normalize_output_options(data.get('optimize'))
+    except (ValueError, TypeError) as e:
+        raise ManifestError(f"'optimize' が不正です: {e}")
+    budget = data.get('memory_budget_mb')
+    if budget is not None and (isinstance(budget, bool) or not isinstance(budget, (int, float)) or budget <= 0):
+        raise ManifestError("'memory_budget_mb' は正の数で指定してください")
+
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    data['output'] = os.path.join(base_dir, data['output'])
+    sources = []
+    for src in data['sources']:
+        if isinstance(src, str):
+            src = {'path': src}
+        if not isinstance(src, dict) or 'path' not in src:
+            raise ManifestError("'path' のないソースがあります")
+        if not isinstance(src['path'], str) or not src['path']:
+            raise ManifestError(f"'path' は文字列で指定してください: {src['path']!r}")
+        if not isinstance(src.get('landscape', False), bool):
+            # "false" などの文字列を真と解釈しないよう、true / false 以外は受け付けない
+            raise ManifestError(f"'landscape' は true / false で指定してください: {src['landscape']!r}")
+        sources.append(dict(src, path=os.path.join(base_dir, src['path']),
+                            rotation=normalize_rotation(src.get('rotation', 0)),
+                            rotations=normalize_rotations(src.get('rotations'))))
+    data['sources'] = sources
+    return data
+
+
+def parse_page_range(spec, total):
+    """'1-3,5,8-' 形式 (1始まり) を0始まりのページ番号リストに変換する"""
+    if spec is None or spec == "" or spec == "all":
+        return list(range(total))
+    if isinstance(spec, int):
+        spec = str(spec)
+
+    indexes = []
+    for part in str(spec).split(','):
+        part = part.strip()
+        if not part: continue
+        if '-' in part:
+            start, end = part.split('-', 1)
+            start = int(start) if start.strip() else 1
+            end = int(end) if end.strip() else total
+        else:
+            start = end = int(part)
+        if start < 1 or end > total or start > end:
+            raise ManifestError(f"ページ範囲が不正です: {part} (全{total}ページ)")
+        indexes.extend(range(start - 1, end))
+    return indexes
+
+
+def normalize_rotation(value):
+    try:
+        value = int(value or 0)
+    except (ValueError, TypeError):
+        raise ManifestError(f"回転角度は整数で指定してください: {value!r}")
+    if value % 90 != 0:
+        raise ManifestError(f"回転角度は90の倍数で指定してください: {value}")
+    return value % 360
+
+
+def normalize_rotations(value):
+    """{ページ番号(1始まり): 角度} を検証し、キーを int にして返す"""
+    if not value: return {}
+    if not isinstance(value, dict):
+        raise ManifestError(f"'rotations' は {{ページ番号: 角度}} で指定してください: {value!r}")
+    rotations = {}
+    for page, angle in value.items():
+        try:
+            page_number = int(page)
+        except (ValueError, TypeError):
+            raise ManifestError(f"'rotations' のページ番号が不正です: {page!r}")
+        rotations[page_number] = normalize_rotation(angle)
+    return rotations
+
+
+def build_page_list(source, timings):
+    """ソース1件分を変換・解析し、merge_pdfs_securely 用のページリストを返す"""
+    path = source['path']
+    if not os.path.exists(path):
+        raise ManifestError(f"ファイルが見つかりません: {path}")
+
+    is_landscape = source.get('landscape', False)
+    final_path = path
+    is_generated = False
+
+    if not path.lower().endswith('.pdf'):
+        t0 = time.perf_counter()
+        from utils.text_renderer import TextWindow  # 変換器と同じく、使うときに読み込む
+        try:
+            text_window = TextWindow.parse(source.get('text_window'))
+        except ValueError as e:
+            raise ManifestError(str(e))
+        converted = pdf_ops.convert_to_pdf(path, is_landscape=is_landscape, text_window=text_window)
+        timings['convert'] += time.perf_counter() - t0
+        if not converted or not os.path.exists(converted):
+            raise ManifestError(f"変換に失敗しました: {path}")
+        final_path = converted
+        is_generated = True
+
+    t0 = time.perf_counter()
+    info = pdf_ops.get_pdf_info(final_path)
+    timings['info'] += time.perf_counter() - t0
+    if not info:
+        raise ManifestError(f"PDFを読み込めません: {path}")
+
+    base_rotation = normalize_rotation(source.get('rotation', 0))
+    rotations = normalize_rotations(source.get('rotations'))
+    for page_number in rotations:
+        if not 1 <= page_number <= info['pages']:
+            raise ManifestError(f"'rotations' のページ番号が不正です: {page_number} (全{info['pages']}ページ)")
+
+    pages = []
+    for i in parse_page_range(source.get('pages'), info['pages']):
+        pages.append({
+            'path': final_path,
+            'original_source_path': path,
+            'is_generated': is_generated,
+            'filename': os.path.basename(path),
+            'page_index': i,
+            'rotation': (base_rotation + rotations.get(i + 1, 0)) % 360,
+            'is_landscape_generated': is_generated and is_landscape,
+        })
+    return pages
+
+
+def run_job(manifest_path):
+    result = {
+        'manifest': manifest_path,
+        'output': None,
+        'success': False,
+        'pages': 0,
+        'error': None,
+        'timings': {'load': 0.0, 'convert': 0.0, 'info': 0.0, 'merge': 0.0, 'total': 0.0},
+        'merge': {},
+    }
+    timings = result['timings']
+    job_start = time.perf_counter()
+    try:
+        t0 = time.perf_counter()
+        manifest = load_manifest(manifest_path)
+        timings['load'] = time.perf_counter() - t0
+        result['output'] = manifest['output']
+
+        page_list = []
+        for source in manifest['sources']:
+            page_list.extend(build_page_list(source, timings))
+        if not page_list:
+            raise ManifestError("結合するページがありません")
+        result['pages'] = len(page_list)
+
+        out_dir = os.path.dirname(manifest['output'])
+        if out_dir: os.makedirs(out_dir, exist_ok=True)
+
+        t0 = time.perf_counter()
+        ok = pdf_ops.merge_pdfs_securely(page_list, manifest['output'], options=manifest['optimize'],
+                                         memory_budget_mb=manifest.get('memory_budget_mb'),
+                                         report=result['merge'])
+        timings['merge'] = time.perf_counter() - t0
+        if not ok:
+            raise ManifestError("結合に失敗しました")
+        result['success'] = True
+    except (ManifestError, OSError, ValueError) as e:
+        result['error'] = str(e)
+    except Exception as e:
+        # 想定外の失敗もこのジョブだけの失敗とし、残りのマニフェストは続けて処理する
+        tracing.report_error('job', e, manifest=manifest_path)
+        result['error'] = f"{type(e).__name__}: {e}"
+    finally:
+        # このジョブの変換結果は使い終わったので、変換キャッシュの削除対象に戻す
+        pdf_ops.get_conversion_cache().release()
+    timings['total'] = time.perf_counter() - job_start
+    return result
+
+
+def format_result(result):
+    t = result['timings']
+    status = "OK  " if result['success'] else "FAIL"
+    line = (f"[{status}] {result['manifest']} -> {result['output']} "
+            f"({result['pages']} pages) "
+            f"total={t['total']:.3f}s convert={t['convert']:.3f}s "
+            f"info={t['info']:.3f}s merge={t['merge']:.3f}s")
+    peak_rss = result['merge'].get('peak_rss')
+    if peak_rss:
+        line += f" peak_rss={peak_rss / (1024 * 1024):.0f}MB"
+    if result['error']:
+        line += f"\n       {result['error']}"
+    return line
+
+
+def format_converter(status):
+    if status['error']:
+        state = f"ERROR {status['error']}"
+    elif not status['available']:
+        state = "unavailable"
+    else:
+        state = f"import={sum(status['import_seconds'].values()):.3f}s"
+        modules = " ".join(f"{m}={s:.3f}s" for m, s in status['import_seconds'].items())
+        if modules: state += f" ({modules})"
+        if status['unavailable_extensions']:
+            state += f" unavailable: {' '.join(status['unavailable_extensions'])}"
+    return f"{status['name']:6} {' '.join(status['extensions'])}\n       {state}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Secure PDF Merger (headless batch mode)")
+    parser.add_argument('manifests', nargs='*', help="ジョブマニフェスト (.json / .yaml)")
+    parser.add_argument('--report', help="ジョブごとの結果と処理時間をJSONで書き出す")
+    parser.add_argument('--trace', help="処理ごとのスパンを書き出す (.jsonl / Chrome トレース形式の .json)")
+    parser.add_argument('--converters', action='store_true',
+                        help="変換器の対応状況と読み込み時間を表示して終了する")
+    args = parser.parse_args(argv)
+
+    if args.converters:
+        for status in converters.status(load=True):
+            print(format_converter(status))
+        return 0
+    if not args.manifests:
+        parser.error("ジョブマニフェストを指定してください")
+
+    started = time.perf_counter()
+    results = []
+    if args.trace: tracing.enable()
+    for manifest_path in args.manifests:
+        with tracing.span('job', manifest=manifest_path) as span:
+            result = run_job(manifest_path)
+            span.set(pages=result['pages'], success=result['success'], error=result['error'])
+        results.append(result)
+        print(format_result(result))
+
+    elapsed = time.perf_counter() - started
+    failed = sum(1 for r in results if not r['success'])
+    print(f"{len(results)} jobs, {failed} failed, {elapsed:.3f}s")
+
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump({'elapsed': elapsed, 'jobs': results, 'converters': converters.status()}, f, ensure_ascii=False, indent=2)
+    if args.trace:
+        tracing.export(args.trace)
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,11 +1,26 @@
+import time
+_STARTED = time.perf_counter()  # 起動時間の計測用 (--startup-profile, utils/startup_profile.py)
 import customtkinter as ctk
 from tkinter import filedialog, messagebox
 import os
-import copy
 from utils import pdf_ops
+from utils.preview_engine import PreviewEngine
+from utils.thumb_renderer import ThumbnailRenderer
+from utils.grid_layout import GridLayout
+from utils import list_diff
+from utils import history as edit_ops
+from utils.history import EditHistory
+from utils.page_model import Page, SourceTable
+from utils.thumb_cache import ThumbnailCache, thumbnail_key
+from utils.cache_utils import content_hash
+from utils.conversion_cache import LEASE_REFRESH
+from utils import ingest
+from utils import tracing
+from utils.startup_profile import StartupProfile, requested_output
+from utils.job_scheduler import JobScheduler, PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND
 from PIL import Image
 import sys
-import threading  # 非同期処理用に追加
+import multiprocessing
 
 # --- PyInstaller用のパス解決関数 ---
 def resource_path(relative_path):
@@ -26,10 +41,11 @@ ctk.set_default_color_theme("blue")
 
 # --- 処理中オーバーレイ（ローディング画面）クラス ---
 class ProcessingOverlay(ctk.CTkToplevel):
-    def __init__(self, parent, message="処理中..."):
+    def __init__(self, parent, message="処理中...", on_cancel=None):
         super().__init__(parent)
         self.title("")
-        self.geometry("300x120")
+        height = 160 if on_cancel else 120
+        self.geometry(f"300x{height}")
         self.resizable(False, False)
         self.attributes("-topmost", True) # 常に最前面
         
@@ -39,7 +55,7 @@ class ProcessingOverlay(ctk.CTkToplevel):
         parent_w = parent.winfo_width()
         parent_h = parent.winfo_height()
         x = parent_x + (parent_w // 2) - 150
-        y = parent_y + (parent_h // 2) - 60
+        y = parent_y + (parent_h // 2) - height // 2
         self.geometry(f"+{x}+{y}")
 
         # モーダル化（親ウィンドウの操作をブロック）
@@ -53,6 +69,18 @@ class ProcessingOverlay(ctk.CTkToplevel):
         self.progress.pack(pady=10)
         self.progress.start()
 
+        if on_cancel:
+            ctk.CTkButton(self, text="キャンセル", width=100, fg_color="gray", command=on_cancel).pack(pady=(0, 10))
+
+    def set_progress(self, done, total, message=None):
+        """件数の分かる処理では進捗バーを割合表示に切り替える"""
+        if self.progress.cget("mode") != "determinate":
+            self.progress.stop()
+            self.progress.configure(mode="determinate")
+        self.progress.set(done / total if total else 0)
+        if message is not None:
+            self.label.configure(text=message)
+
 # ------------------------------------------------
 
 class PreviewWindow(ctk.CTkToplevel):
@@ -63,9 +91,9 @@ class PreviewWindow(ctk.CTkToplevel):
         self.geometry("700x850")
         
         self.current_page = 0
-        self.total_pages = 0
-        self.pdf_stream = None
-        self.is_loading = False # 連打防止用
+        # 表示中のページの前後は描画スレッドで先読みし、表示サイズに縮小済みの画像を持っておく
+        self.engine = PreviewEngine(on_ready=self._on_page_ready, scheduler=parent.scheduler)
+        self._shown_landscape = None
 
         self.protocol("WM_DELETE_WINDOW", self.on_close)
         self.bind("<Left>", lambda e: self.prev_page())
@@ -114,6 +142,7 @@ class PreviewWindow(ctk.CTkToplevel):
         self.image_label.grid(row=2, column=0, padx=20, pady=10)
 
     def on_close(self):
+        self.engine.close()
         self.parent.preview_window = None
         self.destroy()
 
@@ -132,78 +161,63 @@ class PreviewWindow(ctk.CTkToplevel):
         item = self.parent.pages[self.current_page]
         self.parent.toggle_orientation(self.current_page, False, item)
 
+    @property
+    def total_pages(self):
+        return self.engine.total_pages
+
     def update_preview(self, page_list, start_page=None):
-        """プレビュー生成を非同期化"""
+        """結合せず、表示中のページだけを元ファイルから描画する"""
         if not page_list:
+            self.engine.set_pages([])
             self.image_label.configure(text="ファイルがありません", image=None)
             self.page_label.configure(text="0 / 0")
             return
-        
-        if self.is_loading: return
-        self.is_loading = True
-        self.image_label.configure(text="Generating Preview...", image=None)
 
+        self.engine.set_pages(page_list)
         if start_page is not None:
             self.current_page = start_page
-
-        # スレッド起動
-        thread = threading.Thread(target=self._update_preview_thread, args=(page_list,))
-        thread.daemon = True
-        thread.start()
-
-    def _update_preview_thread(self, page_list):
-        """バックグラウンドで結合＆画像生成"""
-        # メモリ上で結合
-        stream = pdf_ops.merge_pdfs_securely(page_list, output_path=None)
-        
-        total = 0
-        if stream:
-            import fitz
-            try:
-                with fitz.open(stream=stream, filetype="pdf") as doc:
-                    total = len(doc)
-            except:
-                total = 0
-        
-        # メインスレッドでUI更新
-        self.after(0, self._update_preview_callback, stream, total)
-
-    def _update_preview_callback(self, stream, total_pages):
-        self.pdf_stream = stream
-        self.total_pages = total_pages
-        
         if self.current_page >= self.total_pages:
             self.current_page = max(0, self.total_pages - 1)
-            
-        self.is_loading = False
         self.show_page()
 
     def show_page(self):
-        if not self.pdf_stream or self.total_pages == 0:
+        if self.total_pages == 0:
             self.image_label.configure(text="No Pages", image=None)
             return
 
-        # ページ描画も重い場合があるが、PyMuPDFは高速なのでここは同期処理のままでOK
-        # (必要ならここも非同期化可能だが、チラつきの原因になるため現状維持)
-        pil_image = pdf_ops.get_preview_image(self.pdf_stream, self.current_page)
-        
-        if pil_image:
-            w, h = pil_image.size
-            if w > h:
-                self.geometry("1000x750")
-            else:
-                self.geometry("700x850")
-
-            win_w = 950 if w > h else 650
-            win_h = 700 if w > h else 800
-            ratio = min(win_w/w, win_h/h)
-            new_size = (int(w*ratio), int(h*ratio))
-            pil_image = pil_image.resize(new_size, Image.Resampling.LANCZOS)
-            ctk_image = ctk.CTkImage(light_image=pil_image, dark_image=pil_image, size=new_size)
-            self.image_label.configure(image=ctk_image, text="")
-            self.page_label.configure(text=f"Page: {self.current_page + 1} / {self.total_pages}")
-        else:
+        self.page_label.configure(text=f"Page: {self.current_page + 1} / {self.total_pages}")
+        # 描画は先読みスレッドで行う。描画済みなら貼るだけ、まだなら終わったときに _on_page_ready で貼る
+        # (それまでは直前のページの画像を出したままにして、ページ送り中のちらつきを抑える)
+        self.engine.prefetch(self.current_page)
+        ready, pil_image = self.engine.cached(self.current_page)
+        if ready:
+            self._display(pil_image)
+
+    def _on_page_ready(self, page_num):
+        # 描画スレッドから呼ばれる
+        try:
+            self.after(0, self._page_ready)
+        except RuntimeError:
+            pass  # ウィンドウを閉じた後
+
+    def _page_ready(self):
+        if not self.winfo_exists() or self.total_pages == 0: return
+        ready, pil_image = self.engine.cached(self.current_page)
+        if ready:
+            self._display(pil_image)
+
+    def _display(self, pil_image):
+        if pil_image is None:
             self.image_label.configure(text="Preview Error", image=None)
+            return
+        # 画像は枠に縮小済み (utils/preview_engine.py)。ウィンドウの大きさは向きが変わったときだけ変える
+        w, h = pil_image.size
+        is_landscape = w > h
+        if is_landscape != self._shown_landscape:
+            self.geometry("1000x750" if is_landscape else "700x850")
+            self._shown_landscape = is_landscape
+        ctk_image = ctk.CTkImage(light_image=pil_image, dark_image=pil_image, size=(w, h))
+        self.image_label.configure(image=ctk_image, text="")
 
     def next_page(self):
         if self.current_page < self.total_pages - 1:
@@ -216,6 +230,274 @@ class PreviewWindow(ctk.CTkToplevel):
             self.show_page()
 
 
+# --- 仮想化ページグリッド ---
+class PageGridCell:
+    """ページグリッドの1セル分のウィジェット (スクロールに合わせて使い回す)"""
+    def __init__(self, grid, w, h):
+        app = grid.app
+        self.grid = grid
+        self.index = None
+        self.cache_key = None
+        self.highlight = False
+
+        self.frame = ctk.CTkFrame(grid.parent, width=w, height=h, border_width=0)
+        self.frame.grid_propagate(False)
+        self.default_fg = self.frame.cget("fg_color")
+
+        self.img_label = ctk.CTkLabel(self.frame, text="…", image=grid.placeholder_img)
+        self.img_label.place(relx=0.5, rely=0.5, anchor="center")
+
+        btn_frame = ctk.CTkFrame(self.frame, fg_color="transparent", width=90, height=30)
+        btn_frame.place(relx=0.03, rely=0.03, anchor="nw")
+
+        del_btn = ctk.CTkButton(btn_frame, text="✕", width=24, height=24, fg_color="#cc0000", hover_color="#990000",
+                                font=("Arial", 14, "bold"),
+                                command=lambda: app.delete_item(self.index, False, app.pages[self.index]))
+        del_btn.pack(side="left", padx=1)
+
+        rot_btn = ctk.CTkButton(btn_frame, text="↻", width=24, height=24, fg_color="#0099cc", hover_color="#006699",
+                                font=("Arial", 14, "bold"),
+                                command=lambda: app.rotate_item(self.index, False, app.pages[self.index]))
+        rot_btn.pack(side="left", padx=1)
+
+        zoom_btn = ctk.CTkButton(btn_frame, text="🔍", width=24, height=24, fg_color="#ff9900", hover_color="#cc7a00",
+                                 font=("Arial", 14, "bold"),
+                                 command=lambda: app.open_preview(start_page=self.index))
+        zoom_btn.pack(side="left", padx=1)
+
+        self.num_label = ctk.CTkLabel(self.frame, text="", width=20, height=20, fg_color="gray", text_color="white", corner_radius=10)
+        self.num_label.place(relx=0.95, rely=0.05, anchor="ne")
+
+        for widget in (self.frame, self.img_label):
+            widget.bind("<Button-1>", lambda e: app.start_drag(e, self.index))
+            widget.bind("<B1-Motion>", app.on_drag)
+            widget.bind("<ButtonRelease-1>", app.stop_drag)
+
+    def bind_page(self, index, item_data, x, y, priority, relayout=False):
+        """前回の表示内容と比べて、変わった部分だけを書き換える"""
+        app = self.grid.app
+        if index != self.index or relayout:
+            self.frame.place(x=x, y=y)
+            self.num_label.configure(text=str(index + 1))
+            self.index = index
+
+        highlight = index == app.dragging_index
+        if highlight != self.highlight:
+            self.frame.configure(fg_color="#444444" if highlight else self.default_fg)
+            self.highlight = highlight
+
+        w, h = self.grid.cell_size
+        file_hash = item_data.content_hash
+        if file_hash:
+            # 内容のハッシュをキーにするので、同じファイルの再追加や次回起動時も使い回せる
+            cache_key = thumbnail_key(file_hash, item_data.page_index, item_data.rotation, w - 10, h - 10)
+        else:
+            cache_key = f"u{item_data.uid}_{item_data.rotation}_{w}"
+        img = app.thumb_cache.get_memory(cache_key)
+        if cache_key != self.cache_key:
+            self.cache_key = cache_key
+            if img:
+                self.img_label.configure(image=img, text="")
+            else:
+                # 描画が終わるまではプレースホルダーを表示
+                self.img_label.configure(image=self.grid.placeholder_img, text="…")
+        if img is None:
+            # 処理中の依頼はレンダラー側で重複が除かれる
+            app.thumb_renderer.request(cache_key, item_data.path, item_data.page_index,
+                                       item_data.rotation, w - 10, h - 10, priority=priority,
+                                       cacheable=bool(file_hash))
+
+    def release(self):
+        self.index = None
+        self.frame.place_forget()
+
+    def destroy(self):
+        self.frame.destroy()
+
+
+class VirtualPageGrid:
+    """表示範囲 (+前後の数行) のセルだけを生成し、スクロールに合わせて使い回すグリッド"""
+    def __init__(self, app, parent, overscan_rows=1):
+        self.app = app
+        self.parent = parent
+        self.overscan_rows = overscan_rows
+        self.layout = None
+        self.cell_size = None
+        self.spacer = None
+        self.cells = {}       # ページ番号 -> 表示中のセル
+        self.free_cells = []
+        self.placeholder_img = ctk.CTkImage(light_image=Image.new("RGBA", (1, 1), (0, 0, 0, 0)), size=(1, 1))
+        self._update_job = None
+
+    def render(self):
+        app = self.app
+        width = self.parent.winfo_width()
+        if width < 100: width = 800
+
+        item_w = int(app.base_thumb_size * app.zoom_level)
+        item_h = int(item_w * 1.414)
+        if (item_w, item_h) != self.cell_size:
+            # ズーム変更時はセルの大きさが変わるので作り直す
+            self.clear()
+            self.cell_size = (item_w, item_h)
+
+        layout = GridLayout(len(app.pages), width, item_w, item_h)
+        # 列数が変わった時だけ全セルを置き直す。それ以外は各セルが差分だけを書き換える
+        relayout = self.layout is None or layout.columns != self.layout.columns
+        resized = self.layout is None or layout.total_height != self.layout.total_height
+        self.layout = layout
+
+        # スクロール領域はページ数と列数から計算した大きさのスペーサーで確保する
+        if self.spacer is None:
+            self.spacer = ctk.CTkFrame(self.parent, width=1, height=1, fg_color="transparent")
+            self.spacer.pack(anchor="nw")
+            resized = True
+        if resized or relayout:
+            self.spacer.configure(width=max(1, layout.total_width), height=max(1, layout.total_height))
+            self.parent.update_idletasks()
+            try:
+                canvas = self.parent._parent_canvas
+                canvas.configure(scrollregion=canvas.bbox("all"))
+            except Exception:
+                pass
+
+        self.update_visible(relayout=relayout)
+
+    def schedule_update(self):
+        """スクロールのたびに呼ばれるため、アイドル時にまとめて1回だけ更新する"""
+        if self._update_job is None and self.layout is not None:
+            self._update_job = self.app.after_idle(self._run_scheduled_update)
+
+    def _run_scheduled_update(self):
+        self._update_job = None
+        self.update_visible()
+
+    def update_visible(self, relayout=False):
+        layout = self.layout
+        if layout is None: return
+        try:
+            top, bottom = self.parent._parent_canvas.yview()
+        except Exception:
+            top, bottom = 0.0, 1.0
+        visible = layout.visible_indexes(top, bottom, self.overscan_rows)
+
+        # 範囲外に出たセル (削除で末尾が消えた分を含む) を回収
+        for index in [i for i in self.cells if i not in visible]:
+            cell = self.cells.pop(index)
+            cell.release()
+            self.free_cells.append(cell)
+
+        # 表示範囲外の描画依頼は捨て、見えているもので未描画のものだけを依頼し直す
+        self.app.thumb_renderer.cancel_pending()
+        for index in visible:
+            cell = self.cells.get(index)
+            if cell is None:
+                cell = self.free_cells.pop() if self.free_cells else PageGridCell(self, *self.cell_size)
+                self.cells[index] = cell
+            priority = 1 if layout.is_overscan(index, top, bottom) else 0
+            x, y = layout.position(index)
+            cell.bind_page(index, self.app.pages[index], x, y, priority, relayout)
+
+        # 使い回し用に残すセルは表示数程度まで
+        while len(self.free_cells) > max(len(visible), 1):
+            self.free_cells.pop().destroy()
+
+    def cell_at_pointer(self, x_root, y_root):
+        """マウス位置にあるセルのページ番号 (なければ -1)"""
+        for index, cell in self.cells.items():
+            frame = cell.frame
+            if not frame.winfo_exists(): continue
+            left, top = frame.winfo_rootx(), frame.winfo_rooty()
+            if left < x_root < left + frame.winfo_width() and top < y_root < top + frame.winfo_height():
+                return index
+        return -1
+
+    def on_thumbnail(self, cache_key):
+        img = self.app.thumb_cache.get_memory(cache_key)
+        if img is None: return
+        for cell in self.cells.values():
+            if cell.cache_key == cache_key:
+                cell.img_label.configure(image=img, text="")
+
+    def clear(self):
+        if self._update_job is not None:
+            self.app.after_cancel(self._update_job)
+            self._update_job = None
+        for cell in list(self.cells.values()) + self.free_cells:
+            cell.destroy()
+        self.cells = {}
+        self.free_cells = []
+        if self.spacer is not None:
+            self.spacer.destroy()
+            self.spacer = None
+        self.layout = None
+
+class FileListRow:
+    """ファイル単位表示の1行分のウィジェット (内容が変わった時だけ書き換える)"""
+    def __init__(self, app, parent):
+        self.app = app
+        self.index = None
+        self.item_data = None
+        self.state = None
+
+        self.frame = ctk.CTkFrame(parent, border_color=None, border_width=0)
+        self.frame.pack(fill="x", pady=5, padx=5)
+        self.default_fg = self.frame.cget("fg_color")
+
+        drag = ctk.CTkLabel(self.frame, text="≡", font=("Arial", 20), cursor="hand2", width=30)
+        drag.pack(side="left", padx=(5, 0))
+
+        self.name_label = ctk.CTkLabel(self.frame, text="", font=ctk.CTkFont(weight="bold"))
+        self.name_label.pack(side="left", padx=10, pady=10)
+        self.sub_label = ctk.CTkLabel(self.frame, text="", text_color="gray")
+        self.sub_label.pack(side="left", padx=5)
+
+        for w in [self.frame, drag, self.name_label]:
+            w.bind("<Button-1>", lambda e: app.start_drag(e, self.index))
+            w.bind("<B1-Motion>", app.on_drag)
+            w.bind("<ButtonRelease-1>", app.stop_drag)
+
+        ctk.CTkButton(self.frame, text="✕", width=30, fg_color="transparent", text_color="red", hover_color=("#fee", "#400"), 
+                      command=lambda: app.delete_item(self.index, True, self.item_data)).pack(side="right", padx=10)
+        ctk.CTkButton(self.frame, text="↻", width=30, fg_color="transparent", text_color="#00BFFF", hover_color=("lightblue", "navy"), 
+                      command=lambda: app.rotate_item(self.index, True, self.item_data)).pack(side="right", padx=2)
+        self.ori_btn = ctk.CTkButton(self.frame, text="▯", width=30, fg_color="transparent", 
+                                     text_color="white", font=("Arial", 20), hover_color=("gray70", "gray30"),
+                                     command=lambda: app.toggle_orientation(self.index, True, self.item_data))
+        self.ori_btn.pack(side="right", padx=2)
+
+    @staticmethod
+    def display_state(index, item_data, highlight):
+        """行の見た目を決める値 (差分比較用)"""
+        if item_data.get('is_landscape_generated', False): orientation_icon = "▭"
+        else:
+            rot = item_data.get('rotation_display', 0)
+            is_orig_port = item_data.get('is_portrait_original', True)
+            is_curr_port = (is_orig_port and rot%180==0) or (not is_orig_port and rot%180!=0)
+            orientation_icon = "▯" if is_curr_port else "▭"
+
+        rot_text = f" [+{item_data['rotation_display']}°]" if item_data['rotation_display'] > 0 else ""
+        title = f"{index+1}. {item_data['filename']}{rot_text}"
+        sub = f"({item_data['pages_count']} pages)"
+        return (title, sub, orientation_icon, highlight)
+
+    def update(self, index, item_data, state):
+        self.index = index
+        self.item_data = item_data
+        if state == self.state: return
+        title, sub, orientation_icon, highlight = state
+        old = self.state or (None, None, None, None)
+        if title != old[0]: self.name_label.configure(text=title)
+        if sub != old[1]: self.sub_label.configure(text=sub)
+        if orientation_icon != old[2]: self.ori_btn.configure(text=orientation_icon)
+        if highlight != old[3]: self.frame.configure(fg_color="#444444" if highlight else self.default_fg)
+        self.state = state
+
+    def destroy(self):
+        self.frame.destroy()
+
+# ------------------------------------------------
+
 class App(ctk.CTk):
     def __init__(self):
         super().__init__()
@@ -226,23 +508,43 @@ class App(ctk.CTk):
         self.auto_scroll_speed = 20    
         self.auto_scroll_margin = 50   
         self.auto_scroll_amount = 20   
+        self.thumb_cache_max_mb = 256    # サムネイルのディスクキャッシュ上限
+        self.thumb_memory_items = 400    # メモリ上に保持するサムネイル数
+        self.history_depth = 200        # Undo できる操作数の上限
+        self.history_budget = 500_000   # 履歴が保持するページ参照数の上限 (メモリ予算)
+        self.ingest_workers = ingest.default_workers()  # ファイル取り込みの並列数
+        self.job_workers = 3             # バックグラウンド処理のスレッド数 (1つはプレビュー用に空けておく)
+        # 保存するPDFの最適化 (重複したフォント・画像の統合 / ストリーム圧縮 / オブジェクトストリーム)
+        self.output_options = {'dedupe': True, 'compress': True, 'object_streams': False}
+        self.merge_memory_budget_mb = None  # 数値を入れると省メモリ結合 (大きな結合でメモリが足りない場合)
         # ------------
 
         self.title("Secure PDF Merger")
         self.geometry("1150x750")
 
-        self.pages = []
-        self.history = []
-        self.redo_stack = []
+        self.pages = []              # Page のリスト (utils/page_model.py)
+        self.sources = SourceTable()  # ファイル単位の情報 (ページ間で共有)
+        self.history = EditHistory(max_depth=self.history_depth, max_cost=self.history_budget)
+        self.drag_ops = []  # ドラッグ中の移動操作 (離した時に1件の履歴にまとめる)
+        self.release_job = None  # 使わなくなった変換結果のリースを返す予約 (after の ID)
         self.view_mode = "file"
         
         self.zoom_level = 1.0 
 
+        # 取り込み・縦横変換・結合・プレビューは優先度付きのスケジューラーで実行し、完了通知は after() で受け取る
+        self.scheduler = JobScheduler(max_workers=self.job_workers,
+                                      dispatch=lambda callback, *args: self.after(0, callback, *args))
         self.preview_window = None
         self.dragging_index = None 
         self.auto_scroll_job = None 
         
-        self.thumbnail_cache = {}
+        self.thumb_cache = ThumbnailCache(max_bytes=self.thumb_cache_max_mb * 1024 * 1024,
+                                          memory_items=self.thumb_memory_items)
+        # サムネイルはワーカープロセスで描画し、完了したものから配置する
+        self.thumb_renderer = ThumbnailRenderer(on_done=self._on_thumbnail_rendered, disk_cache=self.thumb_cache)
+        self.rendered_mode = None
+        self.file_rows = []        # ファイル単位表示の行 (再利用する)
+        self.file_row_states = []  # 前回描画した各行の表示内容
         self.loading_overlay = None # ローディング画面用変数
 
         self.grid_columnconfigure(1, weight=1)
@@ -293,15 +595,61 @@ class App(ctk.CTk):
         self.scrollable_list.bind("<Configure>", self.on_resize)
         
         self.scrollable_list._parent_canvas.bind_all("<MouseWheel>", self._on_mouse_wheel)
+
+        # ページモードは表示範囲のセルだけを生成する仮想化グリッドで描画する
+        self.page_grid = VirtualPageGrid(self, self.scrollable_list)
+        canvas = self.scrollable_list._parent_canvas
+        scrollbar = self.scrollable_list._scrollbar
+        canvas.configure(yscrollcommand=lambda first, last: self._on_list_scrolled(scrollbar, first, last))
         
         self.last_width = 0
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
+        self.after(LEASE_REFRESH * 1000, self._refresh_conversion_leases)
+
+    def on_close(self):
+        self.scheduler.shutdown()
+        self.thumb_renderer.shutdown()
+        # このセッションの変換結果のリースを返し、他のプロセスが削除できるようにする
+        pdf_ops.get_conversion_cache().release()
+        self.destroy()
+
+    def _refresh_conversion_leases(self):
+        # 開いている間はリースが期限切れにならないよう定期的に更新する
+        pdf_ops.get_conversion_cache().refresh()
+        self.after(LEASE_REFRESH * 1000, self._refresh_conversion_leases)
+
+    def _schedule_release_conversions(self):
+        # 連続した編集をまとめて、少し経ってから1回だけ確かめる
+        if self.release_job: self.after_cancel(self.release_job)
+        self.release_job = self.after(5000, self._release_unused_conversions)
+
+    def _release_unused_conversions(self):
+        """リストからも履歴からも参照されなくなった変換結果のリースを返す (変換キャッシュの削除対象に戻す)"""
+        self.release_job = None
+        referenced = {page.source for page in self.pages} | self.history.sources()
+        in_use = {record.path for record in referenced if record.is_generated}
+        unused = {record.path for record in self.sources.records()
+                  if record.is_generated and record.path not in in_use}
+        if unused: pdf_ops.get_conversion_cache().release(*unused)
 
     # --- ヘルパー: ローディング表示 ---
-    def show_loading(self, message="処理中..."):
+    def show_loading(self, message="処理中...", job=None):
+        """job (JobScheduler.submit の戻り値) を渡すと、キャンセルボタンを表示する"""
         if self.loading_overlay is None or not self.loading_overlay.winfo_exists():
-            self.loading_overlay = ProcessingOverlay(self, message)
+            on_cancel = (lambda: self._cancel_job(job)) if job else None
+            self.loading_overlay = ProcessingOverlay(self, message, on_cancel)
         self.update()
 
+    def _cancel_job(self, job):
+        # キャンセルしたジョブの完了通知は来ないので、ここで表示を戻す
+        job.cancel()
+        self.hide_loading()
+
+    def _on_job_error(self, error):
+        tracing.report_error('job', error)
+        self.hide_loading()
+        messagebox.showerror("エラー", f"失敗しました\n{error}")
+
     def hide_loading(self):
         if self.loading_overlay and self.loading_overlay.winfo_exists():
             self.loading_overlay.destroy()
@@ -317,6 +665,11 @@ class App(ctk.CTk):
             canvas.yview_scroll(units, "units")
         except: pass
 
+    def _on_list_scrolled(self, scrollbar, first, last):
+        scrollbar.set(first, last)
+        if self.view_mode == "page":
+            self.page_grid.schedule_update()
+
     def zoom_in(self):
         self.zoom_level = min(3.0, self.zoom_level + 0.2)
         self.full_refresh_list_ui()
@@ -330,28 +683,31 @@ class App(ctk.CTk):
             self.last_width = event.width
             self.full_refresh_list_ui()
 
-    def save_state(self):
-        self.history.append(copy.deepcopy(self.pages))
-        self.redo_stack.clear()
+    def apply_edit(self, op):
+        """操作を適用して履歴に記録する"""
+        op.apply(self.pages)
+        self.history.record(op)
         self.update_history_buttons()
+        self.full_refresh_list_ui()
+        self._schedule_release_conversions()
 
     def undo_action(self):
-        if not self.history: return
-        self.redo_stack.append(copy.deepcopy(self.pages))
-        self.pages = self.history.pop()
+        if not self.history.undo(self.pages): return
         self.full_refresh_list_ui()
         self.update_history_buttons()
 
     def redo_action(self):
-        if not self.redo_stack: return
-        self.history.append(copy.deepcopy(self.pages))
-        self.pages = self.redo_stack.pop()
+        if not self.history.redo(self.pages): return
         self.full_refresh_list_ui()
         self.update_history_buttons()
 
     def update_history_buttons(self):
-        self.undo_btn.configure(state="normal" if self.history else "disabled")
-        self.redo_btn.configure(state="normal" if self.redo_stack else "disabled")
+        self.undo_btn.configure(state="normal" if self.history.can_undo() else "disabled")
+        self.redo_btn.configure(state="normal" if self.history.can_redo() else "disabled")
+
+    def page_indexes_of(self, items):
+        uids = {x.uid for x in items}
+        return [i for i, p in enumerate(self.pages) if p.uid in uids]
 
     def toggle_view_mode(self):
         self.view_mode = "page" if self.view_mode == "file" else "file"
@@ -373,82 +729,69 @@ class App(ctk.CTk):
         file_paths = filedialog.askopenfilenames(title="ファイルを選択", filetypes=filetypes)
         
         if file_paths:
-            self.save_state()
-            self.show_loading("ファイルを読み込んでいます...")
-            
-            # スレッド開始
-            thread = threading.Thread(target=self._process_files_thread, args=(file_paths,))
-            thread.daemon = True
-            thread.start()
-
-    def _process_files_thread(self, file_paths):
-        """バックグラウンドで変換と解析を行う"""
+            job = self.scheduler.submit(self._process_files_job, file_paths, priority=PRIORITY_BACKGROUND,
+                                        name='ingest', on_done=self._add_files_finished, on_error=self._on_job_error)
+            self.show_loading("ファイルを読み込んでいます...", job)
+
+    def _process_files_job(self, token, file_paths):
+        """バックグラウンドで変換と解析を並列に行う (結果は選択順)"""
+        results = ingest.ingest_files(file_paths, max_workers=self.ingest_workers,
+                                      on_progress=self._on_ingest_progress, cancel_token=token)
         new_pages = []
-        for path in file_paths:
-            final_path = path
-            filename = os.path.basename(path)
-            is_generated = False
-            
-            # PDF以外の変換 (重い処理)
-            if not path.lower().endswith('.pdf'):
-                print(f"Converting: {filename}")
-                try:
-                    converted = pdf_ops.convert_to_pdf(path, is_landscape=False)
-                    if converted and os.path.exists(converted):
-                        final_path = converted
-                        is_generated = True
-                    else:
-                        print(f"Skipping: {filename}")
-                        continue
-                except: continue
-
-            # PDF情報取得 (やや重い処理)
-            info = pdf_ops.get_pdf_info(final_path)
-            if info:
-                for i in range(info['pages']):
-                    is_port = True
-                    if 'page_details' in info and i < len(info['page_details']):
-                        is_port = info['page_details'][i]['is_portrait']
-
-                    new_pages.append({
-                        'path': final_path,
-                        'original_source_path': path,
-                        'is_generated': is_generated,
-                        'filename': filename,
-                        'page_index': i,
-                        'rotation': 0,
-                        'is_portrait_original': is_port,
-                        'is_landscape_generated': False,
-                        'id': f"{filename}_{i}_{os.urandom(4).hex()}"
-                    })
-        
-        # 完了したらメインスレッドに戻す
-        self.after(0, self._add_files_finished, new_pages)
+        failures = []
+        for result in results:
+            if result.get('error'):
+                failures.append(result)
+                continue
+            source = self.sources.intern(result['final_path'], result['path'], result['filename'],
+                                         result['is_generated'], False, result['content_hash'])
+            details = result['page_details']
+            for i in range(result['pages']):
+                is_port = details[i]['is_portrait'] if i < len(details) else True
+                new_pages.append(Page(source, i, 0, is_port))
+        # 完了通知 (_add_files_finished) はメインスレッドで呼ばれる
+        return new_pages, failures
+
+    def _on_ingest_progress(self, done, total, result):
+        # ファイルごとの処理時間はトレース (ingest のスパン)、失敗は完了後のダイアログで伝える
+        message = f"ファイルを読み込んでいます... {done} / {total}\n{result['filename']}"
+        self.after(0, self._update_loading_progress, done, total, message)
+
+    def _update_loading_progress(self, done, total, message):
+        if self.loading_overlay and self.loading_overlay.winfo_exists():
+            self.loading_overlay.set_progress(done, total, message)
 
-    def _add_files_finished(self, new_pages):
+    def _add_files_finished(self, result):
         """メインスレッドでリスト更新"""
-        self.pages.extend(new_pages)
-        self.full_refresh_list_ui()
+        new_pages, failures = result
+        if new_pages:
+            self.apply_edit(edit_ops.InsertPages(len(self.pages), new_pages))
         self.hide_loading()
+        if failures:
+            lines = [f"・{r['filename']}: {r['error']}" for r in failures[:20]]
+            if len(failures) > 20: lines.append(f"ほか {len(failures) - 20} 件")
+            messagebox.showwarning("読み込みエラー", f"{len(failures)} 件のファイルを読み込めませんでした\n\n" + "\n".join(lines))
 
     # --- UI更新 (軽量化対応) ---
     def full_refresh_list_ui(self, update_scroll_region=True):
-        for widget in self.scrollable_list.winfo_children():
-            widget.destroy()
-        
         mode_text = "ファイル単位"
         if self.view_mode == "page":
             mode_text = "ページ単位 (プレビュー)"
+            if self.rendered_mode != "page":
+                self.clear_list_widgets()
             self.render_page_mode()
         else:
+            if self.rendered_mode != "file":
+                self.clear_list_widgets()
             self.render_file_mode()
+        self.rendered_mode = self.view_mode
         
         self.list_label.configure(text=f"結合リスト ({len(self.pages)} ページ) - {mode_text}")
         
         if self.preview_window and self.preview_window.winfo_exists():
             self.preview_window.update_preview(self.pages)
 
-        if update_scroll_region:
+        if update_scroll_region and self.view_mode != "page":
             self.scrollable_list.update_idletasks()
             try:
                 canvas = self.scrollable_list._parent_canvas
@@ -456,149 +799,79 @@ class App(ctk.CTk):
             except:
                 pass
 
-    # --- ページモード (グリッド表示) ---
-    def render_page_mode(self):
-        if not self.pages: return
-        
-        width = self.scrollable_list.winfo_width()
-        if width < 100: width = 800 
-        
-        item_w = int(self.base_thumb_size * self.zoom_level)
-        item_h = int(item_w * 1.414) 
-        gap = 15 
-        
-        safe_width_percent = 0.52
-        usable_width = width * safe_width_percent
-        
-        columns = max(1, int(usable_width // (item_w + gap)))
-        
-        for index, item in enumerate(self.pages):
-            r = index // columns
-            c = index % columns
-            self.create_page_grid_item(index, item, r, c, item_w, item_h)
-
-    def create_page_grid_item(self, index, item_data, r, c, w, h):
-        fg_color = None
-        if index == self.dragging_index: fg_color = "#444444"
-        
-        frame = ctk.CTkFrame(self.scrollable_list, width=w, height=h, fg_color=fg_color, border_width=0)
-        frame.grid(row=r, column=c, padx=7, pady=7)
-        frame.grid_propagate(False)
-
-        cache_key = f"{item_data['id']}_{item_data['rotation']}_{w}"
-        if cache_key in self.thumbnail_cache:
-            img = self.thumbnail_cache[cache_key]
-        else:
-            pil_img = pdf_ops.get_page_thumbnail(item_data['path'], item_data['page_index'], item_data['rotation'])
-            if pil_img:
-                img_w, img_h = pil_img.size
-                ratio = min((w-10)/img_w, (h-10)/img_h)
-                new_size = (int(img_w*ratio), int(img_h*ratio))
-                pil_img = pil_img.resize(new_size, Image.Resampling.LANCZOS)
-                img = ctk.CTkImage(light_image=pil_img, dark_image=pil_img, size=new_size)
-                self.thumbnail_cache[cache_key] = img
-            else:
-                img = None
-
-        if img:
-            img_label = ctk.CTkLabel(frame, text="", image=img)
-            img_label.place(relx=0.5, rely=0.5, anchor="center")
-            img_label.bind("<Button-1>", lambda e, idx=index: self.start_drag(e, idx))
-            img_label.bind("<B1-Motion>", self.on_drag)
-            img_label.bind("<ButtonRelease-1>", self.stop_drag)
-
-        btn_frame = ctk.CTkFrame(frame, fg_color="transparent", width=90, height=30)
-        btn_frame.place(relx=0.03, rely=0.03, anchor="nw")
-
-        del_btn = ctk.CTkButton(btn_frame, text="✕", width=24, height=24, fg_color="#cc0000", hover_color="#990000",
-                                font=("Arial", 14, "bold"),
-                                command=lambda: self.delete_item(index, False, item_data))
-        del_btn.pack(side="left", padx=1)
-
-        rot_btn = ctk.CTkButton(btn_frame, text="↻", width=24, height=24, fg_color="#0099cc", hover_color="#006699",
-                                font=("Arial", 14, "bold"),
-                                command=lambda: self.rotate_item(index, False, item_data))
-        rot_btn.pack(side="left", padx=1)
+    def clear_list_widgets(self):
+        self.page_grid.clear()
+        self.thumb_renderer.cancel_pending()
+        self.file_rows = []
+        self.file_row_states = []
+        for widget in self.scrollable_list.winfo_children():
+            widget.destroy()
 
-        zoom_btn = ctk.CTkButton(btn_frame, text="🔍", width=24, height=24, fg_color="#ff9900", hover_color="#cc7a00",
-                                font=("Arial", 14, "bold"),
-                                command=lambda: self.open_preview(start_page=index))
-        zoom_btn.pack(side="left", padx=1)
+    # --- ページモード (仮想化グリッド表示) ---
+    def render_page_mode(self):
+        # ページ数と列数からスクロール領域を決め、見えている行のセルだけを生成・再利用する
+        self.page_grid.render()
 
-        num_label = ctk.CTkLabel(frame, text=str(index+1), width=20, height=20, fg_color="gray", text_color="white", corner_radius=10)
-        num_label.place(relx=0.95, rely=0.05, anchor="ne")
+    def _on_thumbnail_rendered(self, cache_key, pil_img):
+        # ワーカーの結果待ちスレッドから呼ばれるため、UI操作はメインスレッドへ回す
+        try: self.after(0, self._place_thumbnail, cache_key, pil_img)
+        except RuntimeError: pass  # 終了処理中
 
-        frame.bind("<Button-1>", lambda e, idx=index: self.start_drag(e, idx))
-        frame.bind("<B1-Motion>", self.on_drag)
-        frame.bind("<ButtonRelease-1>", self.stop_drag)
+    def _place_thumbnail(self, cache_key, pil_img):
+        if pil_img is None: return
+        img = ctk.CTkImage(light_image=pil_img, dark_image=pil_img, size=pil_img.size)
+        self.thumb_cache.put_memory(cache_key, img)
+        self.page_grid.on_thumbnail(cache_key)
 
     # --- ファイルモード (リスト表示) ---
-    def render_file_mode(self):
-        if not self.pages: return
+    def group_pages(self):
+        """連続する同一ファイルのページをまとめる"""
+        if not self.pages: return []
         groups = []
         curr = [self.pages[0]]
         for p in self.pages[1:]:
-            if p['path'] == curr[-1]['path']: curr.append(p)
+            if p.source_id == curr[-1].source_id: curr.append(p)
             else: groups.append(curr); curr = [p]
         groups.append(curr)
+        return groups
 
-        for i, group in enumerate(groups):
+    def render_file_mode(self):
+        group_items = []
+        for group in self.group_pages():
             first = group[0]
-            group_item = {
-                'filename': first['filename'],
-                'path': first['path'],
-                'original_source_path': first.get('original_source_path'),
-                'is_generated': first.get('is_generated', False),
+            group_items.append({
+                'filename': first.filename,
+                'path': first.path,
+                'original_source_path': first.original_source_path,
+                'is_generated': first.is_generated,
                 'pages_count': len(group),
-                'rotation_display': first['rotation'],
-                'is_portrait_original': first.get('is_portrait_original', True),
-                'is_landscape_generated': first.get('is_landscape_generated', False),
+                'rotation_display': first.rotation,
+                'is_portrait_original': first.is_portrait_original,
+                'is_landscape_generated': first.is_landscape_generated,
                 'data': group
-            }
-            self.create_file_list_item(i, group_item)
-
-    def create_file_list_item(self, index, item_data):
-        fg_color = None
-        if index == self.dragging_index: fg_color = "#444444"
-        
-        item_frame = ctk.CTkFrame(self.scrollable_list, fg_color=fg_color, border_color=None, border_width=0)
-        item_frame.pack(fill="x", pady=5, padx=5)
-
-        drag = ctk.CTkLabel(item_frame, text="≡", font=("Arial", 20), cursor="hand2", width=30)
-        drag.pack(side="left", padx=(5, 0))
-
-        is_landscape_gen = item_data.get('is_landscape_generated', False)
-        if is_landscape_gen: orientation_icon = "▭"
-        else:
-            rot = item_data.get('rotation_display', 0)
-            is_orig_port = item_data.get('is_portrait_original', True)
-            is_curr_port = (is_orig_port and rot%180==0) or (not is_orig_port and rot%180!=0)
-            orientation_icon = "▯" if is_curr_port else "▭"
-
-        rot_text = f" [+{item_data['rotation_display']}°]" if item_data['rotation_display'] > 0 else ""
-        title = f"{index+1}. {item_data['filename']}{rot_text}"
-        sub = f"({item_data['pages_count']} pages)"
-
-        name = ctk.CTkLabel(item_frame, text=title, font=ctk.CTkFont(weight="bold"))
-        name.pack(side="left", padx=10, pady=10)
-        ctk.CTkLabel(item_frame, text=sub, text_color="gray").pack(side="left", padx=5)
-
-        for w in [item_frame, drag, name]:
-            w.bind("<Button-1>", lambda e, idx=index: self.start_drag(e, idx))
-            w.bind("<B1-Motion>", self.on_drag)
-            w.bind("<ButtonRelease-1>", self.stop_drag)
-
-        ctk.CTkButton(item_frame, text="✕", width=30, fg_color="transparent", text_color="red", hover_color=("#fee", "#400"), 
-                      command=lambda: self.delete_item(index, True, item_data)).pack(side="right", padx=10)
-        ctk.CTkButton(item_frame, text="↻", width=30, fg_color="transparent", text_color="#00BFFF", hover_color=("lightblue", "navy"), 
-                      command=lambda: self.rotate_item(index, True, item_data)).pack(side="right", padx=2)
-        ctk.CTkButton(item_frame, text=orientation_icon, width=30, fg_color="transparent", 
-                      text_color="white", font=("Arial", 20), hover_color=("gray70", "gray30"),
-                      command=lambda: self.toggle_orientation(index, True, item_data)).pack(side="right", padx=2)
+            })
+
+        # 前回の表示と比べ、変わった行だけを書き換える (行ウィジェットは使い回す)
+        states = [FileListRow.display_state(i, g, i == self.dragging_index) for i, g in enumerate(group_items)]
+        changed, removed = list_diff.changed_indexes(self.file_row_states, states)
+        for _ in removed:
+            self.file_rows.pop().destroy()
+        while len(self.file_rows) < len(group_items):
+            self.file_rows.append(FileListRow(self, self.scrollable_list))
+
+        changed = set(changed)
+        for i, group_item in enumerate(group_items):
+            row = self.file_rows[i]
+            if i in changed:
+                row.update(i, group_item, states[i])
+            else:
+                # 見た目は同じでも、ボタンから参照するページの実体は最新にしておく
+                row.index = i
+                row.item_data = group_item
+        self.file_row_states = states
 
     # --- 共通操作 (非同期化: 縦横変換) ---
     def toggle_orientation(self, index, is_group, item_data):
-        self.save_state()
         if not is_group:
             target_list = [item_data]
             target_item = item_data
@@ -612,61 +885,48 @@ class App(ctk.CTk):
         
         # Office変換など再生成が必要な場合のみ非同期処理へ
         if is_gen and source and os.path.exists(source):
-            self.show_loading("縦横を変換して再生成中...")
-            thread = threading.Thread(
-                target=self._toggle_orientation_thread,
-                args=(index, is_group, target_list, source, is_land)
-            )
-            thread.daemon = True
-            thread.start()
+            job = self.scheduler.submit(
+                self._toggle_orientation_job, source, is_land, priority=PRIORITY_INTERACTIVE, name='orientation',
+                on_done=lambda result: self._toggle_orientation_finished(target_list, *result),
+                on_error=self._on_job_error)
+            self.show_loading("縦横を変換して再生成中...", job)
         else:
             # ただの回転なら同期処理で十分（即終わるため）
             self.rotate_item(index, is_group, item_data)
 
-    def _toggle_orientation_thread(self, index, is_group, target_list, source, is_land):
+    def _toggle_orientation_job(self, token, source, is_land):
         new_is_landscape = not is_land
-        try:
-            new_pdf_path = pdf_ops.convert_to_pdf(source, is_landscape=new_is_landscape)
-            # UI更新スレッドへ
-            self.after(0, self._toggle_orientation_finished, target_list, new_pdf_path, new_is_landscape)
-        except Exception as e:
-            print(f"Orientation error: {e}")
-            self.after(0, self.hide_loading)
-
-    def _toggle_orientation_finished(self, target_list, new_pdf_path, new_is_landscape):
+        new_pdf_path = pdf_ops.convert_to_pdf(source, is_landscape=new_is_landscape, cancel_token=token)
+        new_hash = content_hash(new_pdf_path) if new_pdf_path else None
+        return new_pdf_path, new_is_landscape, new_hash
+
+    def _toggle_orientation_finished(self, target_list, new_pdf_path, new_is_landscape, new_hash=None):
         if new_pdf_path:
-            for item in target_list:
-                item['path'] = new_pdf_path
-                item['is_landscape_generated'] = new_is_landscape
-                item['rotation'] = 0
-            self.full_refresh_list_ui()
+            changes = []
+            for i in self.page_indexes_of(target_list):
+                page = self.pages[i]
+                new_source = self.sources.intern(new_pdf_path, page.original_source_path, page.filename,
+                                                 True, new_is_landscape, new_hash)
+                changes.append((i, {'source': page.source, 'rotation': page.rotation},
+                                   {'source': new_source, 'rotation': 0}))
+            if changes:
+                self.apply_edit(edit_ops.UpdatePages(changes))
         self.hide_loading()
 
     def delete_item(self, index, is_group, item_data):
-        self.save_state()
-        if is_group:
-            ids = [x['id'] for x in item_data['data']]
-            self.pages = [p for p in self.pages if p['id'] not in ids]
-        else:
-            del self.pages[index]
-        self.full_refresh_list_ui()
+        indexes = self.page_indexes_of(item_data['data']) if is_group else [index]
+        self.apply_edit(edit_ops.RemovePages(self.pages, indexes))
 
     def rotate_item(self, index, is_group, item_data):
-        self.save_state()
-        if is_group:
-            for p in item_data['data']: p['rotation'] = (p['rotation'] + 90) % 360
-        else:
-            self.pages[index]['rotation'] = (self.pages[index]['rotation'] + 90) % 360
-        self.full_refresh_list_ui()
+        indexes = self.page_indexes_of(item_data['data']) if is_group else [index]
+        self.apply_edit(edit_ops.RotatePages(indexes))
 
     def rotate_all_event(self):
         if not self.pages: return
-        self.save_state()
-        for p in self.pages: p['rotation'] = (p['rotation'] + 90) % 360
-        self.full_refresh_list_ui()
+        self.apply_edit(edit_ops.RotatePages(None))
 
     def start_drag(self, event, index):
-        self.save_state() 
+        self.drag_ops = []
         self.dragging_index = index
         self.configure(cursor="fleur")
         self.full_refresh_list_ui(update_scroll_region=True)
@@ -680,9 +940,11 @@ class App(ctk.CTk):
 
         mouse_y = self.scrollable_list._parent_canvas.winfo_pointery()
         mouse_x = self.scrollable_list._parent_canvas.winfo_pointerx()
-        children = self.scrollable_list.winfo_children()
+        children = [row.frame for row in self.file_rows] if self.view_mode != "page" else []
         
         target_index = -1
+        if self.view_mode == "page":
+            target_index = self.page_grid.cell_at_pointer(mouse_x, mouse_y)
         
         for i, child in enumerate(children):
             if not child.winfo_exists(): continue
@@ -697,16 +959,14 @@ class App(ctk.CTk):
         
         if target_index != -1 and target_index != self.dragging_index:
             if self.view_mode == "page":
-                self.pages.insert(target_index, self.pages.pop(self.dragging_index))
+                op = edit_ops.MovePages(self.dragging_index, 1, target_index)
             else:
-                groups = []
-                curr = [self.pages[0]]
-                for p in self.pages[1:]:
-                    if p['path'] == curr[-1]['path']: curr.append(p)
-                    else: groups.append(curr); curr = [p]
-                groups.append(curr)
-                groups.insert(target_index, groups.pop(self.dragging_index))
-                self.pages = [p for g in groups for p in g]
+                sizes = [len(g) for g in self.group_pages()]
+                start = sum(sizes[:self.dragging_index])
+                count = sizes.pop(self.dragging_index)
+                op = edit_ops.MovePages(start, count, sum(sizes[:target_index]))
+            op.apply(self.pages)
+            self.drag_ops.append(op)
             
             self.dragging_index = target_index
             self.full_refresh_list_ui(update_scroll_region=False)
@@ -750,6 +1010,11 @@ class App(ctk.CTk):
             self.after_cancel(self.auto_scroll_job)
             self.auto_scroll_job = None
         
+        if self.drag_ops:
+            self.history.record(edit_ops.CompositeOperation(self.drag_ops))
+            self.drag_ops = []
+            self.update_history_buttons()
+
         self.dragging_index = None
         self.configure(cursor="")
         self.full_refresh_list_ui(update_scroll_region=True)
@@ -770,15 +1035,13 @@ class App(ctk.CTk):
         if not self.pages: return
         output_path = filedialog.asksaveasfilename(defaultextension=".pdf", filetypes=[("PDF Files", "*.pdf")])
         if output_path:
-            self.show_loading("PDFを結合して保存中...")
-            
-            thread = threading.Thread(target=self._merge_thread, args=(self.pages, output_path))
-            thread.daemon = True
-            thread.start()
+            job = self.scheduler.submit(self._merge_job, list(self.pages), output_path, priority=PRIORITY_BACKGROUND,
+                                        name='merge', on_done=self._merge_finished, on_error=self._on_job_error)
+            self.show_loading("PDFを結合して保存中...", job)
 
-    def _merge_thread(self, pages, output_path):
-        success = pdf_ops.merge_pdfs_securely(pages, output_path)
-        self.after(0, self._merge_finished, success)
+    def _merge_job(self, token, pages, output_path):
+        return pdf_ops.merge_pdfs_securely(pages, output_path, options=self.output_options,
+                                           memory_budget_mb=self.merge_memory_budget_mb, cancel_token=token)
 
     def _merge_finished(self, success):
         self.hide_loading()
@@ -786,5 +1049,12 @@ class App(ctk.CTk):
         else: messagebox.showerror("エラー", "失敗しました")
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()  # PyInstaller + ワーカープロセス用
+    profile_output = requested_output(sys.argv[1:])
+    profile = StartupProfile(_STARTED) if profile_output else None
+    if profile: profile.mark('imports')
     app = App()
+    if profile:
+        profile.mark('app_created')
+        profile.finish_on_first_window(app, profile_output)
     app.mainloop()
\ No newline at end of file
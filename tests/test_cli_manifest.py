@@ -0,0 +1,49 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+import fitz
+
+import cli
+
+
+class ManifestValidationTest(unittest.TestCase):
+    """マニフェストの値の誤りを ManifestError として報告すること"""
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        doc = fitz.open()
+        for _ in range(2): doc.new_page()
+        doc.save(os.path.join(self.tmp, "a.pdf"))
+        doc.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def run_manifest(self, source):
+        path = os.path.join(self.tmp, "job.json")
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'output': "out.pdf", 'sources': [source]}, f)
+        return cli.run_job(path)
+
+    def test_landscape_must_be_bool(self):
+        result = self.run_manifest({'path': "a.pdf", 'landscape': "false"})
+        self.assertFalse(result['success'])
+        self.assertIn("'landscape'", result['error'])
+
+    def test_rotation_page_out_of_range(self):
+        for page in ("0", "3"):
+            result = self.run_manifest({'path': "a.pdf", 'rotations': {page: 90}})
+            self.assertFalse(result['success'])
+            self.assertIn("'rotations'", result['error'])
+
+    def test_valid_manifest(self):
+        result = self.run_manifest({'path': "a.pdf", 'landscape': False, 'rotations': {"2": 90}})
+        self.assertTrue(result['success'], result['error'])
+        self.assertEqual(result['pages'], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
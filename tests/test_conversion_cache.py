@@ -0,0 +1,82 @@
+import os
+import time
+import shutil
+import tempfile
+import unittest
+
+from utils import conversion_cache
+from utils.conversion_cache import ConversionCache
+
+
+class ConversionLeaseTest(unittest.TestCase):
+    """作業フォルダを共有する別のセッション (プロセス) が、使用中の変換結果を削除しないこと"""
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.workspace = os.path.join(self.tmp, "converted")
+        os.makedirs(self.workspace)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def make_cache(self, owner, max_bytes=10 * 1024):
+        cache = ConversionCache(self.workspace, max_bytes=max_bytes)
+        cache.owner = owner
+        return cache
+
+    def write(self, cache, name, size=4 * 1024, age=0):
+        """cache で変換結果を1件書き込む (age 秒前に使われたことにする)"""
+        output = os.path.join(self.workspace, name)
+        temp = cache.temp_path(output)
+        with open(temp, 'wb') as f: f.write(b'x' * size)
+        cache.commit(temp, output)
+        if age:
+            past = time.time() - age
+            os.utime(output, (past, past))
+        return output
+
+    def test_other_session_keeps_leased_entry(self):
+        gui = self.make_cache("gui")
+        cli = self.make_cache("cli")
+        kept = self.write(gui, "kept.pdf", age=3600)
+        for i in range(3): self.write(cli, f"job{i}.pdf")
+        self.assertTrue(os.path.exists(kept))
+
+    def test_released_entry_can_be_evicted(self):
+        gui = self.make_cache("gui")
+        cli = self.make_cache("cli")
+        old = self.write(gui, "old.pdf", age=3600)
+        gui.release(old)
+        cli.release()
+        for i in range(3):
+            self.write(cli, f"job{i}.pdf")
+            cli.release()
+        self.assertFalse(os.path.exists(old))
+
+    def test_stale_lease_expires(self):
+        crashed = self.make_cache("crashed")
+        cli = self.make_cache("cli")
+        old = self.write(crashed, "old.pdf", age=3600)
+        past = time.time() - conversion_cache.LEASE_TTL - 60
+        for lease in crashed._own_leases(): os.utime(lease, (past, past))
+        for i in range(3):
+            self.write(cli, f"job{i}.pdf")
+            cli.release()
+        self.assertFalse(os.path.exists(old))
+        self.assertEqual(crashed._own_leases(), [])
+
+    def test_lookup_takes_lease(self):
+        gui = self.make_cache("gui")
+        cli = self.make_cache("cli")
+        output = self.write(cli, "shared.pdf", age=3600)
+        cli.release()
+        self.assertEqual(gui.lookup(output), output)
+        os.utime(output, (time.time() - 3600,) * 2)
+        for i in range(3):
+            self.write(cli, f"job{i}.pdf")
+            cli.release()
+        self.assertTrue(os.path.exists(output))
+
+
+if __name__ == '__main__':
+    unittest.main()
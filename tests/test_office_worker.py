@@ -0,0 +1,157 @@
+import os
+import time
+import shutil
+import tempfile
+import unittest
+
+from utils import converters
+from utils import ingest
+from utils import office_worker
+from utils import pdf_ops
+from utils.conversion_cache import ConversionCache
+from utils.office_worker import OfficeWorker, FakeOfficeBackend
+
+
+class FlakyBackend(FakeOfficeBackend):
+    """最初に起動したインスタンスでの変換だけ失敗する"""
+    instances = 0
+
+    def start(self):
+        super().start()
+        FlakyBackend.instances += 1
+        self.flaky = FlakyBackend.instances == 1
+
+    def convert(self, source_path, output_path):
+        if self.flaky: raise RuntimeError("インスタンスが壊れています")
+        return super().convert(source_path, output_path)
+
+
+class OfficeWorkerTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.backends = []
+        FlakyBackend.instances = 0
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def make_worker(self, backend_class=FakeOfficeBackend, backend_args=None, **kwargs):
+        def factory():
+            backend = backend_class(**(backend_args or {}))
+            self.backends.append(backend)
+            return backend
+        worker = OfficeWorker(factory, **kwargs)
+        self.addCleanup(worker.shutdown)
+        return worker
+
+    def convert(self, worker, name):
+        source = os.path.join(self.tmp, name)
+        with open(source, 'w') as f: f.write(name)
+        output = os.path.join(self.tmp, name + ".pdf")
+        return worker.convert(source, output), output
+
+    def test_instance_stays_warm_between_conversions(self):
+        worker = self.make_worker()
+        for n in range(5):
+            ok, output = self.convert(worker, f"deck{n}.pptx")
+            self.assertTrue(ok)
+            self.assertTrue(os.path.getsize(output) > 0)
+        status = worker.status()
+        self.assertEqual(status['starts'], 1)
+        self.assertEqual(status['conversions'], 5)
+        self.assertTrue(status['running'])
+
+    def test_failed_conversion_restarts_and_retries_once(self):
+        worker = self.make_worker(FlakyBackend)
+        ok, output = self.convert(worker, "deck.pptx")
+        self.assertTrue(ok)
+        self.assertTrue(os.path.exists(output))
+        status = worker.status()
+        self.assertEqual((status['starts'], status['restarts'], status['failures']), (2, 1, 1))
+        self.assertFalse(self.backends[0].running)  # 失敗したインスタンスは終了している
+
+    def test_gives_up_after_retries(self):
+        worker = self.make_worker(backend_args={'fail_paths': ["broken.docx"]}, retries=1)
+        with self.assertRaises(RuntimeError):
+            self.convert(worker, "broken.docx")
+        self.assertFalse(os.path.exists(os.path.join(self.tmp, "broken.docx.pdf")))
+        self.assertEqual(worker.status()['failures'], 2)
+        # 失敗の後も次の依頼は処理できる
+        ok, _ = self.convert(worker, "fine.docx")
+        self.assertTrue(ok)
+
+    def test_health_check_restarts_crashed_instance(self):
+        worker = self.make_worker()
+        self.convert(worker, "first.docx")
+        self.backends[0].crash()
+        ok, _ = self.convert(worker, "second.docx")
+        self.assertTrue(ok)
+        status = worker.status()
+        self.assertEqual((status['starts'], status['restarts'], status['failures']), (2, 1, 0))
+
+    def test_idle_timeout_stops_instance_and_next_request_starts_it(self):
+        worker = self.make_worker(idle_timeout=0.1)
+        self.convert(worker, "first.docx")
+        deadline = time.monotonic() + 5
+        while worker.status()['thread'] and time.monotonic() < deadline:
+            time.sleep(0.02)
+        status = worker.status()
+        self.assertEqual(status['idle_stops'], 1)
+        self.assertFalse(status['running'])
+        self.assertFalse(status['thread'])
+        self.assertFalse(self.backends[0].running)
+
+        ok, _ = self.convert(worker, "second.docx")
+        self.assertTrue(ok)
+        self.assertEqual(worker.status()['starts'], 2)
+
+    def test_shutdown_rejects_new_requests(self):
+        worker = self.make_worker()
+        self.convert(worker, "first.docx")
+        worker.shutdown()
+        self.assertFalse(self.backends[0].running)
+        with self.assertRaises(RuntimeError):
+            self.convert(worker, "second.docx")
+
+
+class IngestOfficeTest(unittest.TestCase):
+    """取り込みでは Office 文書をこのプロセスの常駐ワーカーで変換し、取り込みをまたいで使い回すこと"""
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        workspace = os.path.join(self.tmp, "converted")
+        os.makedirs(workspace)
+        pdf_ops.set_conversion_cache(ConversionCache(workspace_dir=workspace))
+        self.saved = (converters._registry.get('docx'), converters._by_ext.get('.docx'))
+        converters.register('docx', ['.docx'], [], converters._office_converter('word'), resident=True)
+        office_worker.set_backend_factory('word', FakeOfficeBackend)
+
+    def tearDown(self):
+        office_worker.shutdown_all()
+        office_worker._factories.pop('word', None)
+        registry_backend, ext_backend = self.saved
+        if registry_backend is not None: converters._registry['docx'] = registry_backend
+        if ext_backend is not None: converters._by_ext['.docx'] = ext_backend
+        pdf_ops.set_conversion_cache(None)
+        pdf_ops.clear_info_cache()
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def write(self, name, text):
+        path = os.path.join(self.tmp, name)
+        with open(path, 'w') as f: f.write(text)
+        return path
+
+    def test_office_instance_is_reused_across_ingests(self):
+        for batch in range(2):
+            paths = [self.write(f"report{batch}_{n}.docx", f"{batch}-{n}") for n in range(2)]
+            paths += [self.write(f"notes{batch}_{n}.txt", f"notes {batch} {n}") for n in range(2)]
+            results = ingest.ingest_files(paths, max_workers=2)
+            self.assertEqual([r['error'] for r in results], [None] * 4)
+            self.assertTrue(all(r['pages'] == 1 for r in results))
+        status = office_worker.status()['word']
+        self.assertEqual(status['conversions'], 4)
+        self.assertEqual(status['starts'], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
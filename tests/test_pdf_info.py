@@ -0,0 +1,81 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import fitz
+
+from utils import pdf_ops
+
+
+class InheritedPageGeometryTest(unittest.TestCase):
+    """ページツリーの親から継承する MediaBox / CropBox / Rotate を正しく読むこと"""
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        pdf_ops.clear_info_cache()
+
+    def tearDown(self):
+        pdf_ops.clear_info_cache()
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def make_pdf(self, name, parent_keys, page_keys):
+        """/Pages に parent_keys、各ページに page_keys を設定した2ページのPDFを作る"""
+        path = os.path.join(self.tmp, name)
+        doc = fitz.open()
+        for _ in range(2): doc.new_page(width=595, height=842)
+        pages_xref = int(doc.xref_get_key(doc.pdf_catalog(), "Pages")[1].split()[0])
+        for key, value in parent_keys.items():
+            doc.xref_set_key(pages_xref, key, value)
+        for i in range(doc.page_count):
+            page_xref = doc.page_xref(i)
+            doc.xref_set_key(page_xref, "CropBox", "null")
+            for key, value in page_keys.items():
+                doc.xref_set_key(page_xref, key, value)
+        doc.save(path)
+        doc.close()
+        return path
+
+    def assert_matches_slow_path(self, path):
+        """ページ辞書を直接読む結果が、PyMuPDF のページ経由で読む結果と一致すること"""
+        details = pdf_ops.get_pdf_info(path)['page_details']
+        with fitz.open(path) as doc:
+            for i, page in enumerate(doc):
+                mediabox, cropbox, rotate = pdf_ops._page_geometry_slow(doc, i)
+                self.assertEqual(details[i]['mediabox'], mediabox)
+                self.assertEqual(details[i]['cropbox'], cropbox)
+                self.assertEqual(details[i]['rotate'], rotate)
+                self.assertEqual((details[i]['width'], details[i]['height']), (page.rect.width, page.rect.height))
+        return details
+
+    def test_cropbox_inherited_when_page_has_mediabox_and_rotate(self):
+        path = self.make_pdf("inherited_crop.pdf", {"CropBox": "[0 0 300 400]"},
+                             {"MediaBox": "[0 0 595 842]", "Rotate": "0"})
+        details = self.assert_matches_slow_path(path)
+        self.assertEqual(details[0]['cropbox'], (0, 0, 300, 400))
+        self.assertEqual((details[0]['width'], details[0]['height']), (300, 400))
+
+    def test_all_keys_inherited(self):
+        path = self.make_pdf("inherited_all.pdf", {"MediaBox": "[0 0 842 595]", "CropBox": "[0 0 400 300]",
+                                                   "Rotate": "90"},
+                             {"MediaBox": "null", "Rotate": "null"})
+        details = self.assert_matches_slow_path(path)
+        self.assertEqual((details[0]['width'], details[0]['height']), (300, 400))
+        self.assertTrue(details[0]['is_portrait'])
+
+    def test_inherited_cropbox_with_offset_origin(self):
+        path = self.make_pdf("offset.pdf", {"CropBox": "[50 60 300 400]"},
+                             {"MediaBox": "[10 20 610 862]", "Rotate": "270"})
+        details = self.assert_matches_slow_path(path)
+        self.assertEqual(details[0]['cropbox'], (50, 60, 300, 400))
+
+    def test_page_keys_override_parent(self):
+        path = self.make_pdf("override.pdf", {"CropBox": "[0 0 300 400]", "Rotate": "90"},
+                             {"MediaBox": "[0 0 595 842]", "CropBox": "[0 0 500 600]", "Rotate": "0"})
+        details = self.assert_matches_slow_path(path)
+        self.assertEqual(details[0]['cropbox'], (0, 0, 500, 600))
+        self.assertEqual(details[0]['rotate'], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,73 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import fitz
+
+from utils import pdf_ops
+
+
+class AnnotatedMergeTest(unittest.TestCase):
+    """同じ注釈を持つページを結合しても、注釈がページ間で共有されないこと"""
+
+    PAGES = 12
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.page_list = []
+        for n in range(self.PAGES):
+            path = os.path.join(self.tmp, f"annotated_{n}.pdf")
+            doc = fitz.open()
+            page = doc.new_page()
+            page.insert_text((72, 72), "hello")
+            page.add_text_annot((100, 100), "note")
+            page.insert_link({'kind': fitz.LINK_URI, 'from': fitz.Rect(72, 200, 200, 220), 'uri': "https://example.com"})
+            doc.save(path)
+            doc.close()
+            self.page_list.append({'path': path, 'page_index': 0, 'rotation': 0})
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def assert_annotations_not_shared(self, **kwargs):
+        output = os.path.join(self.tmp, "merged.pdf")
+        self.assertTrue(pdf_ops.merge_pdfs_securely(self.page_list, output, **kwargs))
+        with fitz.open(output) as doc:
+            self.assertEqual(doc.page_count, self.PAGES)
+            owners = {}
+            for page in doc:
+                xrefs = [xref for xref, _, _ in page.annot_xrefs()]
+                self.assertGreaterEqual(len(xrefs), 2)
+                for xref in xrefs:
+                    self.assertNotIn(xref, owners, f"注釈 {xref} が p{owners.get(xref)} と p{page.number} で共有されている")
+                    owners[xref] = page.number
+            self.assertEqual([len(list(page.annots(types=[fitz.PDF_ANNOT_TEXT]))) for page in doc], [1] * self.PAGES)
+            self.assertEqual([len(page.get_links()) for page in doc], [1] * self.PAGES)
+        with open(output, 'rb') as f:
+            self.assertNotIn(b"SecurePDFMergerKeep", f.read())
+
+    def test_fitz(self):
+        self.assert_annotations_not_shared()
+
+    def test_pypdf(self):
+        self.assert_annotations_not_shared(backend='pypdf')
+
+    def test_low_memory(self):
+        self.assert_annotations_not_shared(memory_budget_mb=64)
+
+    def test_shared_resources_are_still_deduplicated(self):
+        output = os.path.join(self.tmp, "merged.pdf")
+        plain = os.path.join(self.tmp, "plain.pdf")
+        self.assertTrue(pdf_ops.merge_pdfs_securely(self.page_list, output))
+        self.assertTrue(pdf_ops.merge_pdfs_securely(self.page_list, plain, options={'dedupe': False}))
+        with fitz.open(output) as merged, fitz.open(plain) as undeduped:
+            self.assertLess(_object_count(merged), _object_count(undeduped))
+
+
+def _object_count(doc):
+    return sum(1 for xref in range(1, doc.xref_length()) if doc.xref_object(xref) != 'null')
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,69 @@
+"""
+キャッシュ共通の補助関数
+
+・ファイル内容のハッシュ (パス + サイズ + 更新日時でメモ化)
+・キャッシュ保存先フォルダ (OSごとのユーザーキャッシュ領域)
+"""
+import os
+import sys
+import hashlib
+import threading
+
+_hash_memo = {}
+_hash_lock = threading.Lock()
+
+
+def content_hash(file_path, chunk_size=1024 * 1024):
+    """ファイル内容のハッシュ (同じ内容なら別パスでも同じ値)。読めなければ None"""
+    try:
+        key = os.path.abspath(file_path)
+        st = os.stat(key)
+    except OSError:
+        return None
+    memo_key = (key, st.st_size, st.st_mtime_ns)
+    with _hash_lock:
+        cached = _hash_memo.get(memo_key)
+    if cached: return cached
+
+    h = hashlib.blake2b(digest_size=16)
+    try:
+        with open(key, 'rb') as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk: break
+                h.update(chunk)
+    except OSError:
+        return None
+    digest = h.hexdigest()
+    with _hash_lock:
+        _hash_memo[memo_key] = digest
+    return digest
+
+
+def get_cache_dir(name):
+    """アプリ用のキャッシュフォルダ (なければ作成)"""
+    if sys.platform == "win32":
+        base = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~")
+        root = os.path.join(base, "SecurePDFMerger", "cache")
+    elif sys.platform == "darwin":
+        root = os.path.expanduser("~/Library/Caches/SecurePDFMerger")
+    else:
+        base = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+        root = os.path.join(base, "secure-pdf-merger")
+    path = os.path.join(root, name)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def dir_entries(path):
+    """フォルダ以下のファイルを (更新日時, サイズ, パス) のリストで返す"""
+    entries = []
+    for dirpath, _, filenames in os.walk(path):
+        for filename in filenames:
+            full = os.path.join(dirpath, filename)
+            try:
+                st = os.stat(full)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, full))
+    return entries
@@ -0,0 +1,206 @@
+"""
+変換済みPDFのキャッシュ (管理された作業フォルダ)
+
+convert_to_pdf の出力を「元ファイル内容のハッシュ + 変換器 + 向き + 変換器バージョン」を
+キーにした名前で作業フォルダに保存する。
+・別フォルダの同名ファイル (report.csv など) が互いに上書きし合わない
+・同じファイルの再追加や縦横の切り替えを繰り返しても、変換済みなら即座に返す
+・作業フォルダは容量上限を超えると、最近使われていないものから削除する
+
+作業フォルダは GUI・CLI・取り込みのワーカープロセスで共有するので、使っている変換結果には
+ディスク上のリース (.leases/<ファイル名>.<セッション>.lease) を置く。どのプロセスも、
+リースのある変換結果は削除しない。
+・lookup / commit で使った変換結果にはリースを取る。使い終わったら release() で返す
+  (CLI はジョブごと、GUI はリストと履歴から参照されなくなったとき、と終了時)
+・セッションの識別子は環境変数で子プロセスに引き継ぐので、ワーカーが取ったリースは親のものになる
+・異常終了したセッションのリースは、LEASE_TTL 秒更新されなければ無効になる
+  (長く開いている GUI は refresh() で定期的に更新する)
+"""
+import os
+import time
+import uuid
+import glob
+import tempfile
+import threading
+
+from utils.cache_utils import content_hash, get_cache_dir, dir_entries
+
+# 変換処理の出力が変わる修正をしたら、その変換器の番号を上げる (古いキャッシュは使われなくなる)
+CONVERTER_VERSIONS = {
+    'image': 1,
+    'text': 2,
+    'html': 2,
+    'table': 3,
+    'docx': 1,
+    'pptx': 1,
+}
+
+LEASE_DIR = ".leases"
+LEASE_TTL = 24 * 3600       # 秒。これより古いリースは異常終了したセッションのものとみなす
+LEASE_REFRESH = 3600        # 秒。長く続くセッションがリースを更新する間隔の目安
+OWNER_ENV = "SECURE_PDF_CACHE_OWNER"
+
+
+def session_owner():
+    """このセッションの識別子。ワーカープロセス (spawn) は環境変数から親と同じものを受け取る"""
+    owner = os.environ.get(OWNER_ENV)
+    if not owner:
+        owner = os.environ[OWNER_ENV] = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+    return owner
+
+
+class ConversionCache:
+    def __init__(self, workspace_dir=None, max_bytes=1024 * 1024 * 1024):
+        self.workspace_dir = workspace_dir or get_cache_dir("converted")
+        self.max_bytes = max_bytes
+        self.lease_dir = os.path.join(self.workspace_dir, LEASE_DIR)
+        self.owner = session_owner()
+        self._lock = threading.Lock()
+        self._disk_bytes = None
+        self._cleanup_stale_temp()
+
+    def output_path(self, source_path, converter, is_landscape, variant=None):
+        """variant: 同じ元ファイルから別の出力を作る場合の識別子 (テキストの変換範囲など)"""
+        file_hash = content_hash(source_path)
+        if file_hash is None: return None
+        version = CONVERTER_VERSIONS.get(converter, 0)
+        orientation = "L" if is_landscape else "P"
+        suffix = f"_{variant}" if variant else ""
+        return os.path.join(self.workspace_dir, f"{file_hash}_{converter}_v{version}_{orientation}{suffix}.pdf")
+
+    def lookup(self, output_path):
+        """変換済みならそのパスを返す (リースを取り、最終利用時刻も更新する)"""
+        if not output_path: return None
+        # 確かめてからリースを取ると、その間に他のプロセスに削除されうるので先に取る
+        self.use(output_path)
+        if os.path.exists(output_path) and os.path.getsize(output_path) > 0:
+            try: os.utime(output_path)
+            except OSError: pass
+            return output_path
+        self.release(output_path)
+        return None
+
+    def use(self, *paths):
+        """変換結果にこのセッションのリースを取る (すでにあれば更新する)。どのプロセスも削除しなくなる"""
+        for path in paths:
+            if not path: continue
+            lease = self._lease_path(os.path.basename(path))
+            try:
+                os.makedirs(self.lease_dir, exist_ok=True)
+                with open(lease, 'a'): pass
+                os.utime(lease)
+            except OSError:
+                pass
+
+    def release(self, *paths):
+        """paths (省略時はこのセッションのすべて) のリースを返し、削除対象に戻す"""
+        if paths:
+            leases = [self._lease_path(os.path.basename(p)) for p in paths if p]
+        else:
+            leases = self._own_leases()
+        for lease in leases: self.discard(lease)
+
+    def refresh(self):
+        """このセッションのリースを更新する (LEASE_TTL で無効にならないよう、長く続くセッションが呼ぶ)"""
+        for lease in self._own_leases():
+            try: os.utime(lease)
+            except OSError: pass
+
+    def _lease_path(self, name):
+        return os.path.join(self.lease_dir, f"{name}.{self.owner}.lease")
+
+    def _own_leases(self):
+        return glob.glob(os.path.join(glob.escape(self.lease_dir), f"*.{glob.escape(self.owner)}.lease"))
+
+    def _leased_names(self):
+        """有効なリースのある変換結果のファイル名。期限切れのリースはここで消す"""
+        names = set()
+        now = time.time()
+        try:
+            leases = os.scandir(self.lease_dir)
+        except OSError:
+            return names
+        with leases:
+            for entry in leases:
+                try:
+                    if now - entry.stat().st_mtime > LEASE_TTL:
+                        self.discard(entry.path)
+                        continue
+                except OSError:
+                    continue
+                names.add(entry.name.rsplit('.', 3)[0])  # <ファイル名>.<セッション>.lease
+        return names
+
+    def _is_leased(self, name):
+        pattern = os.path.join(glob.escape(self.lease_dir), f"{glob.escape(name)}.*.lease")
+        return bool(glob.glob(pattern))
+
+    def _entries(self):
+        prefix = self.lease_dir + os.sep
+        return [e for e in dir_entries(self.workspace_dir) if not e[2].startswith(prefix)]
+
+    def temp_path(self, output_path):
+        # 並列変換でも衝突しないよう、プロセス・スレッドごとに別名で書き出してから置き換える
+        base, ext = os.path.splitext(output_path)
+        return f"{base}.{os.getpid()}_{threading.get_ident()}.tmp{ext}"
+
+    def commit(self, temp_path, output_path):
+        """書き出し終わった一時ファイルを確定させる"""
+        if not os.path.exists(temp_path) or os.path.getsize(temp_path) == 0:
+            self.discard(temp_path)
+            return None
+        self.use(output_path)
+        if os.path.exists(output_path):
+            # 別のワーカーが先に同じ内容を変換し終えていた
+            self.discard(temp_path)
+            return output_path
+        os.replace(temp_path, output_path)
+        self._record_write(os.path.getsize(output_path))
+        return output_path
+
+    def discard(self, temp_path):
+        try: os.remove(temp_path)
+        except OSError: pass
+
+    def _record_write(self, size):
+        with self._lock:
+            if self._disk_bytes is None:
+                self._disk_bytes = sum(e[1] for e in self._entries())
+            else:
+                self._disk_bytes += size
+            if self._disk_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        target = int(self.max_bytes * 0.9)
+        entries = sorted(self._entries())
+        total = sum(e[1] for e in entries)
+        leased = self._leased_names()
+        for _, size, path in entries:
+            if total <= target: break
+            # 書き出し中の一時ファイル (古いものは _cleanup_stale_temp で消す) と、どこかのセッションが
+            # 使っているものは残す。一覧を取った後にリースを取ったプロセスがあるかもしれないので、消す直前にも確かめる
+            name = os.path.basename(path)
+            if name.endswith(".tmp.pdf") or name in leased or self._is_leased(name): continue
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+        self._disk_bytes = total
+
+    def _cleanup_stale_temp(self, max_age=24 * 3600):
+        """異常終了などで残った一時ファイルと、旧バージョンが一時フォルダに残した変換結果を削除する"""
+        now = time.time()
+        patterns = [
+            os.path.join(self.workspace_dir, "*.tmp.pdf"),
+            os.path.join(tempfile.gettempdir(), "converted_*_[LP].pdf"),
+        ]
+        for pattern in patterns:
+            for path in glob.glob(pattern):
+                try:
+                    if now - os.path.getmtime(path) > max_age:
+                        os.remove(path)
+                except OSError:
+                    pass
+
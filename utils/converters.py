@@ -0,0 +1,243 @@
+"""
+変換器のレジストリ
+
+拡張子ごとに、PDFへ変換する変換器 (Backend) を登録する。convert_to_pdf は拡張子から変換器を選ぶ。
+変換器が使うライブラリ (xhtml2pdf / reportlab / openpyxl / pandas / docx2pdf / comtypes) は、
+その変換器で初めて変換するときに読み込む。
+xhtml2pdf だけで起動時間の大半 (1秒近く) を占めていたので、GUI の起動時や
+PDF だけを結合するときにはこれらを読み込まない。
+
+status() は変換器ごとに次を返す:
+    ・available: 必要なライブラリが見つかり、このOSで使えるか (読み込まずに調べる)
+    ・loaded / import_seconds: 読み込み済みか、モジュールごとの読み込み時間
+      (他の変換器が先に読み込んだモジュール、たとえば reportlab はほぼ 0 になる)
+    ・error: 読み込みに失敗した理由
+
+Word / PowerPoint (Windows) は常駐ワーカー (utils/office_worker.py) で変換する。
+常駐ワーカーを使う変換器 (resident=True) は、取り込み (utils/ingest.py) でも子プロセスに渡さず
+このプロセスで変換する。子プロセスは取り込みごとに終わるので、そこで起動した Office は使い回せない。
+変換器を追加するときは register() を呼ぶ。出力が変わる修正をしたら、
+utils/conversion_cache.py の CONVERTER_VERSIONS も上げること。
+"""
+import io
+import sys
+import time
+import threading
+import importlib
+import importlib.util
+
+from utils import tracing
+from utils import office_worker
+
+_registry = {}   # 変換器名 -> Backend
+_by_ext = {}     # 拡張子 -> Backend
+
+
+def _module_exists(name):
+    # 親パッケージを読み込まずに調べるため、先頭の名前だけを探す
+    try: return importlib.util.find_spec(name.split('.')[0]) is not None
+    except (ImportError, ValueError): return False
+
+
+class Backend:
+    def __init__(self, name, extensions, modules, convert, extra_modules=None, platforms=None, resident=False):
+        """
+        modules: 初回の変換時に読み込むモジュール (この順に読み込み、時間を計る)
+        convert(source_path, output_path, is_landscape, text_window, cancel_token): 成功なら True
+        extra_modules: 拡張子ごとに追加で必要なモジュール ({'.xls': ('pandas',)} など)
+        platforms: 使える sys.platform の値 (None ならすべて)
+        resident: このプロセスの常駐ワーカーで変換する (取り込みで子プロセスに渡さない)
+        """
+        self.name = name
+        self.resident = resident
+        self.extensions = tuple(extensions)
+        self.modules = tuple(modules)
+        self.extra_modules = dict(extra_modules or {})
+        self.platforms = platforms
+        self.import_seconds = {}  # モジュール名 -> 読み込みにかかった秒数
+        self.error = None
+        self._convert = convert
+        self._found = {}
+        self._lock = threading.Lock()
+
+    def _modules_for(self, ext=None):
+        return self.modules + tuple(self.extra_modules.get(ext, ()))
+
+    def _exists(self, module):
+        if module not in self._found: self._found[module] = _module_exists(module)
+        return self._found[module]
+
+    def available(self, ext=None):
+        """ext の変換に必要なものが揃っているか (モジュールは読み込まない)"""
+        if self.error is not None: return False
+        if self.platforms is not None and sys.platform not in self.platforms: return False
+        return all(self._exists(m) for m in self._modules_for(ext))
+
+    @property
+    def loaded(self):
+        return all(m in self.import_seconds for m in self.modules)
+
+    def load(self, ext=None):
+        """必要なモジュールを読み込む (読み込み済みなら何もしない)。使えなければ False"""
+        modules = [m for m in self._modules_for(ext) if m not in self.import_seconds]
+        if not modules: return True
+        with self._lock:
+            if not self.available(ext): return False
+            with tracing.span('converter.load', converter=self.name, modules=",".join(modules)):
+                for module in modules:
+                    if module in self.import_seconds: continue
+                    t0 = time.perf_counter()
+                    try:
+                        importlib.import_module(module)
+                    except Exception as e:  # ImportError 以外 (読み込み時の初期化の失敗) もある
+                        self.error = f"{module}: {type(e).__name__}: {e}"
+                        tracing.report_error('converter.load', e, converter=self.name, module=module)
+                        return False
+                    self.import_seconds[module] = time.perf_counter() - t0
+        return True
+
+    def convert(self, source_path, output_path, is_landscape=False, text_window=None, cancel_token=None, ext=None):
+        if not self.load(ext): return False
+        return self._convert(source_path, output_path, is_landscape, text_window, cancel_token)
+
+    def status(self):
+        return {
+            'name': self.name,
+            'extensions': list(self.extensions),
+            'available': self.available(),
+            'unavailable_extensions': [ext for ext in self.extensions if not self.available(ext)],
+            'loaded': self.loaded,
+            'resident': self.resident,
+            'import_seconds': dict(self.import_seconds),
+            'error': self.error,
+        }
+
+
+def register(name, extensions, modules, convert, extra_modules=None, platforms=None, resident=False):
+    """変換器を登録する。同じ拡張子を持つ既存の登録は置き換える"""
+    backend = Backend(name, extensions, modules, convert, extra_modules, platforms, resident)
+    _registry[name] = backend
+    for ext in backend.extensions: _by_ext[ext] = backend
+    return backend
+
+
+def get(name):
+    return _registry.get(name)
+
+
+def for_extension(ext):
+    """ext を変換できる変換器 (使えない / 未登録なら None)"""
+    backend = _by_ext.get(ext)
+    if backend is None or not backend.available(ext): return None
+    return backend
+
+
+def is_resident(ext):
+    """ext をこのプロセスの常駐ワーカーで変換するか"""
+    backend = for_extension(ext)
+    return backend is not None and backend.resident
+
+
+def supported_extensions():
+    return sorted(ext for ext, backend in _by_ext.items() if backend.available(ext))
+
+
+def status(load=False):
+    """
+    全変換器の状態を返す。load=True なら使えるものを読み込んで読み込み時間を計る
+    (登録順に読み込むので、共有するモジュールの時間は先の変換器に計上される)
+    """
+    if load:
+        for backend in _registry.values():
+            for ext in (None,) + backend.extensions:
+                if backend.available(ext): backend.load(ext)
+    return [backend.status() for backend in _registry.values()]
+
+
+# --- 変換処理 (モジュールは Backend.load で読み込み済み) ---
+
+def _convert_image(source_path, output_path, is_landscape, text_window, cancel_token):
+    from PIL import Image
+    image = Image.open(source_path)
+    if image.mode != 'RGB': image = image.convert('RGB')
+    image.save(output_path, "PDF", resolution=100.0)
+    return True
+
+
+def _convert_text(source_path, output_path, is_landscape, text_window, cancel_token):
+    from utils.text_renderer import render_text_pdf
+    from utils.fonts import get_japanese_font_path, register_font, FALLBACK_FONT, JAPANESE_FONT_NAME
+    from utils.job_scheduler import JobCancelled
+    try:
+        # フォントの読み込みはプロセス内で初回だけ (utils/fonts.py)
+        font_name = JAPANESE_FONT_NAME
+        if not register_font(font_name, get_japanese_font_path()): font_name = FALLBACK_FONT
+        # 巨大なログでもメモリを使い切らないよう、1行ずつ読みながら描画する
+        return render_text_pdf(source_path, output_path, is_landscape, window=text_window, font_name=font_name,
+                               cancel_token=cancel_token)
+    except JobCancelled:
+        raise
+    except Exception as e:
+        tracing.report_error('text', e, path=source_path)
+        return False
+
+
+def _convert_table(source_path, output_path, is_landscape, text_window, cancel_token):
+    # 大きな表でもメモリを使い切らないよう、行を読みながら直接描画する
+    from utils.table_renderer import render_table_pdf
+    return render_table_pdf(source_path, output_path, is_landscape, cancel_token=cancel_token)
+
+
+def _convert_html(source_path, output_path, is_landscape, text_window, cancel_token):
+    from xhtml2pdf import pisa
+    from utils.fonts import get_html_font, FALLBACK_FONT
+    try:
+        with open(source_path, 'r', encoding='utf-8') as f: source_html = f.read()
+    except:
+        with open(source_path, 'r', encoding='cp932', errors='ignore') as f: source_html = f.read()
+    size_css = "size: A4 landscape;" if is_landscape else "size: A4 portrait;"
+    if "@page" not in source_html:
+         source_html = f"<style>@page {{ {size_css} }}</style>" + source_html
+    html_font = get_html_font()
+    if html_font != FALLBACK_FONT:
+        # 登録済みフォントを名前で参照する (@font-face だと xhtml2pdf が毎回フォントを読み直す)
+        css = f"<style>body {{ font-family: '{html_font}'; }}</style>"
+        if "<head>" in source_html: source_html = source_html.replace("<head>", f"<head>{css}")
+        else: source_html = f"{css}{source_html}"
+    with open(output_path, "wb") as f:
+        pisa.CreatePDF(io.StringIO(source_html), dest=f, encoding='utf-8')
+    return True
+
+
+def _office_converter(app):
+    def convert(source_path, output_path, is_landscape, text_window, cancel_token):
+        # Office はファイルごとに起動せず、常駐ワーカーのインスタンスを使い回す (utils/office_worker.py)
+        return office_worker.convert(app, source_path, output_path, cancel_token)
+    return convert
+
+
+def _convert_docx(source_path, output_path, is_landscape, text_window, cancel_token):
+    # Windows 以外 (macOS) は docx2pdf に任せる
+    from docx2pdf import convert as docx_convert
+    docx_convert(source_path, output_path)
+    return True
+
+
+register('image', ['.jpg', '.jpeg', '.png', '.bmp', '.gif', '.tiff', '.tif', '.eps', '.webp', '.ico'],
+         ['PIL.Image'], _convert_image)
+register('text', ['.txt', '.log', '.md', '.py', '.json', '.xml', '.js', '.css', '.rtf'],
+         ['reportlab', 'utils.fonts', 'utils.text_renderer'], _convert_text)
+register('html', ['.html', '.htm'], ['xhtml2pdf.pisa', 'utils.fonts'], _convert_html)
+register('table', ['.xlsx', '.xls', '.csv'], ['reportlab', 'utils.table_renderer'], _convert_table,
+         extra_modules={'.xlsx': ('openpyxl',), '.xls': ('pandas',)})
+if office_worker.uses_fake_backend():
+    # Office のない環境で Office 文書の変換経路を動かす (FakeOfficeBackend)
+    register('docx', ['.docx', '.doc'], [], _office_converter('word'), resident=True)
+    register('pptx', ['.pptx', '.ppt'], [], _office_converter('powerpoint'), resident=True)
+else:
+    if sys.platform == 'win32':
+        register('docx', ['.docx', '.doc'], ['comtypes.client'], _office_converter('word'), resident=True)
+    else:
+        register('docx', ['.docx', '.doc'], ['docx2pdf'], _convert_docx)
+    register('pptx', ['.pptx', '.ppt'], ['comtypes.client'], _office_converter('powerpoint'), platforms=('win32',),
+             resident=True)
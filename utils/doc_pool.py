@@ -0,0 +1,69 @@
+"""
+fitz.Document ハンドルのプール
+
+サムネイル・プレビュー描画のたびに fitz.open() するとページ数の多いファイルで
+毎回パースが走るため、開いたドキュメントをパス + 更新日時をキーにLRUで保持する。
+PyMuPDF はスレッドセーフではないので、ハンドルの利用は必ず document() の
+with ブロック内 (プールのロック保持中) で行うこと。
+"""
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import fitz  # PyMuPDF
+
+
+class DocumentPool:
+    def __init__(self, max_size=8):
+        self.max_size = max_size
+        self.lock = threading.RLock()
+        self._docs = OrderedDict()  # abspath -> (mtime_ns, size, doc)
+
+    @contextmanager
+    def document(self, file_path):
+        """開いた fitz.Document を返す (ロック保持中のみ有効)"""
+        with self.lock:
+            yield self._acquire(file_path)
+
+    def _acquire(self, file_path):
+        key = os.path.abspath(file_path)
+        st = os.stat(key)
+        entry = self._docs.get(key)
+        if entry is not None:
+            mtime_ns, size, doc = entry
+            if mtime_ns == st.st_mtime_ns and size == st.st_size and not doc.is_closed:
+                self._docs.move_to_end(key)
+                return doc
+            # ファイルが書き換えられていれば古いハンドルは破棄
+            self._close_entry(key)
+
+        doc = fitz.open(key)
+        self._docs[key] = (st.st_mtime_ns, st.st_size, doc)
+        while len(self._docs) > self.max_size:
+            oldest = next(iter(self._docs))
+            self._close_entry(oldest)
+        return doc
+
+    def _close_entry(self, key):
+        entry = self._docs.pop(key, None)
+        if entry is None: return
+        try: entry[2].close()
+        except Exception: pass
+
+    def invalidate(self, file_path):
+        """ファイルを上書き・削除する前に呼び、開いているハンドルを閉じる"""
+        with self.lock:
+            self._close_entry(os.path.abspath(file_path))
+
+    def close_all(self):
+        with self.lock:
+            for key in list(self._docs):
+                self._close_entry(key)
+
+    def __len__(self):
+        return len(self._docs)
+
+
+# サムネイル・プレビューで共有するプロセス全体のプール
+shared_pool = DocumentPool()
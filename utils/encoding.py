@@ -0,0 +1,26 @@
+"""
+テキストファイルの文字コード判定
+
+ファイル全体を読んで失敗したら別の文字コードで読み直すのではなく、
+先頭の一部だけを読んで1回で判定する。
+"""
+import codecs
+
+CANDIDATES = ['utf-8', 'cp932']
+
+
+def detect_encoding(file_path, sample_size=64 * 1024):
+    with open(file_path, 'rb') as f:
+        sample = f.read(sample_size)
+    if sample.startswith(codecs.BOM_UTF8):
+        return 'utf-8-sig'
+    if sample.startswith(codecs.BOM_UTF16_LE) or sample.startswith(codecs.BOM_UTF16_BE):
+        return 'utf-16'
+    for encoding in CANDIDATES:
+        try:
+            # サンプル末尾でマルチバイト文字が切れている場合は無視する
+            codecs.getincrementaldecoder(encoding)().decode(sample, final=False)
+            return encoding
+        except UnicodeDecodeError:
+            continue
+    return 'cp932'
@@ -0,0 +1,76 @@
+"""
+フォントの登録 (プロセス内で1回だけ)
+
+msgothic.ttc / meiryo.ttc などの大きなフォントファイルは読み込み (パース) が重いため、
+変換のたびに registerFont せず、プロセスごとに最初の1回だけ登録して使い回す。
+ワーカープロセスでも、プロセスが生きている間は同じ登録を使い回す。
+埋め込み時は reportlab が使った文字だけのサブセットを作るので、出力にフォント全体は入らない。
+"""
+import os
+import platform
+import threading
+import functools
+
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+
+from utils import tracing
+
+JAPANESE_FONT_NAME = "JapaneseFont"
+FALLBACK_FONT = "Helvetica"
+
+_lock = threading.Lock()
+_registered = {}  # font_name -> 登録できたか (失敗も覚えておき、再試行しない)
+
+
+@functools.lru_cache(maxsize=1)
+def get_japanese_font_path():
+    system = platform.system()
+    candidates = []
+    if system == "Windows":
+        candidates = [r"C:\Windows\Fonts\msgothic.ttc", r"C:\Windows\Fonts\meiryo.ttc", r"C:\Windows\Fonts\msmincho.ttc"]
+    elif system == "Darwin":
+        candidates = ["/System/Library/Fonts/Hiragino Sans GB.ttc", "/System/Library/Fonts/AppleGothic.ttf"]
+    else:
+        candidates = ["/usr/share/fonts/opentype/ipafont-gothic/ipag.ttf"]
+
+    for path in candidates:
+        if os.path.exists(path): return path.replace('\\', '/')
+    return None
+
+
+def register_font(font_name, font_path):
+    """フォントを登録する (2回目以降は何もしない)。使えるなら True"""
+    with _lock:
+        if font_name in _registered:
+            return _registered[font_name]
+        ok = False
+        if font_path:
+            try:
+                # TTC は先頭のフォントを使う。サブセット化は reportlab の既定動作に任せる
+                pdfmetrics.registerFont(TTFont(font_name, font_path, subfontIndex=0))
+                ok = True
+            except Exception as e:
+                tracing.report_error('font', e, path=font_path)
+        _registered[font_name] = ok
+        return ok
+
+
+def get_text_font():
+    """本文用のフォント名 (日本語フォントが使えなければ Helvetica)"""
+    if register_font(JAPANESE_FONT_NAME, get_japanese_font_path()):
+        return JAPANESE_FONT_NAME
+    return FALLBACK_FONT
+
+
+def get_html_font():
+    """
+    xhtml2pdf 用のフォント名。
+    @font-face で指定すると xhtml2pdf が変換のたびにフォントを読み直すため、
+    登録済みのフォントを font-family 名から直接引けるようにしておく。
+    """
+    font_name = get_text_font()
+    if font_name != FALLBACK_FONT:
+        from xhtml2pdf.default import DEFAULT_FONT
+        DEFAULT_FONT.setdefault(font_name.lower(), font_name)
+    return font_name
@@ -0,0 +1,48 @@
+"""
+ページグリッドの配置計算
+
+仮想化グリッド用に、ページ数と列数だけから各セルの位置・全体の高さ・
+表示範囲に入る行を求める (ウィジェットには依存しない)。
+"""
+import math
+
+
+class GridLayout:
+    def __init__(self, count, available_width, item_w, item_h, pad=7, width_ratio=0.52):
+        self.count = count
+        self.item_w = item_w
+        self.item_h = item_h
+        self.pad = pad
+        self.cell_w = item_w + pad * 2
+        self.cell_h = item_h + pad * 2
+        # スケーリング分を見込んで、実幅の一部だけを使って列数を決める (従来の計算と同じ)
+        usable_width = available_width * width_ratio
+        self.columns = max(1, int(usable_width // (item_w + 15)))
+        self.rows = math.ceil(count / self.columns) if count else 0
+
+    @property
+    def total_height(self):
+        return self.rows * self.cell_h
+
+    @property
+    def total_width(self):
+        return self.columns * self.cell_w
+
+    def row_col(self, index):
+        return divmod(index, self.columns)
+
+    def position(self, index):
+        """セル左上の座標 (x, y)"""
+        r, c = self.row_col(index)
+        return c * self.cell_w + self.pad, r * self.cell_h + self.pad
+
+    def visible_indexes(self, top_fraction, bottom_fraction, overscan_rows=1):
+        """yview() の表示範囲 (0.0〜1.0) から、描画すべきページ番号の range を返す"""
+        if not self.rows: return range(0)
+        first_row = max(0, int(math.floor(top_fraction * self.rows)) - overscan_rows)
+        last_row = min(self.rows - 1, int(math.ceil(bottom_fraction * self.rows)) + overscan_rows)
+        return range(first_row * self.columns, min(self.count, (last_row + 1) * self.columns))
+
+    def is_overscan(self, index, top_fraction, bottom_fraction):
+        r, _ = self.row_col(index)
+        return r < math.floor(top_fraction * self.rows) or r >= math.ceil(bottom_fraction * self.rows)
@@ -0,0 +1,207 @@
+"""
+編集履歴 (Undo/Redo)
+
+操作のたびにページリスト全体をディープコピーするのではなく、
+「何をしたか」と「どう戻すか」だけを操作ログとして記録する。
+履歴のメモリ量は各操作の大きさに比例し、ジョブ全体の大きさには依存しない。
+各操作は記録時点で既に pages に適用済みであること。
+"""
+from collections import deque
+
+
+class EditOperation:
+    def apply(self, pages):
+        raise NotImplementedError
+
+    def revert(self, pages):
+        raise NotImplementedError
+
+    @property
+    def cost(self):
+        """履歴のメモリ見積もり (保持しているページ数相当)"""
+        return 1
+
+    def sources(self):
+        """この操作が保持しているページの SourceRecord (Undo / Redo で戻りうるもの)"""
+        return ()
+
+
+class InsertPages(EditOperation):
+    def __init__(self, position, items):
+        self.position = position
+        self.items = list(items)
+
+    def apply(self, pages):
+        pages[self.position:self.position] = self.items
+
+    def revert(self, pages):
+        del pages[self.position:self.position + len(self.items)]
+
+    @property
+    def cost(self):
+        return len(self.items)
+
+    def sources(self):
+        return (item.source for item in self.items)
+
+
+class RemovePages(EditOperation):
+    def __init__(self, pages, indexes):
+        """削除前の pages と削除する位置から、連続区間ごとに削除内容を記録する"""
+        self.runs = []  # (開始位置, [item, ...])
+        for index in sorted(set(indexes)):
+            if self.runs and self.runs[-1][0] + len(self.runs[-1][1]) == index:
+                self.runs[-1][1].append(pages[index])
+            else:
+                self.runs.append((index, [pages[index]]))
+
+    def apply(self, pages):
+        for start, items in reversed(self.runs):
+            del pages[start:start + len(items)]
+
+    def revert(self, pages):
+        for start, items in self.runs:
+            pages[start:start] = items
+
+    @property
+    def cost(self):
+        return sum(len(items) for _, items in self.runs)
+
+    def sources(self):
+        return (item.source for _, items in self.runs for item in items)
+
+
+class RotatePages(EditOperation):
+    def __init__(self, indexes, delta=90):
+        """indexes が None なら全ページ"""
+        self.indexes = None if indexes is None else list(indexes)
+        self.delta = delta
+
+    def _rotate(self, pages, delta):
+        targets = range(len(pages)) if self.indexes is None else self.indexes
+        for i in targets:
+            pages[i].rotation = (pages[i].rotation + delta) % 360
+
+    def apply(self, pages):
+        self._rotate(pages, self.delta)
+
+    def revert(self, pages):
+        self._rotate(pages, -self.delta)
+
+    @property
+    def cost(self):
+        return 1 if self.indexes is None else max(1, len(self.indexes))
+
+
+class MovePages(EditOperation):
+    def __init__(self, start, count, dest):
+        """pages[start:start+count] を取り除いた後のリストの dest の位置へ移動する"""
+        self.start = start
+        self.count = count
+        self.dest = dest
+
+    @staticmethod
+    def _move(pages, start, count, dest):
+        block = pages[start:start + count]
+        del pages[start:start + count]
+        pages[dest:dest] = block
+
+    def apply(self, pages):
+        self._move(pages, self.start, self.count, self.dest)
+
+    def revert(self, pages):
+        self._move(pages, self.dest, self.count, self.start)
+
+
+class UpdatePages(EditOperation):
+    def __init__(self, changes):
+        """changes: [(index, 変更前の属性値 dict, 変更後の属性値 dict), ...]"""
+        self.changes = list(changes)
+
+    def apply(self, pages):
+        for index, _, new_values in self.changes:
+            pages[index].update(new_values)
+
+    def revert(self, pages):
+        for index, old_values, _ in self.changes:
+            pages[index].update(old_values)
+
+    @property
+    def cost(self):
+        return max(1, len(self.changes))
+
+    def sources(self):
+        return (values['source'] for _, old_values, new_values in self.changes
+                for values in (old_values, new_values) if 'source' in values)
+
+
+class CompositeOperation(EditOperation):
+    """ドラッグ中の連続した移動など、複数の操作を1回分の履歴としてまとめる"""
+    def __init__(self, operations):
+        self.operations = list(operations)
+
+    def apply(self, pages):
+        for op in self.operations:
+            op.apply(pages)
+
+    def revert(self, pages):
+        for op in reversed(self.operations):
+            op.revert(pages)
+
+    @property
+    def cost(self):
+        return sum(op.cost for op in self.operations)
+
+    def sources(self):
+        return (source for op in self.operations for source in op.sources())
+
+
+class EditHistory:
+    def __init__(self, max_depth=200, max_cost=500_000):
+        self.max_depth = max_depth   # 保持する操作数の上限
+        self.max_cost = max_cost     # 保持するページ参照数の上限 (メモリ予算)
+        self.undo_stack = deque()
+        self.redo_stack = []
+        self.total_cost = 0
+
+    def record(self, op):
+        """適用済みの操作を記録する (redo は破棄)"""
+        self.total_cost -= sum(o.cost for o in self.redo_stack)
+        self.redo_stack.clear()
+        self.undo_stack.append(op)
+        self.total_cost += op.cost
+        self._trim()
+
+    def _trim(self):
+        # 古い操作から捨てる (最新の1件は予算を超えていても残す)
+        while len(self.undo_stack) > 1 and (len(self.undo_stack) > self.max_depth or self.total_cost > self.max_cost):
+            self.total_cost -= self.undo_stack.popleft().cost
+
+    def undo(self, pages):
+        if not self.undo_stack: return False
+        op = self.undo_stack.pop()
+        op.revert(pages)
+        self.redo_stack.append(op)
+        return True
+
+    def redo(self, pages):
+        if not self.redo_stack: return False
+        op = self.redo_stack.pop()
+        op.apply(pages)
+        self.undo_stack.append(op)
+        return True
+
+    def sources(self):
+        """履歴 (Undo / Redo の両方) が参照している SourceRecord の集合"""
+        return {source for op in (*self.undo_stack, *self.redo_stack) for source in op.sources()}
+
+    def can_undo(self):
+        return bool(self.undo_stack)
+
+    def can_redo(self):
+        return bool(self.redo_stack)
+
+    def clear(self):
+        self.undo_stack.clear()
+        self.redo_stack.clear()
+        self.total_cost = 0
@@ -0,0 +1,147 @@
+"""
+ファイル取り込みの並列処理
+
+選択されたファイルの変換 (convert_to_pdf) と解析 (get_pdf_info) を
+プロセスプールで同時に実行する。結果は選択順に並べて返し、
+1件終わるごとに on_progress で進捗 (成功/失敗と理由) を通知する。
+トレースの記録中は、ワーカーで記録したスパンを結果と一緒に受け取って取り込む。
+cancel_token がキャンセルされると、未着手のファイルを取り消して JobCancelled で抜ける
+(ワーカーで変換中のファイルは、そのワーカーで最後まで処理される)。
+Office 文書 (常駐ワーカーで変換するもの。utils/converters.py の resident) はワーカープロセスに渡さず、
+他のファイルをワーカーが処理している間にこのプロセスで変換する。ワーカープロセスは取り込みごとに
+終わるので、そこで Office を起動すると取り込みのたびに起動し直すことになる。
+"""
+import os
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from utils import pdf_ops
+from utils import tracing
+from utils import converters
+from utils import conversion_cache
+from utils.job_scheduler import JobCancelled, check_cancelled
+from utils.cache_utils import content_hash
+
+
+def default_workers():
+    return max(1, min(4, (os.cpu_count() or 2) - 1))
+
+
+def ingest_file(path, is_landscape=False, trace=False, cancel_token=None):
+    """
+    1ファイル分の変換・解析 (ワーカープロセスで実行される)。
+    trace=True ならワーカーで記録したスパンを result['trace'] に入れて返す。
+    cancel_token はワーカープロセスへは渡せないので、その場で処理するときだけ使う。
+    """
+    if trace: tracing.enable()
+    started = time.perf_counter()
+    result = {
+        'path': path,
+        'filename': os.path.basename(path),
+        'final_path': None,
+        'is_generated': False,
+        'pages': 0,
+        'page_details': [],
+        'content_hash': None,
+        'error': None,
+        'elapsed': 0.0,
+    }
+    try:
+        with tracing.span('ingest', path=path) as span:
+            _ingest(path, is_landscape, cancel_token, result)
+            span.set(pages=result['pages'], error=result['error'])
+    except JobCancelled:
+        raise
+    except Exception as e:
+        result['error'] = str(e) or e.__class__.__name__
+    finally:
+        result['elapsed'] = time.perf_counter() - started
+        if trace: result['trace'] = tracing.drain()
+    return result
+
+
+def _ingest(path, is_landscape, cancel_token, result):
+    final_path = path
+    if not path.lower().endswith('.pdf'):
+        converted = pdf_ops.convert_to_pdf(path, is_landscape=is_landscape, cancel_token=cancel_token)
+        if not converted or not os.path.exists(converted):
+            result['error'] = "変換できない形式か、変換に失敗しました"
+            return
+        final_path = converted
+        result['is_generated'] = True
+
+    info = pdf_ops.get_pdf_info(final_path)
+    if not info:
+        result['error'] = "PDFとして読み込めませんでした"
+        return
+    result['final_path'] = final_path
+    result['pages'] = info['pages']
+    result['page_details'] = info.get('page_details', [])
+    result['content_hash'] = content_hash(final_path)
+
+
+def ingest_files(paths, max_workers=None, on_progress=None, cancel_token=None):
+    """
+    複数ファイルを並列に取り込み、選択順の結果リストを返す。
+    on_progress(done, total, result) は完了順に呼ばれる。
+    """
+    paths = list(paths)
+    total = len(paths)
+    results = [None] * total
+    max_workers = max_workers or default_workers()
+
+    def report(done, result):
+        if on_progress:
+            on_progress(done, total, result)
+
+    # Office 文書はこのプロセスの常駐ワーカーで変換する。残りが1件だけ、またはワーカー1つなら
+    # プロセス起動のコストを払わずにその場で処理する
+    remote = [i for i, path in enumerate(paths) if not converters.is_resident(os.path.splitext(path)[1].lower())]
+    if len(remote) <= 1 or max_workers <= 1: remote = []
+    local = sorted(set(range(total)) - set(remote))
+
+    executor = None
+    futures = {}
+    cancelled = False
+    done = 0
+    try:
+        if remote:
+            # ワーカーが変換キャッシュに取るリースをこのセッションのものにするため、識別子を先に決めて環境変数で渡す
+            conversion_cache.session_owner()
+            # fork だと、他のスレッドが握っていたロック (shared_pool.lock など) を子が引き継いで固まりうる
+            executor = ProcessPoolExecutor(max_workers=min(max_workers, len(remote)),
+                                           mp_context=multiprocessing.get_context('spawn'))
+            trace = tracing.is_enabled()
+            futures = {executor.submit(ingest_file, paths[i], False, trace): i for i in remote}
+        # ワーカーが処理している間に、このプロセスで処理するものを片付ける
+        for i in local:
+            check_cancelled(cancel_token)
+            results[i] = ingest_file(paths[i], cancel_token=cancel_token)
+            done += 1
+            report(done, results[i])
+        pending = set(futures)
+        while pending:
+            # キャンセルに気付けるよう、完了を待つ間も定期的に確認する
+            finished, pending = wait(pending, timeout=0.2, return_when=FIRST_COMPLETED)
+            check_cancelled(cancel_token)
+            for future in finished:
+                i = futures[future]
+                try:
+                    results[i] = future.result()
+                    tracing.absorb(results[i].pop('trace', None))
+                except Exception as e:
+                    # ワーカープロセス自体が落ちた場合など
+                    results[i] = {'path': paths[i], 'filename': os.path.basename(paths[i]),
+                                  'error': str(e) or e.__class__.__name__, 'pages': 0, 'elapsed': 0.0}
+                done += 1
+                report(done, results[i])
+    except JobCancelled:
+        cancelled = True
+        raise
+    finally:
+        # キャンセル時は変換中のワーカーを待たずに戻る
+        if executor is not None: executor.shutdown(wait=not cancelled, cancel_futures=cancelled)
+    # ワーカーが取ったリースはセッションごとのものなので、ここで取り直す必要はない。念のため更新だけしておく
+    pdf_ops.get_conversion_cache().use(*(r.get('final_path') for r in results if r.get('is_generated')))
+    return results
@@ -0,0 +1,199 @@
+"""
+バックグラウンド処理のスケジューラー
+
+GUI のバックグラウンド処理 (プレビューの描画・縦横変換・ファイル取り込み・結合) を
+処理ごとにスレッドを立てずに、上限付きのワーカースレッドで優先度順に実行する。
+
+・優先度: プレビュー > 縦横変換などの操作 > 取り込み・結合 (数値が小さいほど先)
+・キャンセル: 各ジョブは CancelToken を受け取る。pdf_ops の長いループ (結合の範囲ごと、
+  テキスト / 表の描画のページごとなど) で確認され、キャンセルされると JobCancelled で抜ける
+・置き換え: 同じ key のジョブを投入すると、古いジョブはキャンセルされる
+  (プレビューの先読みは新しい依頼だけが残る)
+・ワーカーのうち reserved 個はプレビュー専用に空けておく (取り込みや結合が長引いても、
+  プレビューは待たされない)
+・完了通知 (on_done / on_error) は dispatch 経由で呼ぶ。Tk では after(0, ...) を渡して
+  UIスレッドで受け取る。キャンセルされたジョブは通知しない
+
+サムネイルはプロセスプールで描画するため、utils/thumb_renderer.py が別に優先度を管理する。
+"""
+import heapq
+import itertools
+import threading
+import time
+
+from utils import tracing
+
+PRIORITY_PREVIEW = 0      # 表示中のプレビュー
+PRIORITY_INTERACTIVE = 1  # 縦横変換など、ユーザーが結果を待っている操作
+PRIORITY_BACKGROUND = 2   # ファイル取り込み・結合
+
+
+class JobCancelled(Exception):
+    """キャンセルされた処理が途中で抜けるときに送出される"""
+
+
+class CancelToken:
+    __slots__ = ('_event',)
+
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def check(self):
+        if self._event.is_set(): raise JobCancelled()
+
+
+def check_cancelled(token):
+    """token が None (キャンセルできない呼び出し) なら何もしない"""
+    if token is not None and token.cancelled: raise JobCancelled()
+
+
+class Job:
+    __slots__ = ('fn', 'args', 'priority', 'key', 'name', 'on_done', 'on_error', 'token', 'submitted')
+
+    def __init__(self, fn, args, priority, key, name, on_done, on_error):
+        self.fn = fn
+        self.args = args
+        self.priority = priority
+        self.key = key
+        self.name = name or getattr(fn, '__name__', 'job')
+        self.on_done = on_done
+        self.on_error = on_error
+        self.token = CancelToken()
+        self.submitted = time.perf_counter()
+
+    def cancel(self):
+        self.token.cancel()
+
+    @property
+    def cancelled(self):
+        return self.token.cancelled
+
+
+class JobScheduler:
+    def __init__(self, max_workers=3, reserved=1, dispatch=None):
+        """
+        reserved: PRIORITY_PREVIEW のジョブのために空けておくワーカー数
+        dispatch(callback, *args): 完了通知を UIスレッドへ渡す関数。
+                                   None ならワーカースレッドでそのまま呼ぶ
+        """
+        self.max_workers = max_workers
+        self.background_limit = max(1, max_workers - reserved)
+        self.dispatch = dispatch
+
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._queue = []    # (priority, seq, Job)
+        self._keyed = {}    # key -> 待機中 / 実行中の Job
+        self._running = set()
+        self._background_running = 0
+        self._workers = []
+        self._idle = 0
+        self._counter = itertools.count()
+        self._closed = False
+
+    def submit(self, fn, *args, priority=PRIORITY_BACKGROUND, key=None, name=None, on_done=None, on_error=None):
+        """
+        fn(token, *args) をワーカーで実行し、Job を返す。
+        on_done(結果) / on_error(例外) は dispatch 経由で呼ばれる (on_error がなければエラーを報告するだけ)。
+        key が同じジョブが待機中 / 実行中なら、それをキャンセルして置き換える。
+        """
+        job = Job(fn, args, priority, key, name, on_done, on_error)
+        with self._lock:
+            if self._closed:
+                job.cancel()
+                return job
+            if key is not None:
+                old = self._keyed.get(key)
+                if old is not None: old.cancel()
+                self._keyed[key] = job
+            heapq.heappush(self._queue, (priority, next(self._counter), job))
+            if self._idle == 0 and len(self._workers) < self.max_workers:
+                worker = threading.Thread(target=self._worker, name=f"job-worker-{len(self._workers)}", daemon=True)
+                self._workers.append(worker)
+                worker.start()
+            self._wakeup.notify()
+        return job
+
+    def cancel(self, key):
+        """key のジョブをキャンセルする"""
+        with self._lock:
+            job = self._keyed.get(key)
+        if job is not None: job.cancel()
+
+    def cancel_all(self):
+        with self._lock:
+            jobs = [entry[2] for entry in self._queue] + list(self._running)
+            self._queue = []
+            self._keyed.clear()
+        for job in jobs: job.cancel()
+
+    def shutdown(self):
+        """全ジョブをキャンセルしてワーカーを止める (実行中のジョブはキャンセルの確認で抜ける)"""
+        self.cancel_all()
+        with self._lock:
+            self._closed = True
+            self._wakeup.notify_all()
+
+    def _runnable(self):
+        # キューの先頭がプレビュー以外なら、予約分を残して空いているワーカーがあるときだけ実行する
+        # (プレビューのジョブがあれば必ず先頭に来る)
+        while self._queue and self._queue[0][2].cancelled:
+            self._forget(heapq.heappop(self._queue)[2])
+        if not self._queue: return False
+        return self._queue[0][0] <= PRIORITY_PREVIEW or self._background_running < self.background_limit
+
+    def _next_job(self):
+        with self._lock:
+            while not self._runnable() and not self._closed:
+                self._idle += 1
+                self._wakeup.wait()
+                self._idle -= 1
+            if self._closed: return None
+            job = heapq.heappop(self._queue)[2]
+            self._running.add(job)
+            if job.priority > PRIORITY_PREVIEW: self._background_running += 1
+            return job
+
+    def _forget(self, job):
+        if job.key is not None and self._keyed.get(job.key) is job:
+            del self._keyed[job.key]
+
+    def _worker(self):
+        while True:
+            job = self._next_job()
+            if job is None: return
+            result = error = None
+            wait_ms = (time.perf_counter() - job.submitted) * 1000
+            with tracing.span(f"job.{job.name}", priority=job.priority, wait_ms=round(wait_ms, 1)) as span:
+                try:
+                    result = job.fn(job.token, *job.args)
+                except JobCancelled:
+                    pass
+                except Exception as e:
+                    error = e
+                span.set(cancelled=job.cancelled)
+            with self._lock:
+                self._running.discard(job)
+                if job.priority > PRIORITY_PREVIEW: self._background_running -= 1
+                self._forget(job)
+                self._wakeup.notify()  # 予約分の制限で待っていたジョブを動かす
+            if job.cancelled: continue
+            if error is not None:
+                if job.on_error: self._notify(job.on_error, error)
+                else: tracing.report_error(f"job.{job.name}", error)
+            elif job.on_done:
+                self._notify(job.on_done, result)
+
+    def _notify(self, callback, *args):
+        try:
+            if self.dispatch: self.dispatch(callback, *args)
+            else: callback(*args)
+        except RuntimeError:
+            pass  # UI の終了処理中
@@ -0,0 +1,19 @@
+"""
+リスト表示の差分計算
+
+編集のたびに全ウィジェットを作り直さず、前回描画した時のキー列と
+今回のキー列を比べて、作り直し/書き換えが必要な位置だけを求める。
+"""
+
+
+def changed_indexes(old_keys, new_keys):
+    """
+    (changed, removed) を返す。
+    changed: 書き換えが必要な位置 (新規に増えた位置を含む)
+    removed: 末尾で不要になった位置の range
+    """
+    common = min(len(old_keys), len(new_keys))
+    changed = [i for i in range(common) if old_keys[i] != new_keys[i]]
+    changed.extend(range(common, len(new_keys)))
+    removed = range(len(new_keys), len(old_keys))
+    return changed, removed
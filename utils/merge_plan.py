@@ -0,0 +1,72 @@
+"""
+結合計画 (連続したページ範囲へのまとめ)
+
+結合するページのリストを「同じファイル・連続したページ番号・同じ回転」の範囲 (MergeRun) に
+まとめる。「A の全ページ、続いて B の全ページ」のような結合は数個の範囲になり、
+PyMuPDF の insert_pdf で範囲ごとに一括コピーできる。
+"""
+
+
+class MergeRun:
+    """source_path の start 〜 end ページ (0始まり・両端を含む) を rotation 度回して追加する"""
+    __slots__ = ('path', 'start', 'end', 'rotation')
+
+    def __init__(self, path, start, end, rotation=0):
+        self.path = path
+        self.start = start
+        self.end = end
+        self.rotation = rotation
+
+    @property
+    def count(self):
+        return self.end - self.start + 1
+
+    def __repr__(self):
+        return f"MergeRun({self.path!r}, {self.start}-{self.end}, rot={self.rotation})"
+
+
+def plan_merge_runs(page_list, page_count=None):
+    """
+    page_list (path / page_index / rotation を持つ項目) を MergeRun のリストにまとめる。
+    page_count(path) を渡すと、範囲外のページ番号の項目は読み飛ばす。
+    """
+    runs = []
+    counts = {}
+    last = None
+    for item in page_list:
+        path = item['path']
+        index = item['page_index']
+        rotation = item.get('rotation', 0) % 360
+        if page_count is not None:
+            if path not in counts: counts[path] = page_count(path)
+            if not 0 <= index < counts[path]: continue
+        if last is not None and last.path == path and last.end + 1 == index and last.rotation == rotation:
+            last.end = index
+            continue
+        last = MergeRun(path, index, index, rotation)
+        runs.append(last)
+    return runs
+
+
+def split_into_segments(runs, segment_pages):
+    """
+    runs を segment_pages ページ以下のまとまり (セグメント) に分ける。
+    セグメントの境目をまたぐ範囲は2つに分割する。
+    """
+    segments = []
+    current = []
+    filled = 0
+    for run in runs:
+        start = run.start
+        while start <= run.end:
+            take = min(run.end - start + 1, segment_pages - filled)
+            current.append(MergeRun(run.path, start, start + take - 1, run.rotation))
+            start += take
+            filled += take
+            if filled >= segment_pages:
+                segments.append(current)
+                current = []
+                filled = 0
+    if current:
+        segments.append(current)
+    return segments
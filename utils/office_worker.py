@@ -0,0 +1,407 @@
+"""
+Office 変換の常駐ワーカー
+
+PowerPoint / Word をファイルごとに起動・終了すると、変換よりも起動のほうが時間がかかる。
+アプリごとに専用のスレッドで1つのインスタンスを起動したまま保ち、変換の依頼を順に処理する。
+COM のオブジェクトは作ったスレッドでしか使えないので、起動・変換・終了はすべてそのスレッドで行う。
+
+・ヘルスチェック: 変換の前に、インスタンスが応答するか確かめる。応答しなければ起動し直す
+・失敗時の再起動: 変換が失敗したら、インスタンスを終了して起動し直し、1回だけやり直す
+・アイドル終了: idle_timeout 秒依頼がなければインスタンスを終了し、スレッドも抜ける
+  (次の依頼で起動し直す)
+・プロセス終了時 (ワーカープロセスを含む) にはインスタンスを終了する
+
+バックエンド (OfficeBackend) は差し替えられる。Office のない環境 (Linux など) では、
+環境変数 SECURE_PDF_OFFICE_BACKEND=fake か set_backend_factory() で FakeOfficeBackend を使うと、
+.docx / .pptx の変換経路をそのまま動かせる。
+"""
+import os
+import time
+import threading
+import multiprocessing.util
+from collections import deque
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+from utils import tracing
+from utils.job_scheduler import JobCancelled
+
+BACKEND_ENV = "SECURE_PDF_OFFICE_BACKEND"
+IDLE_TIMEOUT = 120.0  # 秒
+CANCEL_POLL = 0.2     # 変換の完了を待つ間にキャンセルを確認する間隔 (秒)
+
+
+class OfficeBackend:
+    """
+    Office アプリ1つ分の操作。start / convert / is_alive / stop はすべてワーカーのスレッドから呼ばれる。
+    """
+    name = 'office'
+
+    def start(self):
+        raise NotImplementedError
+
+    def convert(self, source_path, output_path):
+        raise NotImplementedError
+
+    def is_alive(self):
+        """インスタンスが応答するか (ヘルスチェック)"""
+        raise NotImplementedError
+
+    def stop(self):
+        """インスタンスを終了する。失敗しても例外は出さない"""
+        raise NotImplementedError
+
+
+class _ComBackend(OfficeBackend):
+    prog_id = None
+
+    def __init__(self):
+        self.app = None
+
+    def start(self):
+        import comtypes
+        import comtypes.client
+        comtypes.CoInitialize()  # このスレッド用の COM の初期化 (stop で解除)
+        try:
+            self.app = comtypes.client.CreateObject(self.prog_id)
+            self._setup(self.app)
+        except Exception:
+            self.app = None
+            comtypes.CoUninitialize()
+            raise
+
+    def _setup(self, app):
+        pass
+
+    def _open_count(self):
+        raise NotImplementedError
+
+    def is_alive(self):
+        if self.app is None: return False
+        try:
+            self._open_count()
+            return True
+        except Exception:
+            return False
+
+    def stop(self):
+        if self.app is None: return
+        import comtypes
+        try:
+            # インスタンスは他のプロセス (並列の取り込み) と共有されるので、
+            # 開いているファイルがあれば終了しない
+            if self._open_count() == 0: self.app.Quit()
+        except Exception:
+            pass
+        self.app = None
+        comtypes.CoUninitialize()
+
+
+class PowerPointBackend(_ComBackend):
+    name = 'powerpoint'
+    prog_id = "Powerpoint.Application"
+
+    def _open_count(self):
+        return self.app.Presentations.Count
+
+    def convert(self, source_path, output_path):
+        deck = self.app.Presentations.Open(source_path, ReadOnly=True, WithWindow=False)
+        try:
+            deck.SaveAs(output_path, 32)  # ppSaveAsPDF
+        finally:
+            deck.Close()
+        return True
+
+
+class WordBackend(_ComBackend):
+    name = 'word'
+    prog_id = "Word.Application"
+
+    def _setup(self, app):
+        app.Visible = False
+        app.DisplayAlerts = 0  # wdAlertsNone
+
+    def _open_count(self):
+        return self.app.Documents.Count
+
+    def convert(self, source_path, output_path):
+        doc = self.app.Documents.Open(source_path, ReadOnly=True, AddToRecentFiles=False, ConfirmConversions=False)
+        try:
+            doc.SaveAs(output_path, FileFormat=17)  # wdFormatPDF
+        finally:
+            doc.Close(0)  # wdDoNotSaveChanges
+        return True
+
+
+class FakeOfficeBackend(OfficeBackend):
+    """
+    Office の代わりに、ファイル名を書いた1ページのPDFを出力する。
+    起動・変換にかかる時間を真似られ、crash() でインスタンスが落ちた状態を作れる。
+    """
+    name = 'fake'
+
+    def __init__(self, start_delay=0.0, convert_delay=0.0, fail_paths=()):
+        """fail_paths: 変換に失敗させる元ファイル名 (basename)"""
+        self.start_delay = start_delay
+        self.convert_delay = convert_delay
+        self.fail_paths = set(fail_paths)
+        self.running = False
+        self.starts = 0
+        self.conversions = 0
+
+    def start(self):
+        time.sleep(self.start_delay)
+        self.running = True
+        self.starts += 1
+
+    def convert(self, source_path, output_path):
+        if not self.running: raise RuntimeError("インスタンスが起動していません")
+        if os.path.basename(source_path) in self.fail_paths:
+            raise RuntimeError(f"変換に失敗しました: {source_path}")
+        time.sleep(self.convert_delay)
+        import fitz
+        from utils.doc_pool import shared_pool
+        with shared_pool.lock:  # PyMuPDF はスレッドセーフでない
+            doc = fitz.open()
+            try:
+                doc.new_page().insert_text((72, 72), os.path.basename(source_path))
+                doc.save(output_path)
+            finally:
+                doc.close()
+        self.conversions += 1
+        return True
+
+    def is_alive(self):
+        return self.running
+
+    def crash(self):
+        self.running = False
+
+    def stop(self):
+        self.running = False
+
+
+class _Request:
+    __slots__ = ('source_path', 'output_path', 'future', 'abandoned')
+
+    def __init__(self, source_path, output_path):
+        self.source_path = source_path
+        self.output_path = output_path
+        self.future = Future()
+        self.abandoned = False  # 依頼元がキャンセルして待つのをやめた
+
+
+class OfficeWorker:
+    def __init__(self, backend_factory, idle_timeout=IDLE_TIMEOUT, retries=1, name='office'):
+        """
+        backend_factory(): OfficeBackend を作る (起動し直すたびに新しく作る)
+        retries: 変換が失敗したとき、起動し直してやり直す回数
+        """
+        self.backend_factory = backend_factory
+        self.idle_timeout = idle_timeout
+        self.retries = retries
+        self.name = name
+        self.backend = None
+        self.stats = {'starts': 0, 'restarts': 0, 'conversions': 0, 'failures': 0, 'idle_stops': 0,
+                      'last_error': None}
+
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._queue = deque()
+        self._thread = None
+        self._closed = False
+
+    def submit(self, source_path, output_path):
+        """変換を依頼し、Future (結果は True) を返す"""
+        return self._submit(source_path, output_path).future
+
+    def _submit(self, source_path, output_path):
+        request = _Request(source_path, output_path)
+        with self._lock:
+            if self._closed: raise RuntimeError("Office の変換ワーカーは終了しています")
+            self._queue.append(request)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=f"office-{self.name}", daemon=True)
+                self._thread.start()
+            self._wakeup.notify()
+        return request
+
+    def convert(self, source_path, output_path, cancel_token=None):
+        """
+        変換が終わるまで待つ。失敗は例外で返す。
+        cancel_token がキャンセルされたら待つのをやめて JobCancelled を送出する
+        (変換中のファイルは最後まで処理され、出力は削除される)。
+        """
+        request = self._submit(source_path, output_path)
+        while True:
+            if cancel_token is not None and cancel_token.cancelled:
+                with self._lock:
+                    request.abandoned = True
+                    if request in self._queue: self._queue.remove(request)
+                raise JobCancelled()
+            try:
+                return request.future.result(timeout=CANCEL_POLL if cancel_token is not None else None)
+            except FutureTimeout:
+                continue
+
+    def status(self):
+        with self._lock:
+            return dict(self.stats, running=self.backend is not None, queued=len(self._queue),
+                        thread=self._thread is not None, closed=self._closed)
+
+    def shutdown(self, timeout=10.0):
+        """未処理の依頼を取り消し、インスタンスを終了する"""
+        with self._lock:
+            self._closed = True
+            pending = list(self._queue)
+            self._queue.clear()
+            thread = self._thread
+            self._wakeup.notify_all()
+        for request in pending:
+            request.future.set_exception(RuntimeError("Office の変換ワーカーは終了しています"))
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout)
+
+    # --- ワーカースレッド ---
+
+    def _next_request(self):
+        """次の依頼。idle_timeout 秒なければ (または終了するなら) None"""
+        with self._lock:
+            deadline = time.monotonic() + self.idle_timeout
+            while not self._queue and not self._closed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0: break
+                self._wakeup.wait(remaining)
+            if self._queue and not self._closed:
+                return self._queue.popleft()
+            return None
+
+    def _run(self):
+        while True:
+            request = self._next_request()
+            if request is None:
+                # インスタンスを終了してからスレッドを抜ける (終了中に次の依頼が別のインスタンスを起動しないように)
+                if self.backend is not None:
+                    if not self._closed: self.stats['idle_stops'] += 1
+                    self._stop_backend()
+                with self._lock:
+                    if self._queue and not self._closed: continue
+                    self._thread = None  # 以降の submit は新しいスレッドを立てる
+                    return
+            if not request.future.set_running_or_notify_cancel(): continue
+            try:
+                result = self._convert(request)
+            except Exception as e:
+                request.future.set_exception(e)
+            else:
+                request.future.set_result(result)
+            if request.abandoned: _remove(request.output_path)
+
+    def _convert(self, request):
+        attempts = self.retries + 1
+        for attempt in range(attempts):
+            self._ensure_backend()
+            with tracing.span('office.convert', path=request.source_path, backend=self.backend.name,
+                              attempt=attempt) as span:
+                try:
+                    result = self.backend.convert(request.source_path, request.output_path)
+                    self.stats['conversions'] += 1
+                    return result
+                except Exception as e:
+                    self.stats['failures'] += 1
+                    self.stats['last_error'] = f"{type(e).__name__}: {e}"
+                    span.set(error=self.stats['last_error'])
+                    _remove(request.output_path)
+                    # インスタンスが壊れている可能性があるので起動し直す
+                    self._stop_backend()
+                    if attempt + 1 == attempts: raise
+                    self.stats['restarts'] += 1
+
+    def _ensure_backend(self):
+        if self.backend is not None:
+            if self.backend.is_alive(): return
+            # ヘルスチェックに失敗 (ユーザーが閉じた、クラッシュしたなど)
+            tracing.report_error(f"office.{self.name}", RuntimeError("応答しないため起動し直します"))
+            self.stats['restarts'] += 1
+            self._stop_backend()
+        backend = self.backend_factory()
+        with tracing.span('office.start', backend=backend.name):
+            backend.start()
+        self.backend = backend
+        self.stats['starts'] += 1
+
+    def _stop_backend(self):
+        backend, self.backend = self.backend, None
+        if backend is None: return
+        with tracing.span('office.stop', backend=backend.name):
+            backend.stop()
+
+
+def _remove(path):
+    try: os.remove(path)
+    except OSError: pass
+
+
+# --- プロセスで共有するワーカー ---
+
+BACKENDS = {
+    'powerpoint': PowerPointBackend,
+    'word': WordBackend,
+    'fake': FakeOfficeBackend,
+}
+
+_factories = {}  # アプリ名 -> backend_factory (set_backend_factory で差し替えたもの)
+_workers = {}
+_workers_lock = threading.Lock()
+
+
+def uses_fake_backend():
+    return os.environ.get(BACKEND_ENV) == 'fake'
+
+
+def set_backend_factory(app, factory):
+    """app ('powerpoint' / 'word') のバックエンドを差し替える。起動中のワーカーは終了する"""
+    with _workers_lock:
+        _factories[app] = factory
+        worker = _workers.pop(app, None)
+    if worker is not None: worker.shutdown()
+
+
+def get_worker(app):
+    """app のワーカー (なければ作る)"""
+    with _workers_lock:
+        worker = _workers.get(app)
+        if worker is None:
+            factory = _factories.get(app) or BACKENDS[os.environ.get(BACKEND_ENV) or app]
+            worker = _workers[app] = OfficeWorker(factory, name=app)
+            # プロセス終了時にインスタンスを終了する。取り込みのワーカープロセスは atexit を呼ばずに終わるため、
+            # multiprocessing の終了処理に登録する (そのプロセスで作ったときに登録する必要がある)
+            multiprocessing.util.Finalize(worker, worker.shutdown, exitpriority=10)
+        return worker
+
+
+def convert(app, source_path, output_path, cancel_token=None):
+    return get_worker(app).convert(source_path, output_path, cancel_token)
+
+
+def status():
+    with _workers_lock:
+        workers = dict(_workers)
+    return {app: worker.status() for app, worker in workers.items()}
+
+
+def shutdown_all():
+    with _workers_lock:
+        workers = list(_workers.values())
+        _workers.clear()
+    for worker in workers: worker.shutdown()
+
+
+def _reset_after_fork():
+    # fork したプロセスには親のワーカー (スレッドは引き継がれない) が残るので捨てる
+    global _workers_lock
+    _workers.clear()
+    _workers_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,125 @@
+"""
+結合リストのページモデル
+
+ページごとに9キーの dict (path やファイル名の文字列を毎回保持) を持つ代わりに、
+ファイル単位の情報は SourceRecord に1度だけ登録 (intern) し、
+各ページは __slots__ の小さなオブジェクトで SourceRecord を参照する。
+ファイル単位のグループ化は文字列比較ではなく整数の source_id で行える。
+
+pdf_ops など dict を受け取る関数にそのまま渡せるよう、
+Page は item['path'] / item.get('rotation') の形の読み取りにも対応する。
+"""
+import os
+import itertools
+import threading
+
+# Page.flags のビット
+FLAG_PORTRAIT = 1
+
+
+class SourceRecord:
+    __slots__ = ('source_id', 'path', 'original_source_path', 'filename', 'is_generated', 'is_landscape_generated',
+                 'content_hash')
+
+    def __init__(self, source_id, path, original_source_path, filename, is_generated, is_landscape_generated,
+                 content_hash=None):
+        self.source_id = source_id
+        self.content_hash = content_hash  # path の内容のハッシュ (サムネイルキャッシュのキー)
+        self.path = path
+        self.original_source_path = original_source_path
+        self.filename = filename
+        self.is_generated = is_generated
+        self.is_landscape_generated = is_landscape_generated
+
+
+class SourceTable:
+    """SourceRecord の登録表 (同じ内容なら同じレコードを返す)"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._records = []
+        self._by_key = {}
+
+    def intern(self, path, original_source_path=None, filename=None, is_generated=False, is_landscape_generated=False,
+               content_hash=None):
+        original_source_path = original_source_path or path
+        key = (path, original_source_path, bool(is_generated), bool(is_landscape_generated))
+        with self._lock:
+            record = self._by_key.get(key)
+            if record is None:
+                record = SourceRecord(len(self._records), path, original_source_path,
+                                      filename or os.path.basename(original_source_path),
+                                      bool(is_generated), bool(is_landscape_generated), content_hash)
+                self._records.append(record)
+                self._by_key[key] = record
+            elif content_hash:
+                # 再変換で同じパスの中身が変わった場合はハッシュを更新する
+                record.content_hash = content_hash
+            return record
+
+    def get(self, source_id):
+        return self._records[source_id]
+
+    def records(self):
+        with self._lock:
+            return list(self._records)
+
+    def __len__(self):
+        return len(self._records)
+
+
+_uid_counter = itertools.count()
+
+
+class Page:
+    __slots__ = ('uid', 'source', 'page_index', 'rotation', 'flags')
+
+    def __init__(self, source, page_index, rotation=0, is_portrait_original=True):
+        self.uid = next(_uid_counter)
+        self.source = source
+        self.page_index = page_index
+        self.rotation = rotation
+        self.flags = FLAG_PORTRAIT if is_portrait_original else 0
+
+    # --- SourceRecord 側の値 ---
+    @property
+    def source_id(self): return self.source.source_id
+
+    @property
+    def path(self): return self.source.path
+
+    @property
+    def original_source_path(self): return self.source.original_source_path
+
+    @property
+    def filename(self): return self.source.filename
+
+    @property
+    def is_generated(self): return self.source.is_generated
+
+    @property
+    def is_landscape_generated(self): return self.source.is_landscape_generated
+
+    @property
+    def content_hash(self): return self.source.content_hash
+
+    @property
+    def is_portrait_original(self): return bool(self.flags & FLAG_PORTRAIT)
+
+    @property
+    def id(self): return self.uid
+
+    # --- dict 互換の読み取り (pdf_ops 用) ---
+    def __getitem__(self, key):
+        try: return getattr(self, key)
+        except AttributeError: raise KeyError(key) from None
+
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+
+    def update(self, values):
+        """history.UpdatePages から使う (source / rotation / page_index / flags のみ)"""
+        for key, value in values.items():
+            setattr(self, key, value)
+
+    def __repr__(self):
+        return f"Page({self.filename!r}, {self.page_index}, rot={self.rotation})"
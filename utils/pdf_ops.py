@@ -1,237 +1,519 @@
 import os
 import io
+import gc
 import sys
 import platform
+import re
+import shutil
 import tempfile
-import pandas as pd
+import threading
+from collections import Counter, OrderedDict
 from pypdf import PdfReader, PdfWriter
 import fitz  # PyMuPDF
 from PIL import Image
+from utils.doc_pool import shared_pool
+from utils import tracing
+from utils.job_scheduler import JobCancelled, check_cancelled
+from utils.conversion_cache import ConversionCache
+from utils.cache_utils import content_hash
+from utils.merge_plan import plan_merge_runs, split_into_segments
+from utils.pdf_stream_writer import StreamingPdfWriter
+from utils.memory_usage import peak_rss_bytes
+from utils.pdf_optimize import normalize_output_options, fitz_save_options, dedupe_objects, dedupe_pypdf_writer
+from utils import converters
 
-# PDF生成用
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import A4, landscape, portrait
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
-from reportlab.lib.units import mm
-from xhtml2pdf import pisa
-
-# Office変換用
-try:
-    import comtypes.client
-    HAS_COM = True
-except ImportError:
-    HAS_COM = False
-
-try:
-    from docx2pdf import convert as docx_convert
-    HAS_DOCX = True
-except ImportError:
-    HAS_DOCX = False
-
-def get_japanese_font_path():
-    system = platform.system()
-    candidates = []
-    if system == "Windows":
-        candidates = [r"C:\Windows\Fonts\msgothic.ttc", r"C:\Windows\Fonts\meiryo.ttc", r"C:\Windows\Fonts\msmincho.ttc"]
-    elif system == "Darwin":
-        candidates = ["/System/Library/Fonts/Hiragino Sans GB.ttc", "/System/Library/Fonts/AppleGothic.ttf"]
-    else:
-        candidates = ["/usr/share/fonts/opentype/ipafont-gothic/ipag.ttf"]
+_conversion_cache = None
 
-    for path in candidates:
-        if os.path.exists(path): return path.replace('\\', '/')
-    return None
+def get_conversion_cache():
+    global _conversion_cache
+    if _conversion_cache is None:
+        _conversion_cache = ConversionCache()
+    return _conversion_cache
 
-def text_to_pdf(source_path, output_path, font_path, font_name, is_landscape=False):
-    try:
-        page_size = landscape(A4) if is_landscape else portrait(A4)
-        c = canvas.Canvas(output_path, pagesize=page_size)
-        width, height = page_size
-        
-        margin = 20 * mm
-        y_position = height - margin
-        line_height = 14
-        
-        if font_path:
-            try:
-                pdfmetrics.registerFont(TTFont(font_name, font_path))
-                c.setFont(font_name, 10.5)
-            except: c.setFont("Helvetica", 10.5)
-        else: c.setFont("Helvetica", 10.5)
+def set_conversion_cache(cache):
+    """変換キャッシュを差し替える (ベンチマークなどで別の作業フォルダを使う場合)"""
+    global _conversion_cache
+    _conversion_cache = cache
 
-        try:
-            with open(source_path, 'r', encoding='utf-8') as f: lines = f.readlines()
-        except:
-            with open(source_path, 'r', encoding='cp932', errors='ignore') as f: lines = f.readlines()
-
-        for line in lines:
-            line = line.rstrip()
-            if y_position < margin:
-                c.showPage()
-                y_position = height - margin
-                if font_path: c.setFont(font_name, 10.5)
-                else: c.setFont("Helvetica", 10.5)
-            c.drawString(margin, y_position, line)
-            y_position -= line_height
-        c.save()
-        return True
-    except Exception as e:
-        print(f"Text error: {e}")
-        return False
+def get_converter_name(ext):
+    """ext を変換する変換器の名前 (utils/converters.py)。変換できなければ None"""
+    backend = converters.for_extension(ext)
+    return backend.name if backend else None
 
-def excel_csv_to_html(source_path, is_landscape=False):
-    try:
-        if source_path.lower().endswith('.csv'):
-            df = pd.read_csv(source_path, encoding='utf-8', on_bad_lines='skip')
-        else:
-            df = pd.read_excel(source_path)
-        
-        html = df.to_html(index=False, border=1, classes='table')
-        size_css = "size: A4 landscape;" if is_landscape else "size: A4 portrait;"
-        style = f"""
-        <style>
-            @page {{ {size_css} margin: 1cm; }}
-            table {{ border-collapse: collapse; width: 100%; }}
-            th, td {{ border: 1px solid black; padding: 4px; text-align: left; font-size: 9pt; }}
-            th {{ background-color: #f0f0f0; }}
-        </style>
-        """
-        return f"<html><head><meta charset='utf-8'>{style}</head><body>{html}</body></html>"
-    except Exception as e:
-        return None
-
-def convert_to_pdf(source_path, is_landscape=False):
+def convert_to_pdf(source_path, is_landscape=False, text_window=None, cancel_token=None):
+    """
+    text_window: テキスト変換で一部だけを変換する範囲 ("head:N" / "tail:N" / "bytes:START-END")
+    cancel_token: キャンセルされると JobCancelled で中断する (utils/job_scheduler.py)
+    """
     base_name = os.path.basename(source_path)
     if base_name.startswith('.') and base_name.count('.') == 1:
         ext = base_name.lower()
     else:
         ext = os.path.splitext(source_path)[1].lower()
 
-    temp_dir = tempfile.gettempdir()
-    safe_name = "".join([c for c in base_name if c.isalnum() or c in (' ', '.', '_')]).strip()
-    orientation_suffix = "_L" if is_landscape else "_P"
-    output_filename = f"converted_{safe_name}{orientation_suffix}.pdf"
-    output_path = os.path.join(temp_dir, output_filename)
-    
-    font_path = get_japanese_font_path()
-    font_name = "JapaneseFont"
+    backend = converters.for_extension(ext)
+    if backend is None: return None
+    converter = backend.name
+    if converter == 'text':
+        from utils.text_renderer import TextWindow
+        text_window = TextWindow.parse(text_window)
+    else:
+        text_window = None
+
+    with tracing.span('convert', path=source_path, converter=converter, landscape=is_landscape) as span:
+        # 内容ハッシュ + 変換器 + 向き (+ 範囲) で決まる出力先。変換済みなら即座に返す
+        cache = get_conversion_cache()
+        variant = text_window.cache_tag() if text_window else None
+        output_path = cache.output_path(source_path, converter, is_landscape, variant)
+        if output_path is None: return None
+        cached = cache.lookup(output_path)
+        span.set(cached=bool(cached))
+        if cached: return cached
 
-    try:
-        if ext in ['.jpg', '.jpeg', '.png', '.bmp', '.gif', '.tiff', '.tif', '.eps', '.webp', '.ico']:
-            image = Image.open(source_path)
-            if image.mode != 'RGB': image = image.convert('RGB')
-            image.save(output_path, "PDF", resolution=100.0)
-            return output_path
-        elif ext in ['.txt', '.log', '.md', '.py', '.json', '.xml', '.js', '.css', '.rtf']:
-            if text_to_pdf(source_path, output_path, font_path, font_name, is_landscape):
-                return output_path
+        temp_path = cache.temp_path(output_path)
+        try:
+            if not backend.convert(os.path.abspath(source_path), temp_path, is_landscape, text_window, cancel_token,
+                                   ext=ext):
+                cache.discard(temp_path)
+                span.set(error="変換に失敗しました")
+                return None
+            # 確定前に、プールに残っている古いハンドルを閉じる
+            shared_pool.invalidate(output_path)
+            result = cache.commit(temp_path, output_path)
+            if result and tracing.is_enabled(): span.set(output_bytes=os.path.getsize(result))
+            return result
+        except JobCancelled:
+            cache.discard(temp_path)
+            raise
+        except Exception as e:
+            tracing.report_error('convert', e, path=source_path)
+            cache.discard(temp_path)
             return None
-        elif ext in ['.html', '.htm', '.xlsx', '.xls', '.csv']:
-            source_html = ""
-            if ext in ['.html', '.htm']:
-                try:
-                    with open(source_path, 'r', encoding='utf-8') as f: source_html = f.read()
-                except:
-                    with open(source_path, 'r', encoding='cp932', errors='ignore') as f: source_html = f.read()
-                size_css = "size: A4 landscape;" if is_landscape else "size: A4 portrait;"
-                if "@page" not in source_html:
-                     source_html = f"<style>@page {{ {size_css} }}</style>" + source_html
-            else:
-                source_html = excel_csv_to_html(source_path, is_landscape)
-                if not source_html: return None
-            if font_path:
-                try:
-                    pdfmetrics.registerFont(TTFont(font_name, font_path))
-                    css = f"<style>@font-face {{ font-family: '{font_name}'; src: url('{font_path}'); }} body {{ font-family: '{font_name}'; }}</style>"
-                    if "<head>" in source_html: source_html = source_html.replace("<head>", f"<head>{css}")
-                    else: source_html = f"{css}{source_html}"
-                except: pass
-            with open(output_path, "wb") as f:
-                pisa.CreatePDF(io.StringIO(source_html), dest=f, encoding='utf-8')
-            return output_path
-        elif ext in ['.docx', '.doc'] and HAS_DOCX:
-            docx_convert(source_path, output_path)
-            return output_path
-        elif ext in ['.pptx', '.ppt'] and HAS_COM:
-            try:
-                ppt = comtypes.client.CreateObject("Powerpoint.Application")
-                deck = ppt.Presentations.Open(source_path, WithWindow=False)
-                deck.SaveAs(output_path, 32)
-                deck.Close()
-                ppt.Quit()
-                return output_path
-            except: return None
-        return None
-    except Exception as e:
-        print(f"Conversion error: {e}")
-        return None
+
+_PAGE_KEY_RE = re.compile(r"/(MediaBox|CropBox|Rotate|Parent)\b\s*(\[[^\]]*\]|\d+\s+\d+\s+R|-?\d+)")
+_NUMBER_RE = re.compile(r"-?(?:\d+\.?\d*|\.\d+)")
+_REF_RE = re.compile(r"(\d+)\s+\d+\s+R$")
+
+def _page_keys(doc, xref):
+    """ページ (またはページツリー) オブジェクト直下の MediaBox / CropBox / Rotate / Parent を読む"""
+    source = doc.xref_object(xref, compressed=True)
+    keys = {}
+    for m in _PAGE_KEY_RE.finditer(source):
+        # 入れ子の辞書の中にある同名のキーは対象外
+        head = source[:m.start()]
+        if head.count('<<') - head.count('>>') != 1: continue
+        keys.setdefault(m.group(1), m.group(2))
+    return keys
+
+def _resolve(doc, value):
+    ref = _REF_RE.match(value)
+    return doc.xref_object(int(ref.group(1)), compressed=True) if ref else value
+
+def _parse_box(doc, value):
+    numbers = [float(n) for n in _NUMBER_RE.findall(_resolve(doc, value))]
+    if len(numbers) != 4: raise ValueError(value)
+    x0, y0, x1, y1 = numbers
+    return (min(x0, x1), min(y0, y1), max(x0, x1), max(y0, y1))
+
+def _inherited_keys(doc, xref, parent_cache, depth=0):
+    """MediaBox / CropBox / Rotate はページツリーの親から継承されるので、親ごとに1回だけ読む"""
+    if xref in parent_cache: return parent_cache[xref]
+    keys = _page_keys(doc, xref)
+    inherited = {}
+    parent = _REF_RE.match(keys.get('Parent', ''))
+    if parent and depth < 32:
+        inherited.update(_inherited_keys(doc, int(parent.group(1)), parent_cache, depth + 1))
+    inherited.update({k: v for k, v in keys.items() if k != 'Parent'})
+    parent_cache[xref] = inherited
+    return inherited
+
+def _page_geometry(doc, page_num, parent_cache):
+    keys = _page_keys(doc, doc.page_xref(page_num))
+    # ページ自身に MediaBox と Rotate があっても、CropBox は親から継承していることがあるので常に親を読む
+    # (親の読み取り結果は parent_cache で使い回すので、ページごとの負担は辞書の結合だけ)
+    parent = _REF_RE.match(keys.get('Parent', ''))
+    if parent:
+        keys = {**_inherited_keys(doc, int(parent.group(1)), parent_cache), **keys}
+    mediabox = _parse_box(doc, keys['MediaBox'])
+    cropbox = _parse_box(doc, keys['CropBox']) if 'CropBox' in keys else mediabox
+    # cropbox は mediabox の範囲に切り詰めて表示される
+    cropbox = (max(cropbox[0], mediabox[0]), max(cropbox[1], mediabox[1]),
+               min(cropbox[2], mediabox[2]), min(cropbox[3], mediabox[3]))
+    rotate = int(_resolve(doc, keys.get('Rotate', '0')).strip()) % 360
+    return mediabox, cropbox, rotate
+
+def _page_geometry_slow(doc, page_num):
+    # 辞書を直接読めない壊れたページなどは PyMuPDF のページオブジェクト経由で読む
+    page = doc.load_page(page_num)
+    m, c = page.mediabox, page.cropbox
+    # PyMuPDF の cropbox は y 軸が下向きなので、PDF の座標 (_page_geometry と同じ) に戻す
+    return (m.x0, m.y0, m.x1, m.y1), (c.x0, m.y1 - c.y1, c.x1, m.y1 - c.y0), page.rotation
+
+def _scan_page_geometry(doc):
+    """
+    全ページの mediabox / cropbox / /Rotate を1回の走査で集める。
+    ページを1枚ずつ読み込む (load_page) と数千ページで遅いため、ページ辞書を直接読む。
+    """
+    details = []
+    parent_cache = {}
+    for i in range(doc.page_count):
+        try:
+            mediabox, cropbox, rotate = _page_geometry(doc, i, parent_cache)
+        except Exception:
+            mediabox, cropbox, rotate = _page_geometry_slow(doc, i)
+        # 実際に表示される大きさ (cropbox に /Rotate を適用したもの)
+        width, height = cropbox[2] - cropbox[0], cropbox[3] - cropbox[1]
+        if rotate % 180: width, height = height, width
+        details.append({
+            'is_portrait': height >= width,
+            'width': width,
+            'height': height,
+            'mediabox': mediabox,
+            'cropbox': cropbox,
+            'rotate': rotate,
+        })
+    return details
+
+def _encrypted_page_count(file_path):
+    # パスワードが必要なファイルは PyMuPDF ではページを開けないため、ページ数だけ pypdf で数える
+    try: return len(PdfReader(file_path).pages)
+    except Exception: return None
+
+_info_cache = OrderedDict()  # content_hash -> (pages, page_details, encrypted)
+_info_cache_lock = threading.Lock()
+INFO_CACHE_SIZE = 256
+
+def clear_info_cache():
+    with _info_cache_lock:
+        _info_cache.clear()
 
 def get_pdf_info(file_path):
     if not os.path.exists(file_path): return None
-    try:
-        reader = PdfReader(file_path)
-        if reader.is_encrypted:
-            try: return {"path": file_path, "filename": os.path.basename(file_path), "pages": len(reader.pages), "page_details": []}
-            except: return None
-        details = []
-        for page in reader.pages:
+    with tracing.span('pdf_info', path=file_path) as span:
+        # 同じ内容のファイル (再追加・別名のコピー) は解析結果を使い回す
+        file_hash = content_hash(file_path)
+        with _info_cache_lock:
+            cached = _info_cache.get(file_hash) if file_hash else None
+            if cached: _info_cache.move_to_end(file_hash)
+        span.set(cached=cached is not None)
+        if cached is None:
             try:
-                w, h = float(page.mediabox.width), float(page.mediabox.height)
-                details.append({'is_portrait': h >= w, 'width': w, 'height': h})
-            except:
-                details.append({'is_portrait': True})
-        return {
-            "path": file_path,
-            "filename": os.path.basename(file_path),
-            "pages": len(reader.pages),
-            "page_details": details
-        }
-    except: return None
-
-def merge_pdfs_securely(page_list, output_path=None):
+                with shared_pool.document(file_path) as doc:
+                    encrypted = bool(doc.needs_pass)
+                    if encrypted:
+                        pages, details = _encrypted_page_count(file_path), []
+                    else:
+                        pages, details = doc.page_count, _scan_page_geometry(doc)
+            except Exception as e:
+                span.set(error=f"{type(e).__name__}: {e}")
+                return None
+            if pages is None: return None
+            cached = (pages, details, encrypted)
+            if file_hash:
+                with _info_cache_lock:
+                    _info_cache[file_hash] = cached
+                    while len(_info_cache) > INFO_CACHE_SIZE:
+                        _info_cache.popitem(last=False)
+        pages, details, encrypted = cached
+        span.set(pages=pages, encrypted=encrypted)
+    return {
+        "path": file_path,
+        "filename": os.path.basename(file_path),
+        "pages": pages,
+        "page_details": [dict(d) for d in details],
+        "encrypted": encrypted,
+    }
+
+MERGE_BACKENDS = ('fitz', 'pypdf')
+
+def _run_inserts(src, run):
+    """
+    MergeRun を insert_pdf 1回分ずつの (start, end, rotate) に分け、リンクのコピーが必要かも返す。
+    insert_pdf の rotate は元の /Rotate を上書きするため、元の回転が同じページごとに分けて
+    足した値を渡す (pypdf の page.rotate と同じ結果になる)。
+    """
+    pieces = []
+    has_annots = False
+    parent_cache = {}
+    for i in range(run.start, run.end + 1):
+        if not has_annots:
+            has_annots = '/Annots' in src.xref_object(src.page_xref(i), compressed=True)
+        if not run.rotation: continue
+        try: current = _page_geometry(src, i, parent_cache)[2]
+        except Exception: current = src.load_page(i).rotation
+        rotate = (current + run.rotation) % 360
+        if pieces and pieces[-1][2] == rotate: pieces[-1][1] = i
+        else: pieces.append([i, i, rotate])
+    if not run.rotation:
+        pieces = [[run.start, run.end, -1]]  # -1: 回転はそのまま
+    return pieces, has_annots
+
+def _merge_with_fitz(page_list, output_path, options, cancel_token=None, report=None):
+    # PyMuPDF はスレッドセーフでないため、結合中はプールと同じロックを保持する
+    with shared_pool.lock:
+        sources = {}
+        merged = fitz.open()
+        try:
+            def open_source(path):
+                if path not in sources:
+                    doc = fitz.open(path)
+                    if doc.needs_pass: raise ValueError(f"パスワードで保護されています: {path}")
+                    sources[path] = doc
+                return sources[path]
+
+            runs = plan_merge_runs(page_list, lambda path: open_source(path).page_count)
+            # 連続したページはまとめて一括コピーする (ページ内容のストリームはそのまま複製される)。
+            # 末尾への追加はページ数に比例して遅くなる (MuPDF がページツリーを毎回たどる) ため、
+            # 後ろの範囲から順に先頭へ挿入する
+            for run in reversed(runs):
+                check_cancelled(cancel_token)
+                src = open_source(run.path)
+                pieces, has_annots = _run_inserts(src, run)
+                for start, end, rotate in reversed(pieces):
+                    # リンクのコピーはページごとに Python で処理されて遅いため、注釈のない範囲では省く
+                    merged.insert_pdf(src, from_page=start, to_page=end, start_at=0,
+                                      rotate=rotate, links=has_annots)
+            merged.set_metadata({})
+            check_cancelled(cancel_token)
+            if options['dedupe']:
+                # 元ファイルごとに複製された同じフォント・画像などを1つにまとめる
+                dedupe_objects(merged)
+            save_options = fitz_save_options(options)
+            if report is not None: report['optimize'] = dict(options)
+            if output_path:
+                merged.save(output_path, **save_options)
+                return True
+            return io.BytesIO(merged.tobytes(**save_options))
+        finally:
+            merged.close()
+            for doc in sources.values(): doc.close()
+
+def _merge_with_pypdf(page_list, output_path, options, cancel_token=None, report=None):
     writer = PdfWriter()
-    try:
-        open_files = {}
-        for item in page_list:
-            path = item['path']
-            if path not in open_files: open_files[path] = PdfReader(path)
-            reader = open_files[path]
-            if 0 <= item['page_index'] < len(reader.pages):
-                page = reader.pages[item['page_index']]
-                if item['rotation'] != 0:
-                    page.rotate(item['rotation'])
-                writer.add_page(page)
-        writer.add_metadata({'/Title': '', '/Author': ''})
-        if output_path:
-            with open(output_path, "wb") as f: writer.write(f)
-            return True
+    open_files = {}
+
+    def open_reader(path):
+        if path not in open_files: open_files[path] = PdfReader(path)
+        return open_files[path]
+
+    for run in plan_merge_runs(page_list, lambda path: len(open_reader(path).pages)):
+        check_cancelled(cancel_token)
+        reader = open_reader(run.path)
+        for i in range(run.start, run.end + 1):
+            page = reader.pages[i]
+            if run.rotation != 0:
+                page.rotate(run.rotation)
+            writer.add_page(page)
+    # pypdf ではオブジェクトストリームは使えないため、object_streams は無視する
+    applied = dict(options, object_streams=False)
+    if options['compress']:
+        for page in writer.pages: page.compress_content_streams()
+    if options['dedupe']:
+        applied['dedupe'] = dedupe_pypdf_writer(writer)
+    if report is not None: report['optimize'] = applied
+    writer.add_metadata({'/Title': '', '/Author': ''})
+    if output_path:
+        with open(output_path, "wb") as f: writer.write(f)
+        return True
+    out = io.BytesIO()
+    writer.write(out)
+    out.seek(0)
+    return out
+
+# 省メモリ結合の目安: 結合中のセグメントは元データのおよそ2倍のメモリを使うとみなし、
+# 予算の半分をセグメントに、1/4 を開いておく元ファイルに充てる
+MIN_SEGMENT_PAGES = 10
+MAX_SEGMENT_PAGES = 5000
+OPEN_SOURCE_ESTIMATE = 8 * 1024 * 1024
+MAX_OPEN_SOURCES = 16
+
+def _low_memory_limits(runs, page_counts, budget_bytes):
+    total_pages = sum(run.count for run in runs)
+    page_bytes = sum(os.path.getsize(run.path) / max(1, page_counts[run.path]) * run.count for run in runs) / total_pages
+    segment_pages = int(budget_bytes * 0.5 / max(page_bytes * 2, 1))
+    segment_pages = max(MIN_SEGMENT_PAGES, min(MAX_SEGMENT_PAGES, segment_pages))
+    max_open = max(1, min(MAX_OPEN_SOURCES, int(budget_bytes * 0.25 // OPEN_SOURCE_ESTIMATE)))
+    return segment_pages, max_open
+
+def _merge_low_memory(page_list, output_path, options, memory_budget_mb, report, cancel_token=None):
+    """
+    省メモリ結合。一定ページ数ごとのセグメントを PyMuPDF で作って一時ファイルに保存し、
+    StreamingPdfWriter で出力ファイルへ順に書き足す。
+    ・同時に開く元ファイルの数に上限を設け、最後に参照するページを追加したら閉じる
+    ・重複排除はセグメント内で行う (セグメントをまたいだ重複や、ページをまたぐリンクは対象外)
+    ・オブジェクトストリームは使わない
+    """
+    page_counts = {}
+
+    def page_count(path):
+        with shared_pool.lock:
+            with fitz.open(path) as doc:
+                if doc.needs_pass: raise ValueError(f"パスワードで保護されています: {path}")
+                page_counts[path] = doc.page_count
+        return page_counts[path]
+
+    runs = plan_merge_runs(page_list, page_count)
+    if not runs: raise ValueError("結合するページがありません")
+    segment_pages, max_open = _low_memory_limits(runs, page_counts, memory_budget_mb * 1024 * 1024)
+    segments = split_into_segments(runs, segment_pages)
+    remaining = Counter(run.path for segment in segments for run in segment)
+    segment_options = dict(options, object_streams=False)
+
+    sources = OrderedDict()
+
+    def open_source(path):
+        if path in sources:
+            sources.move_to_end(path)
         else:
-            out = io.BytesIO()
-            writer.write(out)
-            out.seek(0)
-            return out
-    except Exception as e:
-        print(f"Merge error: {e}")
-        return False if output_path else None
-
-def get_preview_image(pdf_bytes_io, page_num):
+            sources[path] = fitz.open(path)
+            while len(sources) > max_open:
+                sources.popitem(last=False)[1].close()
+        return sources[path]
+
+    def release(path):
+        remaining[path] -= 1
+        if remaining[path] == 0 and path in sources:
+            sources.pop(path).close()
+
+    workdir = tempfile.mkdtemp(prefix="merge_segments_")
+    out = open(output_path, "wb") if output_path else tempfile.TemporaryFile()
     try:
-        doc = fitz.open(stream=pdf_bytes_io, filetype="pdf")
+        writer = StreamingPdfWriter(out)
+        for n, segment in enumerate(segments):
+            check_cancelled(cancel_token)
+            segment_path = os.path.join(workdir, f"segment_{n}.pdf")
+            with tracing.span('merge.segment', index=n, pages=sum(run.count for run in segment)):
+                with shared_pool.lock:
+                    merged = fitz.open()
+                    try:
+                        for run in reversed(segment):
+                            src = open_source(run.path)
+                            pieces, has_annots = _run_inserts(src, run)
+                            for start, end, rotate in reversed(pieces):
+                                merged.insert_pdf(src, from_page=start, to_page=end, start_at=0,
+                                                  rotate=rotate, links=has_annots)
+                            release(run.path)
+                        if options['dedupe']: dedupe_objects(merged)
+                        merged.save(segment_path, **fitz_save_options(segment_options))
+                    finally:
+                        merged.close()
+                # セグメントは書き足したらすぐ消す。pypdf のリーダーは循環参照を持つため、
+                # ここで回収しないとセグメントごとにメモリが積み上がる
+                writer.append_pdf(segment_path)
+                os.remove(segment_path)
+                gc.collect()
+        writer.close()
+    except Exception:
+        out.close()
+        if output_path:
+            try: os.remove(output_path)
+            except OSError: pass
+        raise
+    finally:
+        with shared_pool.lock:
+            for doc in sources.values(): doc.close()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if report is not None:
+        report.update({'segments': len(segments), 'segment_pages': segment_pages, 'max_open_sources': max_open,
+                       'optimize': segment_options})
+    if output_path:
+        out.close()
+        return True
+    out.seek(0)
+    return out
+
+def merge_pdfs_securely(page_list, output_path=None, backend='fitz', options=None, memory_budget_mb=None, report=None,
+                        cancel_token=None):
+    """
+    ページリストを1つのPDFに結合する。output_path が None なら BytesIO を返す。
+    backend='fitz' (既定) は連続したページ範囲を PyMuPDF で一括コピーし、失敗したら pypdf で結合し直す。
+    options は出力の最適化の設定 (utils/pdf_optimize.py の DEFAULT_OUTPUT_OPTIONS を参照)。
+    memory_budget_mb を指定すると省メモリ結合になる (output_path が None なら一時ファイルを返す)。
+    report (dict) を渡すと、結合の方式 (mode)・実際に使った最適化 (optimize)・ピーク RSS を書き込む。
+    cancel_token がキャンセルされると JobCancelled で中断する (出力ファイルは作らない)。
+    """
+    options = normalize_output_options(options)
+    if memory_budget_mb:
+        mode_names = ('low_memory',)
+    else:
+        mode_names = MERGE_BACKENDS[MERGE_BACKENDS.index(backend):]
+    result = False if output_path else None
+    with tracing.span('merge', pages=len(page_list), backend=backend, memory_budget_mb=memory_budget_mb) as span:
+        for name in mode_names:
+            # 失敗して次の方式で結合し直した場合も、方式ごとの時間が分かるよう別のスパンにする
+            with tracing.span(f"merge.{name}", pages=len(page_list)):
+                try:
+                    if name == 'low_memory':
+                        result = _merge_low_memory(page_list, output_path, options, memory_budget_mb, report,
+                                                   cancel_token)
+                    elif name == 'fitz':
+                        result = _merge_with_fitz(page_list, output_path, options, cancel_token, report)
+                    else:
+                        result = _merge_with_pypdf(page_list, output_path, options, cancel_token, report)
+                except JobCancelled:
+                    raise
+                except Exception as e:
+                    tracing.report_error('merge', e, backend=name)
+                    continue
+            span.set(mode=name)
+            if report is not None: report['mode'] = name
+            break
+        if result and output_path and tracing.is_enabled():
+            span.set(output_bytes=os.path.getsize(output_path))
+    if report is not None:
+        report['peak_rss'] = peak_rss_bytes()
+    return result
+
+def _pixmap_to_image(pix):
+    # PNGへのエンコード/デコードを挟まず、ピクセル列から直接PIL画像を組み立てる
+    mode = "RGBA" if pix.alpha else "RGB"
+    return Image.frombytes(mode, (pix.width, pix.height), pix.samples)
+
+def _display_area(page, clip):
+    # clip はページ座標 (page.rect と同じく /Rotate 適用後) の (x0, y0, x1, y1)
+    return page.rect if clip is None else fitz.Rect(clip) & page.rect
+
+def _fit_zoom(area, rotation, box_w, box_h):
+    width, height = area.width, area.height
+    if rotation % 180: width, height = height, width
+    return min(box_w / width, box_h / height)
+
+def page_display_size(file_path, page_num, rotation=0):
+    """ページを保留中の回転を適用して表示したときの大きさ (pt)。ページがなければ None"""
+    with shared_pool.document(file_path) as doc:
         if page_num >= len(doc): return None
-        pix = doc.load_page(page_num).get_pixmap(dpi=150)
-        return Image.open(io.BytesIO(pix.tobytes("png")))
-    except: return None
+        rect = doc.load_page(page_num).rect
+        return (rect.height, rect.width) if rotation % 180 else (rect.width, rect.height)
 
-def get_page_thumbnail(file_path, page_num, rotation=0):
-    try:
-        doc = fitz.open(file_path)
+def render_page_fit(file_path, page_num, box_w, box_h, rotation=0, clip=None):
+    """
+    ページ (clip を指定するとその範囲) を box_w x box_h ピクセルの枠に収まる大きさで直接描画する。
+    固定の dpi で描画してから縮小・拡大しないので、A0 の図面でも巨大なピクスマップを作らず、
+    小さな用紙を大きく表示してもぼやけない。
+    """
+    with shared_pool.document(file_path) as doc:
         if page_num >= len(doc): return None
         page = doc.load_page(page_num)
-        if rotation != 0:
-            page.set_rotation(rotation)
-        pix = page.get_pixmap(dpi=72)
-        return Image.open(io.BytesIO(pix.tobytes("png")))
-    except Exception as e:
-        print(f"Thumbnail error: {e}")
-        return None
\ No newline at end of file
+        area = _display_area(page, clip)
+        if area.is_empty: return None
+        zoom = _fit_zoom(area, rotation, box_w, box_h)
+        pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom).prerotate(rotation), clip=area)
+        return _pixmap_to_image(pix)
+
+THUMBNAIL_BOX = (200, 200)  # 既定のサムネイルの枠 (GUI の等倍表示と同じ)
+
+def get_page_thumbnail(file_path, page_num, rotation=0, box_w=THUMBNAIL_BOX[0], box_h=THUMBNAIL_BOX[1]):
+    """サムネイルを box_w x box_h ピクセルの枠に収まる大きさで描画する。失敗したら None"""
+    with tracing.span('thumbnail', path=file_path, page=page_num, rotation=rotation, box=f"{box_w}x{box_h}"):
+        try:
+            return render_page_fit(file_path, page_num, box_w, box_h, rotation)
+        except Exception as e:
+            tracing.report_error('thumbnail', e, path=file_path, page=page_num)
+            return None
+
+def render_thumbnail_data(file_path, page_num, rotation, box_w, box_h):
+    """ワーカープロセス用: get_page_thumbnail の結果を (mode, size, bytes) で返す"""
+    img = get_page_thumbnail(file_path, page_num, rotation, box_w, box_h)
+    if img is None: return None
+    return img.mode, img.size, img.tobytes()
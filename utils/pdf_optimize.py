@@ -0,0 +1,205 @@
+"""
+結合結果の最適化 (共有リソースの重複排除・圧縮)
+
+同じレターヘッド・ロゴ・フォントを含むPDFを多数結合すると、元ファイルごとに
+同じ画像やフォントが1つずつ書き出される。ここでは結合後のドキュメントの全オブジェクトを
+内容ハッシュで比較し、同じものを1つにまとめる。
+(MuPDF の garbage=4 も重複ストリームをまとめるが、総当たりで比較するためオブジェクト数が
+多いと遅い)
+
+オプション (ジョブごとに指定できる):
+    dedupe          同じ内容のオブジェクト (フォント・画像・XObject など) を1つにまとめる
+    compress        圧縮されていないストリーム (ページ内容など) を Flate 圧縮する
+    object_streams  オブジェクトをオブジェクトストリームに入れ、xref も圧縮する
+"""
+import re
+import hashlib
+
+DEFAULT_OUTPUT_OPTIONS = {
+    'dedupe': True,
+    'compress': True,
+    'object_streams': False,
+}
+
+_REF_RE = re.compile(r"\b(\d+) (\d+) R\b")
+# ページツリーの構造そのものや、親への参照を持つオブジェクトはまとめない
+_STRUCTURAL_RE = re.compile(r"/Type\s*/(Page|Pages|Catalog|Annot)\b|/Parent\b|/P\s+\d+ \d+ R")
+# 注釈は /Type を省略できるが、/Subtype と /Rect は必ず持つ
+_ANNOT_RE = re.compile(r"/Type\s*/Annot\b|(?=.*/Subtype\s*/)(?=.*/Rect\s*\[)", re.S)
+_ANNOT_KEEP_KEY = "/SecurePDFMergerKeep"
+MAX_PASSES = 8
+
+
+def normalize_output_options(options=None):
+    """
+    オプションを既定値で補った dict にする。
+    None なら既定値、False ならすべて無効、True ならすべて有効。
+    """
+    if options is None: return dict(DEFAULT_OUTPUT_OPTIONS)
+    if options is True or options is False:
+        return {key: options for key in DEFAULT_OUTPUT_OPTIONS}
+    unknown = set(options) - set(DEFAULT_OUTPUT_OPTIONS)
+    if unknown:
+        raise ValueError(f"不明な出力オプションです: {', '.join(sorted(unknown))}")
+    merged = dict(DEFAULT_OUTPUT_OPTIONS)
+    merged.update({key: bool(value) for key, value in options.items()})
+    return merged
+
+
+def fitz_save_options(options):
+    """fitz.Document.save に渡す引数"""
+    return {
+        # 重複排除でどこからも参照されなくなったオブジェクトを捨てる。
+        # garbage=3 以上は MuPDF 自身が同じ内容のオブジェクトをまとめ、注釈まで複数ページで共有してしまう
+        'garbage': 1 if options['dedupe'] else 0,
+        'deflate': options['compress'],
+        'use_objstms': 1 if options['object_streams'] else 0,
+    }
+
+
+def dedupe_pypdf_writer(writer):
+    """
+    pypdf の PdfWriter で同じ内容のオブジェクトをまとめる。まとめられなければ False
+    (compress_identical_objects のない古い pypdf)。
+    compress_identical_objects は1回の呼び出しでは参照先が同じもの (画像本体など) しかまとめず、
+    それを参照する辞書 (XObject・フォント記述子など) は参照番号が違うまま残るので、減らなくなるまで繰り返す。
+    """
+    if not hasattr(writer, 'compress_identical_objects'): return False
+    # 注釈は1つのページにしか属せないので、ページごとに違う印を付けてまとめられないようにする
+    marked = _mark_pypdf_annotations(writer)
+    try:
+        for _ in range(MAX_PASSES):
+            before = sum(obj is not None for obj in writer._objects)
+            try:
+                writer.compress_identical_objects(remove_duplicates=True, remove_unreferenced=True)
+            except TypeError:
+                # pypdf 6 より前は引数名が違う
+                writer.compress_identical_objects(remove_identicals=True, remove_orphans=True)
+            if sum(obj is not None for obj in writer._objects) == before: break
+    finally:
+        for obj in marked: obj.pop(_ANNOT_KEEP_KEY, None)
+    return True
+
+
+def _mark_pypdf_annotations(writer):
+    """ページの注釈・ポップアップ・外観 (/AP) に一意の印を付け、付けたオブジェクトを返す"""
+    from pypdf.generic import DictionaryObject, NumberObject, NameObject
+
+    marked = []
+
+    def mark(obj):
+        obj = obj.get_object() if obj is not None else None
+        if not isinstance(obj, DictionaryObject) or _ANNOT_KEEP_KEY in obj: return
+        obj[NameObject(_ANNOT_KEEP_KEY)] = NumberObject(len(marked))
+        marked.append(obj)
+        return obj
+
+    for page in writer.pages:
+        for ref in page.get('/Annots') or []:
+            annot = mark(ref)
+            if annot is None: continue
+            mark(annot.get('/Popup'))
+            appearance = annot.get('/AP')
+            appearance = appearance.get_object() if appearance is not None else None
+            if not isinstance(appearance, DictionaryObject): continue
+            for state in appearance.values():
+                state = state.get_object()
+                # /N などは外観ストリームか、状態名 -> 外観ストリームの辞書
+                if isinstance(state, DictionaryObject) and not hasattr(state, 'get_data'):
+                    for stream in state.values(): mark(stream)
+                else:
+                    mark(state)
+    return marked
+
+
+def dedupe_objects(doc):
+    """
+    同じ内容のオブジェクトを1つにまとめ、参照を付け替える。まとめたオブジェクト数を返す。
+    参照先を正規化してからハッシュを取るので、同じ画像を参照する同じ XObject のように
+    入れ子になったものも (参照の深さの回数だけ繰り返して) まとめられる。
+    """
+    xref_count = doc.xref_length()
+    all_sources = {}
+    sources = {}
+    stream_hashes = {}
+    annots = []
+    for xref in range(1, xref_count):
+        try:
+            source = doc.xref_object(xref, compressed=True)
+        except Exception:
+            continue
+        if not source or source == 'null': continue
+        all_sources[xref] = source
+        # ストリームの辞書には必ず /Length があるので、それ以外は xref_stream_raw を呼ばない
+        raw = doc.xref_stream_raw(xref) if '/Length' in source else None
+        if raw is not None:
+            stream_hashes[xref] = hashlib.blake2b(raw, digest_size=16).digest()
+        if _ANNOT_RE.search(source):
+            annots.append(xref)
+        elif not _STRUCTURAL_RE.search(source):
+            sources[xref] = source
+    # 注釈は1つのページにしか属せないので、その外観 (/AP) やポップアップ (/Popup) も含めてまとめない
+    for xref in _annotation_parts(doc, annots):
+        sources.pop(xref, None)
+
+    canonical = {}  # 重複した xref -> 残す xref
+
+    def canonical_ref(m):
+        return f"{_resolve(canonical, int(m.group(1)))} {m.group(2)} R"
+
+    for _ in range(MAX_PASSES):
+        seen = {}
+        found = False
+        for xref, source in sources.items():
+            if xref in canonical: continue
+            key = (_REF_RE.sub(canonical_ref, source), stream_hashes.get(xref))
+            first = seen.setdefault(key, xref)
+            if first != xref:
+                canonical[xref] = first
+                found = True
+        if not found: break
+
+    if not canonical: return 0
+    _rewrite_references(doc, canonical, all_sources, stream_hashes)
+    return len(canonical)
+
+
+def _annotation_parts(doc, annots):
+    parts = set()
+    for xref in annots:
+        for key in ('AP', 'Popup'):
+            kind, value = doc.xref_get_key(xref, key)
+            if kind not in ('xref', 'dict'): continue
+            for m in _REF_RE.finditer(value):
+                ref = int(m.group(1))
+                parts.add(ref)
+                # /AP の /N などが状態名 -> 外観ストリームの辞書を参照している場合
+                if key == 'AP' and not doc.xref_is_stream(ref):
+                    parts.update(int(n.group(1)) for n in _REF_RE.finditer(doc.xref_object(ref, compressed=True)))
+    return parts
+
+
+def _resolve(canonical, xref):
+    # 後の周回で、残したはずの xref がさらに別のものにまとめられることがある
+    while xref in canonical:
+        xref = canonical[xref]
+    return xref
+
+
+def _rewrite_references(doc, canonical, all_sources, stream_hashes):
+    def replace(text):
+        return _REF_RE.sub(lambda m: f"{_resolve(canonical, int(m.group(1)))} {m.group(2)} R", text)
+
+    def references_duplicate(text):
+        return any(int(m.group(1)) in canonical for m in _REF_RE.finditer(text))
+
+    for xref, source in all_sources.items():
+        if xref in canonical or not references_duplicate(source): continue
+        if xref in stream_hashes:
+            # update_object はストリーム本体を失うため、辞書のキーごとに書き換える
+            for key in doc.xref_get_keys(xref):
+                kind, value = doc.xref_get_key(xref, key)
+                if kind in ('xref', 'array', 'dict') and references_duplicate(value):
+                    doc.xref_set_key(xref, key, replace(value))
+        else:
+            doc.update_object(xref, replace(source))
@@ -0,0 +1,124 @@
+"""
+PDFを順に書き足していくライター (省メモリ結合用)
+
+PdfWriter / fitz.Document は保存するまで全ページのオブジェクトをメモリに持つ。
+ここでは結合済みの区間 (セグメント) のPDFを1つずつ読み、ページから参照される
+オブジェクトを番号を振り直しながらすぐに出力ファイルへ書き出す。
+メモリに残るのは各オブジェクトの書き込み位置 (xref) とページ番号のリストだけで、
+セグメントを読み終えたらそのリーダーは破棄する。
+"""
+from collections import deque
+
+from pypdf import PdfReader
+from pypdf.generic import (
+    ArrayObject, DictionaryObject, IndirectObject, NameObject, NumberObject, StreamObject,
+)
+
+_PARENT = NameObject('/Parent')
+_LENGTH = NameObject('/Length')
+
+
+class StreamingPdfWriter:
+    def __init__(self, stream):
+        """stream: 書き込み用に開いたバイナリファイル"""
+        self._f = stream
+        self._offsets = [None]  # オブジェクト番号 -> 書き込み位置
+        self._page_numbers = []
+        self._f.write(b"%PDF-1.7\n%\xe2\xe3\xcf\xd3\n")
+        self._pages_root = self._reserve()
+
+    @property
+    def page_count(self):
+        return len(self._page_numbers)
+
+    def _reserve(self):
+        self._offsets.append(None)
+        return len(self._offsets) - 1
+
+    def append_pdf(self, path):
+        """path の全ページを末尾に追加する"""
+        reader = PdfReader(path)
+        mapping = {}     # (元の番号, 世代) -> 新しい番号
+        queue = deque()  # まだ書き出していない (元の参照)
+
+        def ref(indirect):
+            key = (indirect.idnum, indirect.generation)
+            number = mapping.get(key)
+            if number is None:
+                number = mapping[key] = self._reserve()
+                queue.append(indirect)
+            return IndirectObject(number, 0, None)
+
+        def copy(obj):
+            if isinstance(obj, IndirectObject): return ref(obj)
+            if isinstance(obj, DictionaryObject):
+                return DictionaryObject({k: copy(v) for k, v in obj.items()})
+            if isinstance(obj, ArrayObject):
+                return ArrayObject(copy(v) for v in obj)
+            return obj
+
+        # ページは継承された属性 (Resources / MediaBox など) を展開済みの reader.pages から書く
+        pages = {}
+        for page in reader.pages:
+            indirect = page.indirect_reference
+            pages[(indirect.idnum, indirect.generation)] = page
+            self._page_numbers.append(ref(indirect).idnum)
+
+        while queue:
+            indirect = queue.popleft()
+            key = (indirect.idnum, indirect.generation)
+            number = mapping[key]
+            page = pages.get(key)
+            if page is not None:
+                # 元のページツリーはたどらず、出力側のページツリーにつなぐ
+                obj = DictionaryObject({k: copy(v) for k, v in page.items() if k != _PARENT})
+                obj[_PARENT] = IndirectObject(self._pages_root, 0, None)
+                self._write(number, obj)
+            else:
+                self._write_object(number, indirect.get_object(), copy)
+
+    def _write_object(self, number, obj, copy):
+        if isinstance(obj, StreamObject):
+            # ストリームは圧縮されたままのデータをそのまま書き出す
+            data = obj._data
+            header = DictionaryObject({k: copy(v) for k, v in obj.items() if k != _LENGTH})
+            header[_LENGTH] = NumberObject(len(data))
+            self._begin(number)
+            header.write_to_stream(self._f)
+            self._f.write(b"\nstream\n")
+            self._f.write(data)
+            self._f.write(b"\nendstream\nendobj\n")
+        else:
+            self._write(number, copy(obj))
+
+    def _begin(self, number):
+        self._offsets[number] = self._f.tell()
+        self._f.write(f"{number} 0 obj\n".encode('ascii'))
+
+    def _write(self, number, obj):
+        self._begin(number)
+        if obj is None:
+            self._f.write(b"null")
+        else:
+            obj.write_to_stream(self._f)
+        self._f.write(b"\nendobj\n")
+
+    def close(self):
+        """ページツリー・カタログ・xref を書いてファイルを完成させる (stream は閉じない)"""
+        kids = " ".join(f"{n} 0 R" for n in self._page_numbers)
+        self._begin(self._pages_root)
+        self._f.write(f"<< /Type /Pages /Kids [{kids}] /Count {len(self._page_numbers)} >>\nendobj\n".encode('ascii'))
+
+        catalog = self._reserve()
+        self._begin(catalog)
+        self._f.write(f"<< /Type /Catalog /Pages {self._pages_root} 0 R >>\nendobj\n".encode('ascii'))
+
+        xref_offset = self._f.tell()
+        size = len(self._offsets)
+        self._f.write(f"xref\n0 {size}\n0000000000 65535 f \n".encode('ascii'))
+        for offset in self._offsets[1:]:
+            # 参照されていたが中身がない (null) オブジェクトは空きとして書く
+            line = f"{offset:010d} 00000 n \n" if offset is not None else "0000000000 00000 f \n"
+            self._f.write(line.encode('ascii'))
+        self._f.write(f"trailer\n<< /Size {size} /Root {catalog} 0 R >>\n"
+                      f"startxref\n{xref_offset}\n%%EOF\n".encode('ascii'))
@@ -0,0 +1,154 @@
+"""
+プレビュー描画エンジン
+
+結合リスト全体をメモリ上で結合してから1ページを表示するのではなく、
+N番目のページをその元ファイルから直接 (保留中の回転を適用して) 描画する。
+ページ数は結合結果ではなくページリストから数えるため、
+プレビューの待ち時間はジョブの大きさに依存しない。
+
+表示中のページとその前後数ページは、ジョブスケジューラー (utils/job_scheduler.py) の
+プレビュー用の優先度で表示枠に収まる大きさで直接描画し (pdf_ops.render_page_fit)、
+その画像を LRU に保持する (先読み)。矢印キーを押し続けても、Tk のスレッドでは描画済みの
+画像を貼るだけで済む。ページを送るたびに先読みの依頼を置き換えるので、古い依頼の残りは描画しない。
+元ファイルのハンドルはドキュメントプール (utils/doc_pool.py) で開いたまま使い回す。
+"""
+import threading
+from collections import OrderedDict
+
+from utils import pdf_ops
+from utils import tracing
+from utils.job_scheduler import JobScheduler, PRIORITY_PREVIEW
+
+PREFETCH_AHEAD = 3    # 表示中のページの次に描画しておくページ数
+PREFETCH_BEHIND = 2   # 前に描画しておくページ数
+CACHE_SIZE = 24       # 保持する描画済み画像の数
+
+
+class PreviewEngine:
+    def __init__(self, landscape_box=(950, 700), portrait_box=(650, 800),
+                 prefetch_ahead=PREFETCH_AHEAD, prefetch_behind=PREFETCH_BEHIND, cache_size=CACHE_SIZE,
+                 on_ready=None, scheduler=None):
+        """
+        landscape_box / portrait_box: 横長 / 縦長のページを縮小して収める枠 (ピクセル)
+        on_ready(page_num): 先読みしたページの描画が終わったときに描画スレッドから呼ばれる
+                            (UI側では after() で受け取ること)
+        scheduler: 先読みを実行する JobScheduler (省略時は専用のものを作る)
+        """
+        self.landscape_box = landscape_box
+        self.portrait_box = portrait_box
+        self.prefetch_ahead = prefetch_ahead
+        self.prefetch_behind = prefetch_behind
+        self.cache_size = cache_size
+        self.on_ready = on_ready
+        self.pages = []
+
+        self._own_scheduler = scheduler is None
+        self.scheduler = scheduler or JobScheduler(max_workers=1, reserved=0)
+        self._job_key = ('preview', id(self))
+        self._cache = OrderedDict()  # (path, page_index, rotation) -> 表示用の画像 (失敗は None)
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def set_pages(self, page_list):
+        # リストの並びだけを保持する (各ページの dict は App 側と共有)
+        self.scheduler.cancel(self._job_key)
+        with self._lock:
+            self.pages = list(page_list)
+
+    @property
+    def total_pages(self):
+        return len(self.pages)
+
+    def page_item(self, page_num):
+        if 0 <= page_num < len(self.pages):
+            return self.pages[page_num]
+        return None
+
+    def _key(self, item):
+        # 回転は App 側でその場で書き換わるので、依頼した時点の値でキーを作る
+        return (item['path'], item['page_index'], item.get('rotation', 0) % 360)
+
+    def render(self, page_num):
+        """page_num をその場で描画する (先読みを使わない場合)"""
+        item = self.page_item(page_num)
+        if item is None: return None
+        with tracing.span('preview', path=item['path'], page=item['page_index']):
+            try:
+                return self.render_fit(item['path'], item['page_index'], item.get('rotation', 0))
+            except Exception as e:
+                tracing.report_error('preview', e, path=item['path'], page=item['page_index'])
+                return None
+
+    def render_fit(self, path, page_index, rotation):
+        """表示枠 (ページの向きで縦長用 / 横長用を選ぶ) に収まる大きさで描画する"""
+        size = pdf_ops.page_display_size(path, page_index, rotation)
+        if size is None: return None
+        box_w, box_h = self.landscape_box if size[0] > size[1] else self.portrait_box
+        return pdf_ops.render_page_fit(path, page_index, box_w, box_h, rotation)
+
+    def cached(self, page_num):
+        """
+        描画済みなら (True, 画像) を返す (描画に失敗したページは (True, None))。
+        まだなら (False, None)。
+        """
+        item = self.page_item(page_num)
+        if item is None: return True, None
+        key = self._key(item)
+        with self._lock:
+            if key not in self._cache: return False, None
+            self._cache.move_to_end(key)
+            return True, self._cache[key]
+
+    def prefetch(self, page_num):
+        """
+        page_num とその前後を描画するよう依頼する。前の依頼は置き換えられ、残りは描画されない
+        (ページを送り続けても、今表示したいページが先に描画される)。
+        """
+        with self._lock:
+            if self._closed: return
+            order = [page_num]
+            for d in range(1, max(self.prefetch_ahead, self.prefetch_behind) + 1):
+                if d <= self.prefetch_ahead: order.append(page_num + d)
+                if d <= self.prefetch_behind: order.append(page_num - d)
+            batch = []
+            for n in order:
+                item = self.pages[n] if 0 <= n < len(self.pages) else None
+                if item is None: continue
+                key = self._key(item)
+                if key in self._cache: continue
+                batch.append((n, key))
+        if batch:
+            self.scheduler.submit(self._render_batch, batch, priority=PRIORITY_PREVIEW, key=self._job_key,
+                                  name='preview')
+        else:
+            self.scheduler.cancel(self._job_key)
+
+    def _render_batch(self, token, batch):
+        for page_num, key in batch:
+            token.check()
+            with self._lock:
+                if key in self._cache: continue
+
+            path, page_index, rotation = key
+            with tracing.span('preview', path=path, page=page_index, prefetch=True):
+                try:
+                    image = self.render_fit(path, page_index, rotation)
+                except Exception as e:
+                    tracing.report_error('preview', e, path=path, page=page_index)
+                    image = None
+
+            with self._lock:
+                if self._closed: return
+                self._cache[key] = image
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+            if self.on_ready:
+                self.on_ready(page_num)
+
+    def close(self):
+        """先読みを止める (描画中のページは終わってから止まる)"""
+        self.scheduler.cancel(self._job_key)
+        with self._lock:
+            self._closed = True
+            self._cache.clear()
+        if self._own_scheduler: self.scheduler.shutdown()
@@ -0,0 +1,77 @@
+"""
+一定ページごとに一時ファイルへ書き出す reportlab のキャンバス
+
+reportlab の Canvas は save() するまで全ページをメモリに持つ。ここでは segment_pages ページごとに
+別の一時ファイル (セグメント) として保存し、最後に StreamingPdfWriter で出力ファイルへ
+1つずつ書き足す。セグメントは読み終えたら閉じて削除するので、メモリ使用量はページ数によらず一定。
+
+    pages = SegmentedCanvas(output_path, page_size)
+    try:
+        c = pages.canvas      # 現在のページを描くキャンバス
+        ...
+        pages.show_page()     # ページを確定する (c.showPage() の代わり)
+        ...
+        pages.finish()        # 最後のページを確定して出力ファイルを作る
+    finally:
+        pages.cleanup()       # 残った一時ファイルを消す
+"""
+import os
+
+from reportlab.pdfgen import canvas as rl_canvas
+
+from utils.pdf_stream_writer import StreamingPdfWriter
+
+SEGMENT_PAGES = 500  # 1つの一時ファイルに書き出すページ数
+
+
+class SegmentedCanvas:
+    def __init__(self, output_path, page_size, segment_pages=SEGMENT_PAGES):
+        self.output_path = output_path
+        self.page_size = page_size
+        self.segment_pages = segment_pages
+        self.segment_paths = []
+        self._canvas = None
+        self._pages = 0
+
+    @property
+    def canvas(self):
+        """現在のセグメントのキャンバス (必要なら新しいセグメントを開く)"""
+        if self._canvas is None:
+            base, ext = os.path.splitext(self.output_path)
+            path = f"{base}.part{len(self.segment_paths)}.tmp{ext}"
+            self.segment_paths.append(path)
+            self._canvas = rl_canvas.Canvas(path, pagesize=self.page_size, pageCompression=1)
+            self._pages = 0
+        return self._canvas
+
+    def show_page(self):
+        self._canvas.showPage()
+        self._pages += 1
+        if self._pages >= self.segment_pages:
+            self._canvas.save()
+            self._canvas = None
+
+    def finish(self):
+        """描画中のページを確定し、セグメントを出力ファイルへ連結する"""
+        if self._canvas is not None:
+            self._canvas.save()
+            self._canvas = None
+        if len(self.segment_paths) == 1:
+            os.replace(self.segment_paths.pop(), self.output_path)
+            return
+        with open(self.output_path, 'wb') as f:
+            writer = StreamingPdfWriter(f)
+            for path in self.segment_paths:
+                writer.append_pdf(path)
+                _remove(path)
+            writer.close()
+
+    def cleanup(self):
+        for path in self.segment_paths:
+            _remove(path)
+        self.segment_paths = []
+
+
+def _remove(path):
+    try: os.remove(path)
+    except OSError: pass
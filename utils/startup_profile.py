@@ -0,0 +1,113 @@
+"""
+起動時間の計測
+
+GUI を --startup-profile 付きで起動すると、最初のウィンドウが表示されるまでの時間と
+その時点のメモリ使用量を JSON で書き出して終了する。
+
+    python main.py --startup-profile startup.json
+    python main.py --startup-profile          (標準出力へ)
+
+記録する内容:
+    ・marks: main.py の先頭を 0 とした各段階の時刻 (ms)。imports (モジュールの読み込み完了) /
+      app_created (App の構築完了) / first_window (メインループが始まり、最初の描画を終えた時点)
+    ・before_main_ms: プロセスの生成から main.py の先頭までの時間 (インタプリタの起動、
+      PyInstaller の展開を含む)。取得できないOSでは null
+    ・rss_bytes / peak_rss_bytes: 最初のウィンドウを表示した時点の RSS とピーク RSS
+    ・heavy_modules: 起動時に読み込まれていた重いライブラリ (変換器のライブラリは、
+      使うまで読み込まれないはず。utils/converters.py を参照)
+"""
+import os
+import sys
+import json
+import time
+import platform
+
+from utils.memory_usage import current_rss_bytes, peak_rss_bytes
+
+PROFILE_FLAG = "--startup-profile"
+HEAVY_MODULES = ('xhtml2pdf', 'reportlab', 'openpyxl', 'pandas', 'docx2pdf', 'comtypes', 'fitz', 'pypdf')
+
+
+def requested_output(argv):
+    """argv に --startup-profile があれば出力先 ('-' は標準出力)、なければ None"""
+    if PROFILE_FLAG not in argv: return None
+    i = argv.index(PROFILE_FLAG)
+    if i + 1 < len(argv) and not argv[i + 1].startswith('-'): return argv[i + 1]
+    return '-'
+
+
+def process_age():
+    """プロセスが生成されてからの秒数。取得できなければ None"""
+    try:
+        if sys.platform == "win32": return _process_age_windows()
+        # Linux: /proc/self/stat の22番目がブートからの起動時刻 (clock tick)。
+        # 2番目のコマンド名に空白や括弧が入りうるので、最後の ')' より後を数える
+        with open("/proc/self/stat") as f: fields = f.read().rsplit(')', 1)[1].split()
+        with open("/proc/uptime") as f: uptime = float(f.read().split()[0])
+        return uptime - int(fields[19]) / os.sysconf("SC_CLK_TCK")
+    except Exception:
+        return None
+
+
+def _process_age_windows():
+    import ctypes
+    from ctypes import wintypes
+
+    creation, exit_, kernel, user = (wintypes.FILETIME() for _ in range(4))
+    kernel32 = ctypes.windll.kernel32
+    if not kernel32.GetProcessTimes(kernel32.GetCurrentProcess(), ctypes.byref(creation), ctypes.byref(exit_),
+                                    ctypes.byref(kernel), ctypes.byref(user)):
+        return None
+    now = wintypes.FILETIME()
+    kernel32.GetSystemTimeAsFileTime(ctypes.byref(now))
+
+    def ticks(ft): return (ft.dwHighDateTime << 32) | ft.dwLowDateTime
+    return (ticks(now) - ticks(creation)) / 1e7  # 100ns 単位
+
+
+class StartupProfile:
+    def __init__(self, started=None):
+        """started: main.py の先頭で取った time.perf_counter() の値"""
+        now = time.perf_counter()
+        self.started = started if started is not None else now
+        age = process_age()
+        self.before_main = None if age is None else max(0.0, age - (now - self.started))
+        self.marks = {}
+
+    def mark(self, name):
+        self.marks[name] = (time.perf_counter() - self.started) * 1000
+
+    def report(self):
+        from utils import converters
+        return {
+            'created': time.strftime("%Y-%m-%dT%H:%M:%S"),
+            'platform': platform.platform(),
+            'python': platform.python_version(),
+            'frozen': bool(getattr(sys, 'frozen', False)),
+            'before_main_ms': None if self.before_main is None else self.before_main * 1000,
+            'marks': dict(self.marks),
+            'rss_bytes': current_rss_bytes(),
+            'peak_rss_bytes': peak_rss_bytes(),
+            'modules': len(sys.modules),
+            'heavy_modules': [name for name in HEAVY_MODULES if name in sys.modules],
+            'converters_loaded': [s['name'] for s in converters.status() if s['import_seconds']],
+        }
+
+    def write(self, output):
+        text = json.dumps(self.report(), ensure_ascii=False, indent=2)
+        if output == '-':
+            print(text)
+        else:
+            with open(output, 'w', encoding='utf-8') as f: f.write(text + "\n")
+
+    def finish_on_first_window(self, window, output):
+        """メインループの最初の描画を終えたら記録を書き出し、window を閉じる"""
+        def first_window():
+            window.update_idletasks()
+            self.mark('first_window')
+            try:
+                self.write(output)
+            except OSError as e:
+                print(f"[startup_profile] {e}", file=sys.stderr)
+            window.after(0, window.destroy)
+        window.after_idle(first_window)
@@ -0,0 +1,159 @@
+"""
+CSV / Excel の表をPDFに描画する (ストリーミング)
+
+シート全体を DataFrame に読み込んで巨大なHTMLを作る代わりに、行を少しずつ読みながら
+reportlab のキャンバスに直接表を描く。各ページの先頭には見出し行を繰り返す。
+列幅は先頭の数百行から決めるので、行データ全体をメモリに持つことはない。
+描き終えたページは一定枚数ごとに一時ファイルへ書き出して出力ファイルへ順に書き足す
+(utils/segmented_canvas.py) ので、メモリ使用量は行数によらず一定。
+"""
+import csv
+import itertools
+
+from reportlab.lib.pagesizes import A4, landscape, portrait
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.lib.units import mm
+
+from utils.encoding import detect_encoding
+from utils.fonts import get_text_font
+from utils.job_scheduler import check_cancelled
+from utils.segmented_canvas import SegmentedCanvas
+
+SAMPLE_ROWS = 200       # 列幅の計算に使う先頭行数
+MAX_COL_CHARS = 40      # 1列の幅の目安の上限 (文字数)
+
+
+def _cell_text(value):
+    if value is None: return ""
+    if isinstance(value, float):
+        if value != value: return ""  # NaN
+        if value.is_integer(): return str(int(value))
+    return str(value).replace('\r', ' ').replace('\n', ' ')
+
+
+def iter_table_rows(source_path):
+    """見出し行を含む各行を文字列のリストで返すジェネレーター"""
+    lower = source_path.lower()
+    if lower.endswith('.csv'):
+        encoding = detect_encoding(source_path)
+        with open(source_path, 'r', encoding=encoding, errors='replace', newline='') as f:
+            for row in csv.reader(f):
+                yield row
+    elif lower.endswith('.xlsx'):
+        from openpyxl import load_workbook
+        wb = load_workbook(source_path, read_only=True, data_only=True)
+        try:
+            for row in wb.active.iter_rows(values_only=True):
+                yield [_cell_text(v) for v in row]
+        finally:
+            wb.close()
+    else:
+        # .xls は行単位で読めないため pandas で読む (形式上 65,536 行が上限)
+        import pandas as pd
+        df = pd.read_excel(source_path)
+        yield [_cell_text(v) for v in df.columns]
+        for row in df.itertuples(index=False, name=None):
+            yield [_cell_text(v) for v in row]
+
+
+def _column_widths(header, sample, font_name, font_size, usable_width, padding):
+    n = len(header)
+    widths = []
+    for i in range(n):
+        texts = [header[i]] + [r[i] for r in sample if i < len(r)]
+        w = max(stringWidth(t[:MAX_COL_CHARS], font_name, font_size) for t in texts)
+        widths.append(max(w, font_size) + padding * 2)
+    # 従来のHTML表 (width: 100%) と同じく、比率を保って用紙幅に合わせる
+    # (縮める場合、はみ出す文字は省略表示)
+    total = sum(widths)
+    return [w * usable_width / total for w in widths]
+
+
+def _fit_text(text, width, font_name, font_size):
+    # 全角でも1文字はおおむね1em以内なので、明らかに収まる短い文字列は幅を測らない
+    if not text or len(text) * font_size * 1.05 <= width:
+        return text
+    if stringWidth(text, font_name, font_size) <= width:
+        return text
+    ellipsis = "…"
+    # 幅から文字数を見積もってから詰める (1文字ずつ測るより速い)
+    n = max(0, int(len(text) * width / stringWidth(text, font_name, font_size)))
+    while n > 0 and stringWidth(text[:n] + ellipsis, font_name, font_size) > width:
+        n -= 1
+    return text[:n] + ellipsis if n > 0 else ""
+
+
+def render_table_pdf(source_path, output_path, is_landscape=False, font_size=8, cancel_token=None):
+    page_size = landscape(A4) if is_landscape else portrait(A4)
+    width, height = page_size
+    margin = 10 * mm
+    padding = 3
+    row_h = font_size * 1.8
+    font_name = get_text_font()
+
+    rows = iter_table_rows(source_path)
+    header = next(rows, None)
+    if not header: return False
+    header = [_cell_text(v) for v in header]
+    n_cols = len(header)
+
+    sample = list(itertools.islice(rows, SAMPLE_ROWS))
+    col_widths = _column_widths(header, sample, font_name, font_size, width - margin * 2, padding)
+    col_x = [margin]
+    for w in col_widths: col_x.append(col_x[-1] + w)
+    fitted_header = [_fit_text(t, w - padding * 2, font_name, font_size) for t, w in zip(header, col_widths)]
+
+    # reportlab は保存するまで全ページを保持するので、一定ページごとに一時ファイルへ書き出す
+    pages = SegmentedCanvas(output_path, page_size)
+    top = height - margin
+
+    def draw_cells(values, y):
+        c = pages.canvas
+        text_y = y - row_h + (row_h - font_size) / 2 + 1
+        # セルごとに drawString せず、1行を1つのテキストオブジェクトにまとめる
+        # (セルの位置は setTextOrigin で指定するので、textOut が進める文字送りは使わない)
+        tx = c.beginText()
+        tx.setFont(font_name, font_size)
+        for i in range(min(n_cols, len(values))):
+            if values[i]:
+                tx.setTextOrigin(col_x[i] + padding, text_y)
+                tx.textOut(values[i])
+        c.drawText(tx)
+
+    def start_page():
+        c = pages.canvas
+        c.setFont(font_name, font_size)
+        c.setFillGray(0.94)
+        c.rect(col_x[0], top - row_h, col_x[-1] - col_x[0], row_h, stroke=0, fill=1)
+        c.setFillGray(0)
+        draw_cells(fitted_header, top)
+        return top - row_h
+
+    def finish_page(y):
+        # 罫線はページごとにまとめて引く
+        c = pages.canvas
+        c.setLineWidth(0.5)
+        line_y = top
+        while line_y >= y - 0.01:
+            c.line(col_x[0], line_y, col_x[-1], line_y)
+            line_y -= row_h
+        for x in col_x:
+            c.line(x, top, x, y)
+
+    try:
+        y = start_page()
+        for row in itertools.chain(sample, rows):
+            if y - row_h < margin:
+                check_cancelled(cancel_token)
+                finish_page(y)
+                pages.show_page()
+                y = start_page()
+            values = [_fit_text(_cell_text(v), col_widths[i] - padding * 2, font_name, font_size)
+                      for i, v in enumerate(row[:n_cols])]
+            draw_cells(values, y)
+            y -= row_h
+        finish_page(y)
+        pages.finish()
+        return True
+    finally:
+        pages.cleanup()
@@ -0,0 +1,275 @@
+"""
+テキスト / ログファイルをPDFに描画する (ストリーミング)
+
+ファイル全体を readlines() で読む代わりに、先頭の一部で文字コードを1回だけ判定し、
+バイト列をブロック単位で読みながら1行ずつ描画する。描き終えたページは一定枚数ごとに
+一時ファイルへ書き出して出力ファイルへ順に書き足す (utils/segmented_canvas.py) ので、
+メモリ使用量はファイルサイズによらず一定。
+用紙幅に収まらない長い行は折り返す。
+
+巨大なログ向けに、範囲を絞って変換することもできる (TextWindow):
+    "head:1000"          先頭 1000 行
+    "tail:1000"          末尾 1000 行 (ファイル末尾から逆向きに探すので全体は読まない)
+    "bytes:0-1048576"    バイト範囲 (行の途中で始まる/終わる場合は行単位に揃える)
+"""
+import os
+import codecs
+import itertools
+
+from reportlab.lib.pagesizes import A4, landscape, portrait
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.lib.units import mm
+
+from utils.encoding import detect_encoding
+from utils.fonts import get_text_font
+from utils.job_scheduler import check_cancelled
+from utils.segmented_canvas import SegmentedCanvas
+
+BLOCK_SIZE = 64 * 1024
+MAX_LINE_CHARS = 64 * 1024  # 改行のない巨大な行もこの長さで区切って描画する
+TAB_SIZE = 4
+
+
+class TextWindow:
+    """変換する範囲 (head / tail は行数、bytes はバイト範囲 [start, end))"""
+    __slots__ = ('kind', 'start', 'end')
+
+    def __init__(self, kind, start, end=None):
+        self.kind = kind
+        self.start = start
+        self.end = end
+
+    @classmethod
+    def parse(cls, spec):
+        """ "head:N" / "tail:N" / "bytes:START-END" を解釈する。不正なら ValueError"""
+        if spec is None or isinstance(spec, TextWindow): return spec
+        kind, _, value = str(spec).strip().lower().partition(':')
+        try:
+            if kind in ('head', 'tail'):
+                count = int(value)
+                if count <= 0: raise ValueError
+                return cls(kind, count)
+            if kind == 'bytes':
+                start, _, end = value.partition('-')
+                start = int(start) if start.strip() else 0
+                end = int(end) if end.strip() else None
+                if start < 0 or (end is not None and end <= start): raise ValueError
+                return cls(kind, start, end)
+        except ValueError:
+            pass
+        raise ValueError(f"テキストの変換範囲が不正です: {spec}")
+
+    def cache_tag(self):
+        """変換キャッシュのファイル名に含める識別子"""
+        if self.kind == 'bytes':
+            return f"b{self.start}-{'' if self.end is None else self.end}"
+        return f"{self.kind}{self.start}"
+
+    def describe(self):
+        if self.kind == 'head': return f"先頭 {self.start} 行"
+        if self.kind == 'tail': return f"末尾 {self.start} 行"
+        end = "末尾" if self.end is None else f"{self.end:,}"
+        return f"{self.start:,} - {end} バイト"
+
+
+def _bom_length(encoding, head):
+    if encoding == 'utf-8-sig' and head.startswith(codecs.BOM_UTF8): return len(codecs.BOM_UTF8)
+    if encoding == 'utf-16' and head[:2] in (codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE): return 2
+    return 0
+
+
+def _seek_encoding(encoding, head):
+    """ファイルの途中から読むときの文字コード (BOM がない位置から正しく読めるもの)"""
+    if encoding == 'utf-8-sig': return 'utf-8'
+    if encoding == 'utf-16':
+        return 'utf-16-be' if head.startswith(codecs.BOM_UTF16_BE) else 'utf-16-le'
+    return encoding
+
+
+def _iter_decoded_lines(f, encoding, limit=None):
+    """
+    f の現在位置から読み、1行ずつ (改行なしで) 返す。
+    limit バイトを読み終えたら、読みかけの行だけ最後まで読んで止まる。
+    """
+    decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+    pending = ""
+    remaining = limit
+    finishing = False
+    while True:
+        size = BLOCK_SIZE if remaining is None or finishing else min(BLOCK_SIZE, remaining)
+        if size <= 0:
+            # 範囲の終端が行の途中なら、その行の終わりまでは読む
+            if not pending and not decoder.getstate()[0]: return
+            finishing = True
+            continue
+        block = f.read(size)
+        if not block: break
+        if remaining is not None and not finishing:
+            remaining -= len(block)
+        pending += decoder.decode(block)
+        lines = pending.split('\n')
+        pending = lines.pop()
+        if finishing and lines:
+            yield lines[0].rstrip('\r')
+            return
+        for line in lines:
+            yield line.rstrip('\r')
+        while len(pending) > MAX_LINE_CHARS:
+            yield pending[:MAX_LINE_CHARS]
+            pending = pending[MAX_LINE_CHARS:]
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending.rstrip('\r')
+
+
+def _tail_offset(f, file_size, count, newline, unit, data_start):
+    """末尾 count 行が始まるバイト位置を、ファイル末尾から逆向きに探す"""
+    pos = file_size
+    # 最後の行の末尾の改行は数えない
+    f.seek(max(data_start, file_size - len(newline)))
+    if f.read(len(newline)) == newline:
+        pos -= len(newline)
+    remaining = count
+    carry = b""
+    while pos > data_start:
+        read_start = max(data_start, pos - BLOCK_SIZE)
+        f.seek(read_start)
+        block = f.read(pos - read_start) + carry
+        i = len(block)
+        while True:
+            i = block.rfind(newline, 0, i)
+            if i < 0: break
+            if (read_start + i - data_start) % unit == 0:
+                remaining -= 1
+                if remaining == 0:
+                    return read_start + i + len(newline)
+            if i == 0: break
+        # ブロックの境目で改行が分かれる場合に備えて、先頭の数バイトを次に持ち越す
+        carry = block[:len(newline) - 1]
+        pos = read_start
+    return data_start
+
+
+def iter_text_lines(source_path, window=None):
+    """
+    テキストファイルの各行を返すジェネレーター。
+    window (TextWindow) を指定すると、その範囲の行だけを返す。
+    """
+    window = TextWindow.parse(window)
+    encoding = detect_encoding(source_path)
+    file_size = os.path.getsize(source_path)
+
+    with open(source_path, 'rb') as f:
+        head = f.read(4)
+        data_start = _bom_length(encoding, head)
+        seek_encoding = _seek_encoding(encoding, head)
+        unit = 2 if seek_encoding.startswith('utf-16') else 1
+        newline = '\n'.encode(seek_encoding)
+
+        if window is None or window.kind == 'head':
+            f.seek(data_start)
+            lines = _iter_decoded_lines(f, seek_encoding)
+            if window is not None:
+                lines = itertools.islice(lines, window.start)
+            yield from lines
+            return
+
+        if window.kind == 'tail':
+            f.seek(_tail_offset(f, file_size, window.start, newline, unit, data_start))
+            yield from _iter_decoded_lines(f, seek_encoding)
+            return
+
+        # バイト範囲: 文字の途中から始まらないよう文字単位に揃え、1文字手前から読む。
+        # 最初の (途中から始まった、または直前の改行だけの) 行は捨てる
+        start = max(data_start, window.start)
+        start -= (start - data_start) % unit
+        end = file_size if window.end is None else min(window.end, file_size)
+        if start >= end: return
+        if start > data_start:
+            f.seek(start - unit)
+            lines = _iter_decoded_lines(f, seek_encoding, limit=end - start + unit)
+            next(lines, None)
+        else:
+            f.seek(start)
+            lines = _iter_decoded_lines(f, seek_encoding, limit=end - start)
+        yield from lines
+
+
+def _wrap_line(line, width, font_name, font_size):
+    """用紙幅に収まるよう行を折り返す"""
+    # 全角でも1文字はおおむね1em以内なので、明らかに収まる短い行は幅を測らない
+    if len(line) * font_size * 1.05 <= width:
+        return [line]
+    # 1行に入りうる最大の文字数 (細い文字でも 0.2em はある) より先は測らない
+    max_chars = int(width / (font_size * 0.2)) + 1
+    parts = []
+    while line:
+        chunk = line[:max_chars]
+        chunk_w = stringWidth(chunk, font_name, font_size)
+        if chunk_w <= width and len(chunk) == len(line):
+            parts.append(line)
+            break
+        # 幅から文字数を見積もってから詰める (1文字ずつ測るより速い)
+        n = max(1, int(len(chunk) * width / chunk_w))
+        while n > 1 and stringWidth(line[:n], font_name, font_size) > width:
+            n -= 1
+        while n < len(line) and stringWidth(line[:n + 1], font_name, font_size) <= width:
+            n += 1
+        parts.append(line[:n])
+        line = line[n:]
+    return parts
+
+
+def render_text_pdf(source_path, output_path, is_landscape=False, window=None, font_name=None, font_size=10.5,
+                    cancel_token=None):
+    window = TextWindow.parse(window)
+    page_size = landscape(A4) if is_landscape else portrait(A4)
+    width, height = page_size
+    margin = 20 * mm
+    line_height = 14
+    usable_width = width - margin * 2
+    font_name = font_name or get_text_font()
+    top = height - margin
+
+    # reportlab は保存するまで全ページを保持するので、一定ページごとに一時ファイルへ書き出す
+    pages = SegmentedCanvas(output_path, page_size)
+    state = {'tx': None, 'y': top}
+
+    def new_page():
+        check_cancelled(cancel_token)
+        if state['tx'] is not None:
+            pages.canvas.drawText(state['tx'])
+            pages.show_page()
+        tx = pages.canvas.beginText(margin, top)
+        tx.setFont(font_name, font_size)
+        tx.setLeading(line_height)
+        state['tx'] = tx
+        state['y'] = top
+
+    def write(text):
+        if state['tx'] is None or state['y'] < margin:
+            new_page()
+        # 行ごとに drawString せず、1ページを1つのテキストオブジェクトにまとめる
+        state['tx'].textLine(text)
+        state['y'] -= line_height
+
+    try:
+        if window is not None:
+            write(f"[{os.path.basename(source_path)}: {window.describe()}のみ]")
+            write("")
+
+        for line in iter_text_lines(source_path, window):
+            line = line.expandtabs(TAB_SIZE).rstrip()
+            if not line:
+                write("")
+                continue
+            for part in _wrap_line(line, usable_width, font_name, font_size):
+                write(part)
+
+        if state['tx'] is None:
+            new_page()  # 空のファイルでも1ページは出力する
+        pages.canvas.drawText(state['tx'])
+        pages.finish()
+        return True
+    finally:
+        pages.cleanup()
@@ -0,0 +1,76 @@
+"""
+サムネイルキャッシュ (ディスク + メモリの2段構成)
+
+キーはファイル内容のハッシュ・ページ番号・回転・ピクセルサイズなので、
+同じファイルを2回追加した場合や、次回起動時にも描画結果を使い回せる。
+ディスク側は容量の上限を超えると、最後に使われた時刻 (mtime) の古い順に削除する。
+メモリ側は表示用オブジェクト (CTkImage など) を件数上限付きのLRUで保持する。
+"""
+import os
+import threading
+from collections import OrderedDict
+
+from utils.cache_utils import get_cache_dir, dir_entries
+
+
+# 描画方法を変えたら上げる (古い描画結果をキャッシュから使わない)
+RENDER_VERSION = 2
+
+
+def thumbnail_key(content_hash, page_index, rotation, box_w, box_h):
+    return f"{content_hash}_{page_index}_{rotation % 360}_{box_w}x{box_h}_r{RENDER_VERSION}"
+
+
+class ThumbnailCache:
+    def __init__(self, cache_dir=None, max_bytes=256 * 1024 * 1024, memory_items=400):
+        self.cache_dir = cache_dir or get_cache_dir("thumbnails")
+        self.max_bytes = max_bytes
+        self.memory_items = memory_items
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk_bytes = None  # 初回の書き込み時に集計する
+
+    # --- メモリ (表示用オブジェクト) ---
+    def get_memory(self, key):
+        obj = self._memory.get(key)
+        if obj is not None:
+            self._memory.move_to_end(key)
+        return obj
+
+    def put_memory(self, key, obj):
+        self._memory[key] = obj
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    # --- ディスク ---
+    def disk_path(self, key):
+        # 1フォルダのファイル数が増えすぎないよう、ハッシュ先頭2文字で振り分ける
+        return os.path.join(self.cache_dir, key[:2], f"{key}.png")
+
+    def record_write(self, size):
+        """ワーカーが1件書き込んだ後に呼ぶ。上限を超えていれば古いものから削除する"""
+        with self._lock:
+            if self._disk_bytes is None:
+                self._disk_bytes = sum(e[1] for e in dir_entries(self.cache_dir))
+            else:
+                self._disk_bytes += size
+            if self._disk_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        # 上限の9割まで減らし、毎回の削除を避ける
+        target = int(self.max_bytes * 0.9)
+        entries = sorted(dir_entries(self.cache_dir))
+        total = sum(e[1] for e in entries)
+        for _, size, path in entries:
+            if total <= target: break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+        self._disk_bytes = total
+
+    def clear_memory(self):
+        self._memory.clear()
@@ -0,0 +1,130 @@
+"""
+サムネイルのバックグラウンド描画
+
+PyMuPDF はスレッドセーフではないため、描画はワーカープロセスのプールで並列に行う。
+依頼は優先度付きキューに積み、表示中の行から先にワーカーへ渡す。
+同時にワーカーへ渡す件数を絞っているので、スクロール時は cancel_pending() で
+未着手の依頼を捨てて、見えている分だけを依頼し直せる。
+完了通知はワーカーの結果待ちスレッドから呼ばれるので、UI側では after() で受け取ること。
+ディスクキャッシュ (utils/thumb_cache.py) の読み書きもワーカー側で行う。
+トレースの記録中は、ワーカーで記録したスパンを結果と一緒に受け取って取り込む。
+"""
+import os
+import heapq
+import itertools
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image
+
+from utils import pdf_ops
+from utils import tracing
+
+
+def _render_job(cache_path, file_path, page_index, rotation, box_w, box_h, trace=False):
+    """ワーカープロセス側: (mode, size, bytes, 書き込んだバイト数, トレース) を返す"""
+    if trace: tracing.enable()
+    data = _render_cached(cache_path, file_path, page_index, rotation, box_w, box_h)
+    if data is None: return None
+    return data + (tracing.drain() if trace else None,)
+
+
+def _render_cached(cache_path, file_path, page_index, rotation, box_w, box_h):
+    """ディスクキャッシュにあれば読み、なければ描画して保存する"""
+    if cache_path and os.path.exists(cache_path):
+        try:
+            with Image.open(cache_path) as img:
+                img.load()
+                os.utime(cache_path)  # LRU用に最終利用時刻を更新
+                return img.mode, img.size, img.tobytes(), 0
+        except Exception:
+            pass  # 壊れたキャッシュは描画し直して上書きする
+
+    data = pdf_ops.render_thumbnail_data(file_path, page_index, rotation, box_w, box_h)
+    if data is None: return None
+    written = 0
+    if cache_path:
+        try:
+            mode, size, raw = data
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+            Image.frombytes(mode, size, raw).save(tmp_path, "PNG")
+            os.replace(tmp_path, cache_path)
+            written = os.path.getsize(cache_path)
+        except OSError as e:
+            tracing.report_error('thumbnail_cache', e, path=cache_path)
+    return data + (written,)
+
+
+class ThumbnailRenderer:
+    def __init__(self, max_workers=None, on_done=None, disk_cache=None):
+        self.max_workers = max_workers or max(1, min(4, (os.cpu_count() or 2) - 1))
+        self.max_inflight = self.max_workers * 2
+        self.on_done = on_done  # on_done(key, PIL.Image or None)
+        self.disk_cache = disk_cache  # ThumbnailCache (None ならディスクに保存しない)
+
+        self._executor = None
+        self._lock = threading.Lock()
+        self._queue = []            # (priority, seq, key)
+        self._pending = {}          # key -> (priority, args)
+        self._inflight = set()
+        self._counter = itertools.count()
+
+    def _get_executor(self):
+        if self._executor is None:
+            # fork だと、他のスレッドが握っていたロック (shared_pool.lock など) を子が引き継いで固まりうる
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers,
+                                                 mp_context=multiprocessing.get_context('spawn'))
+        return self._executor
+
+    def request(self, key, file_path, page_index, rotation, box_w, box_h, priority=0, cacheable=True):
+        """描画を依頼する。同じキーが処理中/待機中なら優先度だけ更新する"""
+        cache_path = self.disk_cache.disk_path(key) if (self.disk_cache and cacheable) else None
+        with self._lock:
+            if key in self._inflight: return
+            self._pending[key] = (priority, (cache_path, file_path, page_index, rotation, box_w, box_h))
+            heapq.heappush(self._queue, (priority, next(self._counter), key))
+        self._pump()
+
+    def cancel_pending(self):
+        """未着手の依頼を全て破棄する (処理中のものは完了まで待つ)"""
+        with self._lock:
+            self._queue = []
+            self._pending.clear()
+
+    def _pump(self):
+        with self._lock:
+            while self._queue and len(self._inflight) < self.max_inflight:
+                priority, _, key = heapq.heappop(self._queue)
+                entry = self._pending.get(key)
+                # 優先度を付け直した古いエントリは読み飛ばす
+                if entry is None or entry[0] != priority: continue
+                del self._pending[key]
+                self._inflight.add(key)
+                future = self._get_executor().submit(_render_job, *entry[1], tracing.is_enabled())
+                future.add_done_callback(lambda f, k=key: self._finished(k, f))
+
+    def _finished(self, key, future):
+        img = None
+        try:
+            data = future.result()
+            if data:
+                mode, size, raw, written, events = data
+                img = Image.frombytes(mode, size, raw)
+                if written and self.disk_cache:
+                    self.disk_cache.record_write(written)
+                tracing.absorb(events)
+        except Exception as e:
+            tracing.report_error('thumbnail', e)
+        with self._lock:
+            self._inflight.discard(key)
+        if self.on_done:
+            self.on_done(key, img)
+        self._pump()
+
+    def shutdown(self):
+        self.cancel_pending()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
@@ -0,0 +1,203 @@
+"""
+処理時間の計測 (トレース)
+
+変換・解析・結合・サムネイル・プレビューの各処理を「スパン」として記録し、
+JSON Lines または Chrome のトレース形式 (chrome://tracing / Perfetto で開ける) で書き出す。
+
+    with tracing.span('merge', backend='fitz', pages=120) as s:
+        ...
+        s.set(output_bytes=size)
+
+無効なとき (既定) の span() は何も記録しない共有オブジェクトを返すだけなので、
+処理の流れにはほぼ影響しない。有効にする方法:
+    ・環境変数 SECURE_PDF_TRACE=出力先 (.jsonl なら JSON Lines、それ以外は Chrome 形式)。
+      プロセス終了時に書き出す
+    ・cli.py --trace 出力先
+    ・enable() / export() を直接呼ぶ
+
+attrs に path を渡すと、記録するときにファイルサイズ (bytes) を添える。
+ワーカープロセス (取り込み・サムネイル) で記録したものは drain() で取り出して結果と一緒に返し、
+親プロセスで absorb() する。時刻は perf_counter の値をそのまま持つので、同じマシン上の
+プロセス間で並べられる。
+"""
+import os
+import sys
+import json
+import time
+import atexit
+import threading
+import multiprocessing
+from collections import deque
+
+TRACE_ENV = "SECURE_PDF_TRACE"
+MAX_SPANS = 100000  # 長時間動かしても古いものから捨てて上限を保つ
+
+_tracer = None
+_local = threading.local()
+
+
+class Tracer:
+    def __init__(self, max_spans=MAX_SPANS):
+        self.origin_ns = time.perf_counter_ns()
+        self.started_at = time.time()
+        self.events = deque(maxlen=max_spans)
+
+    def record(self, name, start_ns, duration_ns, attrs):
+        """duration_ns=None は時間を持たないイベント"""
+        self.events.append({
+            'name': name,
+            'start_ns': start_ns,
+            'duration_ns': duration_ns,
+            'pid': os.getpid(),
+            'thread': threading.current_thread().name,
+            'tid': threading.get_ident(),
+            'attrs': attrs,
+        })
+
+    def export(self, path, fmt=None):
+        """fmt: 'jsonl' / 'chrome' (省略時は拡張子で決める)"""
+        fmt = fmt or ('jsonl' if path.lower().endswith('.jsonl') else 'chrome')
+        events = list(self.events)
+        with open(path, 'w', encoding='utf-8') as f:
+            if fmt == 'jsonl':
+                for event in events:
+                    duration = event['duration_ns']
+                    row = {'name': event['name'], 'start_ms': (event['start_ns'] - self.origin_ns) / 1e6,
+                           'duration_ms': None if duration is None else duration / 1e6,
+                           'pid': event['pid'], 'thread': event['thread'], **event['attrs']}
+                    f.write(json.dumps(row, ensure_ascii=False, default=str) + "\n")
+            elif fmt == 'chrome':
+                json.dump(self._chrome_events(events), f, ensure_ascii=False, default=str)
+            else:
+                raise ValueError(f"不明なトレース形式です: {fmt}")
+
+    def _chrome_events(self, events):
+        trace = []
+        for event in events:
+            entry = {'name': event['name'], 'cat': event['name'].split('.')[0],
+                     'ts': (event['start_ns'] - self.origin_ns) / 1000,
+                     'pid': event['pid'], 'tid': event['tid'], 'args': event['attrs']}
+            if event['duration_ns'] is None:
+                entry.update(ph='i', s='t')  # 時間を持たないイベント (エラーなど)
+            else:
+                entry.update(ph='X', dur=event['duration_ns'] / 1000)
+            trace.append(entry)
+        return {'traceEvents': trace, 'displayTimeUnit': 'ms',
+                'otherData': {'started_at': self.started_at}}
+
+
+class _Span:
+    __slots__ = ('_tracer', 'name', 'attrs', '_start')
+
+    def __init__(self, tracer, name, attrs):
+        self._tracer = tracer
+        self.name = name
+        self.attrs = attrs
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        path = self.attrs.get('path')
+        if path and 'bytes' not in self.attrs:
+            try: self.attrs['bytes'] = os.path.getsize(path)
+            except (OSError, TypeError): pass
+        stack = getattr(_local, 'stack', None)
+        if stack is None: stack = _local.stack = []
+        stack.append(self)
+        self._start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter_ns() - self._start
+        _local.stack.pop()
+        if exc is not None and 'error' not in self.attrs:
+            self.attrs['error'] = f"{exc_type.__name__}: {exc}"
+        self._tracer.record(self.name, self._start, duration, self.attrs)
+        return False
+
+
+class _NullSpan:
+    """無効時の span()。何も記録しない"""
+    __slots__ = ()
+
+    def set(self, **attrs): pass
+    def __enter__(self): return self
+    def __exit__(self, exc_type, exc, tb): return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def span(name, **attrs):
+    if _tracer is None: return _NULL_SPAN
+    return _Span(_tracer, name, attrs)
+
+
+def is_enabled():
+    return _tracer is not None
+
+
+def enable(max_spans=MAX_SPANS):
+    """記録を始める (有効ならそのまま)。Tracer を返す"""
+    global _tracer
+    if _tracer is None:
+        _tracer = Tracer(max_spans)
+    return _tracer
+
+
+def disable():
+    """記録をやめ、それまでの Tracer を返す"""
+    global _tracer
+    tracer, _tracer = _tracer, None
+    return tracer
+
+
+def export(path, fmt=None):
+    """記録したスパンを書き出す。無効なら False"""
+    if _tracer is None: return False
+    _tracer.export(path, fmt)
+    return True
+
+
+def drain():
+    """記録済みのイベントを取り出して消す (ワーカープロセスから親へ送る用)"""
+    if _tracer is None: return []
+    events = list(_tracer.events)
+    _tracer.events.clear()
+    return events
+
+
+def absorb(events):
+    """ワーカープロセスで記録したイベントを取り込む"""
+    if _tracer is None or not events: return
+    _tracer.events.extend(events)
+
+
+def report_error(stage, exc, **attrs):
+    """
+    処理の失敗を標準エラーに出す。記録中なら、実行中のスパンにエラーを添え、
+    時間を持たないイベント (stage.error) としても残す。
+    """
+    message = f"{type(exc).__name__}: {exc}"
+    print(f"[{stage}] {message}", file=sys.stderr)
+    tracer = _tracer
+    if tracer is None: return
+    stack = getattr(_local, 'stack', None)
+    if stack: stack[-1].attrs.setdefault('error', message)
+    tracer.record(f"{stage}.error", time.perf_counter_ns(), None, dict(attrs, error=message))
+
+
+def _enable_from_environment():
+    path = os.environ.get(TRACE_ENV)
+    # ワーカープロセスは親の環境変数を引き継ぐが、書き出しは親プロセスだけが行う
+    if not path or multiprocessing.parent_process() is not None: return
+    enable()
+
+    def write_trace():
+        try: export(path)
+        except OSError as e: print(f"[trace] {e}", file=sys.stderr)
+    atexit.register(write_trace)
+
+
+_enable_from_environment()